@@ -1,13 +1,19 @@
 """ADK-style agent that orchestrates retrieval and grounded generation."""
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, NamedTuple, Optional
 
 import vertexai
 from vertexai.generative_models import GenerativeModel, Part
 
 import config
-from services import embedding, storage, vector_search
+from agents.context_packer import pack_contexts
+from services import answer_cache, async_storage, chat_history, embedding, vector_search
 
 
 def _init_vertex() -> None:
@@ -19,8 +25,13 @@ def build_prompt(question: str, contexts: List[Dict[str, str]], history: List[st
     if contexts:
         context_parts = []
         for chunk in contexts:
-            # The chunk dict from Firestore contains 'paper_id' and 'text'
-            context_parts.append(f"--- CONTEXT from paper {chunk.get('paper_id', 'unknown')} ---\n{chunk.get('text', '')}")
+            # The chunk dict from Firestore contains 'paper_id', 'text' and, for
+            # newer ingestions, the 'page_start'/'page_end' it spans
+            source = f"paper {chunk.get('paper_id', 'unknown')}"
+            first, last = chunk.get("page_start"), chunk.get("page_end")
+            if first:
+                source += f", page {first}" if not last or last == first else f", pages {first}-{last}"
+            context_parts.append(f"--- CONTEXT from {source} ---\n{chunk.get('text', '')}")
         context_block = "\n\n".join(context_parts)
     else:
         context_block = "No context retrieved."
@@ -49,6 +60,69 @@ Respond concisely for a technical reader. If the answer is not in the context, s
 """
 
 
+class StageTimings:
+    """Wall-clock milliseconds spent in each stage of one answer."""
+
+    def __init__(self) -> None:
+        self._started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        yield
+        # Stages that fail or are cancelled are left out.
+        self.stages[name] = (time.perf_counter() - started) * 1000
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def server_timing(self) -> str:
+        """``Server-Timing`` header value, stages first, then the total."""
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        entries.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(entries)
+
+
+class _StageTotals:
+    """Running per-stage averages across answers, for ``/metrics``."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, timings: StageTimings) -> None:
+        stages = dict(timings.stages, total=timings.total_ms())
+        with self._lock:
+            for name, ms in stages.items():
+                totals = self._totals.setdefault(name, {"calls": 0, "ms": 0.0})
+                totals["calls"] += 1
+                totals["ms"] += ms
+        logging.info(f"Answer timings: {timings.server_timing()}")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {"calls": totals["calls"], "avg_ms": totals["ms"] / totals["calls"]}
+                for name, totals in self._totals.items()
+            }
+
+
+_stage_totals = _StageTotals()
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    return _stage_totals.stats()
+
+
+class _Prepared(NamedTuple):
+    prompt: Optional[str]  # None when the answer came from the cache
+    cached: Optional[str]
+    vector: list[float]
+    cacheable: bool
+    retrieved_at: float  # monotonic clock, for answer cache invalidation
+
+
 class PaperRAGAgent:
     """Minimal agent orchestrated in code to align with Google ADK patterns."""
 
@@ -56,30 +130,163 @@ class PaperRAGAgent:
         _init_vertex()
         self.model = GenerativeModel(config.GENERATION_MODEL)
 
-    def _search(self, question: str, paper_ids: list[str], top_k: int) -> List[Dict[str, str]]:
-        """Search across multiple paper IDs and return chunk metadata."""
-        query_embedding = embedding.embed_texts([question])[0]
-        results = vector_search.query(
-            query_vector=query_embedding,
-            paper_ids=paper_ids,
-            top_k=top_k,
-        )
+    async def _retrieve(
+        self,
+        query_embedding: list[float],
+        paper_ids: list[str],
+        top_k: int,
+        timings: StageTimings,
+    ) -> List[Dict[str, str]]:
+        with timings.stage("search"):
+            results = await asyncio.to_thread(
+                vector_search.query, query_vector=query_embedding, paper_ids=paper_ids, top_k=top_k
+            )
         chunk_ids = [r["id"] for r in results if r.get("id")]
-        chunk_map = storage.fetch_chunks(chunk_ids)
-        # Return the full chunk dictionary, which includes the source paper_id
+        with timings.stage("chunks"):
+            chunk_map = await async_storage.fetch_chunks(chunk_ids)
         return [chunk_map[cid] for cid in chunk_ids if cid in chunk_map]
 
-    def answer_question(
-        self, *, paper_ids: list[str], session_id: Optional[str], question: str, top_k: int
+    async def _load_history(self, session_id: Optional[str], timings: StageTimings) -> List[str]:
+        with timings.stage("history"):
+            return await chat_history.load(session_id)
+
+    async def _prepare(
+        self,
+        *,
+        paper_ids: list[str],
+        session_id: Optional[str],
+        question: str,
+        top_k: int,
+        timings: StageTimings,
+    ) -> _Prepared:
+        """Embed, check the answer cache and retrieve context while history loads."""
+        history_task = asyncio.create_task(self._load_history(session_id, timings))
+        try:
+            retrieved_at = time.monotonic()
+            with timings.stage("embed"):
+                vector = (await asyncio.to_thread(embedding.embed_texts, [question]))[0]
+
+            cacheable = config.ANSWER_CACHE_ENABLED
+            if cacheable and answer_cache.refers_back(question):
+                # A follow-up only asks the same thing as elsewhere in a fresh session.
+                cacheable = not await history_task
+                if not cacheable:
+                    answer_cache.get_cache().record_bypass()
+            if cacheable:
+                with timings.stage("cache"):
+                    hit = answer_cache.get_cache().lookup(paper_ids, top_k, vector)
+                if hit is not None:
+                    return _Prepared(None, hit.answer, vector, False, retrieved_at)
+
+            contexts = await self._retrieve(vector, paper_ids, top_k, timings)
+            contexts = pack_contexts(contexts, config.CONTEXT_TOKEN_BUDGET)
+            prompt = build_prompt(question, contexts, await history_task)
+            return _Prepared(prompt, None, vector, cacheable, retrieved_at)
+        finally:
+            history_task.cancel()
+
+    async def _finish(
+        self,
+        prepared: _Prepared,
+        paper_ids: list[str],
+        top_k: int,
+        session_id: Optional[str],
+        question: str,
+        text: str,
+        timings: StageTimings,
+    ) -> None:
+        if prepared.cacheable:
+            answer_cache.get_cache().store(
+                paper_ids,
+                top_k,
+                prepared.vector,
+                text,
+                timings.stages.get("generate", 0.0),
+                retrieved_at=prepared.retrieved_at,
+            )
+        # Only queued here; with write-behind off this is a direct Firestore write.
+        await chat_history.append(session_id, [("user", question), ("ai", text)])
+        _stage_totals.record(timings)
+
+    async def answer_question_async(
+        self,
+        *,
+        paper_ids: list[str],
+        session_id: Optional[str],
+        question: str,
+        top_k: int,
+        timings: Optional[StageTimings] = None,
     ) -> str:
-        history = storage.load_chat_history(session_id)
-        contexts = self._search(question, paper_ids, top_k)
-        prompt = build_prompt(question, contexts, history)
+        """Answer ``question`` from the papers' chunks, loading history while retrieval runs.
 
-        response = self.model.generate_content([Part.from_text(prompt)])
-        text = response.text if hasattr(response, "text") else str(response)
+        Cancelling the call cancels generation and the history read; work
+        already handed to a thread (embedding, vector search) runs to
+        completion but its result is dropped, and nothing is written to history.
+        """
+        timings = timings or StageTimings()
+        prepared = await self._prepare(
+            paper_ids=paper_ids,
+            session_id=session_id,
+            question=question,
+            top_k=top_k,
+            timings=timings,
+        )
+        if prepared.cached is not None:
+            text = prepared.cached
+        else:
+            with timings.stage("generate"):
+                response = await self.model.generate_content_async(
+                    [Part.from_text(prepared.prompt)]
+                )
+            text = response.text if hasattr(response, "text") else str(response)
 
-        if session_id:
-            storage.save_chat_history(session_id, "user", question)
-            storage.save_chat_history(session_id, "ai", text)
+        await self._finish(prepared, paper_ids, top_k, session_id, question, text, timings)
         return text
+
+    async def stream_answer(
+        self,
+        *,
+        paper_ids: list[str],
+        session_id: Optional[str],
+        question: str,
+        top_k: int,
+        timings: Optional[StageTimings] = None,
+    ) -> AsyncIterator[str]:
+        """Yield the answer as Gemini generates it; history is saved once it is complete.
+
+        ``timings`` gains a ``ttft`` entry: time from the start of the request
+        to the first piece of text. A cached answer is yielded in one piece.
+        """
+        timings = timings or StageTimings()
+        prepared = await self._prepare(
+            paper_ids=paper_ids,
+            session_id=session_id,
+            question=question,
+            top_k=top_k,
+            timings=timings,
+        )
+        if prepared.cached is not None:
+            timings.stages["ttft"] = timings.total_ms()
+            yield prepared.cached
+            text = prepared.cached
+        else:
+            pieces: List[str] = []
+            with timings.stage("generate"):
+                responses = await self.model.generate_content_async(
+                    [Part.from_text(prepared.prompt)], stream=True
+                )
+                async for response in responses:
+                    try:
+                        piece = response.text
+                    except (AttributeError, ValueError):
+                        # Chunks without text, e.g. the final one carrying only the finish reason.
+                        continue
+                    if not piece:
+                        continue
+                    if not pieces:
+                        timings.stages["ttft"] = timings.total_ms()
+                    pieces.append(piece)
+                    yield piece
+            text = "".join(pieces)
+
+        await self._finish(prepared, paper_ids, top_k, session_id, question, text, timings)
@@ -0,0 +1,124 @@
+"""Packs retrieved chunks into the prompt's context under a token budget.
+
+Neighbouring chunks of a paper overlap (200 characters with the fixed
+chunker, a sentence or two with the structured one), so several hits from
+one passage repeat text. Chunks are taken in relevance order while their
+new text fits ``CONTEXT_TOKEN_BUDGET``; then consecutive chunks of a paper
+are merged into one passage with the repeated span dropped. Passages are
+returned most relevant first, in the shape ``build_prompt`` expects.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Same ~4 characters per token estimate as the embedding batcher, uncapped.
+_CHARS_PER_TOKEN = 4
+# Shorter suffix/prefix matches are coincidence, not chunk overlap.
+_MIN_OVERLAP_CHARS = 16
+_MAX_OVERLAP_CHARS = 4000
+
+_totals = {"queries": 0, "chunks": 0, "passages": 0, "tokens_retrieved": 0, "tokens_packed": 0}
+_totals_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+def overlap(before: str, after: str) -> int:
+    """Length of the longest suffix of ``before`` that is a prefix of ``after``."""
+    longest = min(len(before), len(after), _MAX_OVERLAP_CHARS)
+    for size in range(longest, _MIN_OVERLAP_CHARS - 1, -1):
+        if before.endswith(after[:size]):
+            return size
+    return 0
+
+
+def _merge(texts: List[str]) -> str:
+    merged = texts[0]
+    for previous, text in zip(texts, texts[1:]):
+        size = overlap(previous, text)
+        merged += text[size:] if size else "\n" + text
+    return merged
+
+
+def _position(chunk: Dict) -> Optional[Tuple[str, int]]:
+    index = chunk.get("chunk_index")
+    if chunk.get("paper_id") is None or not isinstance(index, int):
+        return None
+    return chunk["paper_id"], index
+
+
+def pack_contexts(chunks: List[Dict], budget_tokens: int) -> List[Dict]:
+    """Merge and budget ``chunks`` (most relevant first); ``budget_tokens <= 0`` means no limit."""
+    selected: Dict[Tuple[str, int], Dict] = {}
+    rank: Dict[Tuple[str, int], int] = {}
+    loose: List[Tuple[int, Dict]] = []  # chunks without a position cannot be merged
+    used = 0
+    for order, chunk in enumerate(chunks):
+        text = chunk.get("text", "")
+        position = _position(chunk)
+        if position in selected:
+            continue
+        paper_id, index = position if position else (None, None)
+        previous = selected.get((paper_id, index - 1)) if position else None
+        following = selected.get((paper_id, index + 1)) if position else None
+        new_chars = len(text)
+        if previous:
+            new_chars -= overlap(previous["text"], text)
+        if following:
+            new_chars -= overlap(text, following["text"])
+        cost = max(1, new_chars // _CHARS_PER_TOKEN)
+        if budget_tokens > 0 and used + cost > budget_tokens:
+            if used:
+                continue
+            # Even the best chunk is over budget: keep what fits of it.
+            chunk = dict(chunk, text=text[: budget_tokens * _CHARS_PER_TOKEN])
+            cost = budget_tokens
+        used += cost
+        if position:
+            selected[position] = chunk
+            rank[position] = order
+        else:
+            loose.append((order, chunk))
+
+    passages: List[Tuple[int, Dict]] = list(loose)
+    for paper_id in dict.fromkeys(position[0] for position in selected):
+        indexes = sorted(index for p, index in selected if p == paper_id)
+        runs: List[List[int]] = []
+        for index in indexes:
+            if runs and index == runs[-1][-1] + 1:
+                runs[-1].append(index)
+            else:
+                runs.append([index])
+        for run in runs:
+            members = [selected[(paper_id, index)] for index in run]
+            passage = {
+                "paper_id": paper_id,
+                "chunk_index": run[0],
+                "text": _merge([m.get("text", "") for m in members]),
+            }
+            starts = [m["page_start"] for m in members if m.get("page_start")]
+            ends = [m["page_end"] for m in members if m.get("page_end")]
+            if starts and ends:
+                passage["page_start"], passage["page_end"] = min(starts), max(ends)
+            passages.append((min(rank[(paper_id, index)] for index in run), passage))
+    passages.sort(key=lambda item: item[0])
+    packed = [passage for _, passage in passages]
+
+    with _totals_lock:
+        _totals["queries"] += 1
+        _totals["chunks"] += len(chunks)
+        _totals["passages"] += len(packed)
+        _totals["tokens_retrieved"] += sum(estimate_tokens(c.get("text", "")) for c in chunks)
+        _totals["tokens_packed"] += sum(estimate_tokens(p["text"]) for p in packed)
+    return packed
+
+
+def stats() -> Dict[str, float]:
+    with _totals_lock:
+        totals: Dict[str, float] = dict(_totals)
+    queries = totals["queries"]
+    totals["avg_tokens_packed"] = totals["tokens_packed"] / queries if queries else 0.0
+    return totals
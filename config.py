@@ -10,13 +10,118 @@ GCS_BUCKET: Optional[str] = os.getenv("GCS_BUCKET")
 VERTEX_INDEX_ID: Optional[str] = os.getenv("VERTEX_INDEX_ID")
 VERTEX_INDEX_ENDPOINT_ID: Optional[str] = os.getenv("VERTEX_INDEX_ENDPOINT_ID")
 VERTEX_DEPLOYED_INDEX_ID: Optional[str] = os.getenv("VERTEX_DEPLOYED_INDEX_ID")
+# "vertex" (Vertex AI Vector Search) or "local" (memory-mapped NumPy store)
+VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "vertex").lower()
+LOCAL_VECTOR_DIR: str = os.getenv("LOCAL_VECTOR_DIR", ".vector_store")
+# ANN for the local backend: "ivf" or "none" (exact search only)
+LOCAL_VECTOR_ANN: str = os.getenv("LOCAL_VECTOR_ANN", "ivf").lower()
+IVF_NLIST: int = int(os.getenv("IVF_NLIST", "0"))  # 0 = 4 * sqrt(rows) at training time
+IVF_NPROBE: int = int(os.getenv("IVF_NPROBE", "8"))
+IVF_TRAIN_MIN: int = int(os.getenv("IVF_TRAIN_MIN", "10000"))
+ANN_EXACT_MAX_ROWS: int = int(os.getenv("ANN_EXACT_MAX_ROWS", "20000"))
 PAPERREC_SEARCH_URL: Optional[str] = os.getenv("PAPERREC_SEARCH_URL")
 DEFAULT_TOP_K: int = int(os.getenv("DEFAULT_TOP_K", "5"))
 
+# Embedding micro-batching across concurrent callers (limits are per API request)
+EMBEDDING_BATCHING: bool = os.getenv("EMBEDDING_BATCHING", "true").lower() == "true"
+EMBEDDING_MAX_BATCH_SIZE: int = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "250"))
+EMBEDDING_MAX_BATCH_TOKENS: int = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "20000"))
+EMBEDDING_FLUSH_MS: float = float(os.getenv("EMBEDDING_FLUSH_MS", "10"))
+EMBEDDING_MAX_INFLIGHT: int = int(os.getenv("EMBEDDING_MAX_INFLIGHT", "4"))
+
+# Embedding cache: in-memory LRU plus an optional SQLite file (empty path disables it)
+EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_BYTES: int = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+EMBEDDING_CACHE_PATH: Optional[str] = os.getenv("EMBEDDING_CACHE_PATH")
+
+# Ingestion pipeline: workers per stage and the queue depth between stages
+DOWNLOAD_CONCURRENCY: int = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+EXTRACT_CONCURRENCY: int = int(os.getenv("EXTRACT_CONCURRENCY", "2"))
+INDEX_CONCURRENCY: int = int(os.getenv("INDEX_CONCURRENCY", "4"))
+PERSIST_CONCURRENCY: int = int(os.getenv("PERSIST_CONCURRENCY", "4"))
+PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+# PDF text extraction process pool (-1 = one process per CPU, 0 = in-process)
+EXTRACT_PROCESSES: int = int(os.getenv("EXTRACT_PROCESSES", "-1"))
+EXTRACT_MIN_PAGES_PER_TASK: int = int(os.getenv("EXTRACT_MIN_PAGES_PER_TASK", "8"))
+
+# Chunking: "fixed" 1000-character windows or "structured" sentence/section-aware chunks
+CHUNKER: str = os.getenv("CHUNKER", "fixed").lower()
+CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", "320"))
+CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Chunk storage: "documents" (one Firestore document per chunk) or "packed" (compressed ranges)
+CHUNK_LAYOUT: str = os.getenv("CHUNK_LAYOUT", "documents").lower()
+# Per-chunk document writes (documents layout): papers writing at once, per-writer rate cap, per-write attempts
+CHUNK_WRITE_CONCURRENCY: int = int(os.getenv("CHUNK_WRITE_CONCURRENCY", "8"))
+CHUNK_WRITE_MAX_OPS_PER_SECOND: int = int(os.getenv("CHUNK_WRITE_MAX_OPS_PER_SECOND", "2000"))
+CHUNK_WRITE_RETRY_ATTEMPTS: int = int(os.getenv("CHUNK_WRITE_RETRY_ATTEMPTS", "5"))
+
+# Process-local cache of chunk records read by /query
+CHUNK_CACHE_ENABLED: bool = os.getenv("CHUNK_CACHE_ENABLED", "true").lower() == "true"
+CHUNK_CACHE_MAX_BYTES: int = int(os.getenv("CHUNK_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CHUNK_CACHE_TTL_SECONDS: float = float(os.getenv("CHUNK_CACHE_TTL_SECONDS", "600"))
+
+# /query: how often a running answer checks whether the client has disconnected
+QUERY_DISCONNECT_POLL_SECONDS: float = float(os.getenv("QUERY_DISCONNECT_POLL_SECONDS", "0.25"))
+
+# Prompt context: token budget for retrieved chunks after merging overlapping neighbours (0 = no limit)
+CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+
+# Semantic /query answer cache: per paper set and top_k, matched by question embedding similarity;
+# invalidation on re-ingestion is per instance, so the TTL bounds staleness elsewhere
+ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "300"))
+ANSWER_CACHE_MAX_BYTES: int = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+ANSWER_CACHE_PER_SET: int = int(os.getenv("ANSWER_CACHE_PER_SET", "64"))
+
+# Chat history: newest messages kept per session, written to Firestore in the background
+CHAT_HISTORY_TAIL: int = int(os.getenv("CHAT_HISTORY_TAIL", "10"))
+CHAT_HISTORY_WRITE_BEHIND: bool = os.getenv("CHAT_HISTORY_WRITE_BEHIND", "true").lower() == "true"
+CHAT_HISTORY_MAX_SESSIONS: int = int(os.getenv("CHAT_HISTORY_MAX_SESSIONS", "10000"))
+CHAT_HISTORY_IDLE_SECONDS: float = float(os.getenv("CHAT_HISTORY_IDLE_SECONDS", "300"))
+CHAT_HISTORY_FLUSH_SECONDS: float = float(os.getenv("CHAT_HISTORY_FLUSH_SECONDS", "0.5"))
+CHAT_HISTORY_FLUSH_BATCH: int = int(os.getenv("CHAT_HISTORY_FLUSH_BATCH", "200"))
+# Compaction: keep the newest messages verbatim and fold older ones into a running summary
+CHAT_HISTORY_SUMMARY: bool = os.getenv("CHAT_HISTORY_SUMMARY", "false").lower() == "true"
+CHAT_HISTORY_VERBATIM: int = int(os.getenv("CHAT_HISTORY_VERBATIM", "4"))
+CHAT_HISTORY_SUMMARY_TRIGGER_TOKENS: int = int(os.getenv("CHAT_HISTORY_SUMMARY_TRIGGER_TOKENS", "1500"))
+CHAT_HISTORY_SUMMARY_MAX_TOKENS: int = int(os.getenv("CHAT_HISTORY_SUMMARY_MAX_TOKENS", "400"))
+
+# Near-duplicate chunk removal within a paper before embedding (MinHash)
+DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD: float = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+
+# Streaming ingestion: chunk pages as they are extracted and index/persist in batches
+INGEST_STREAMING: bool = os.getenv("INGEST_STREAMING", "false").lower() == "true"
+INGEST_STREAM_BATCH: int = int(os.getenv("INGEST_STREAM_BATCH", "64"))
+
+# Per-paper embed+upsert batches: concurrency and retry with jittered backoff
+INGEST_MAX_INFLIGHT_BATCHES: int = int(os.getenv("INGEST_MAX_INFLIGHT_BATCHES", "4"))
+INGEST_RETRY_ATTEMPTS: int = int(os.getenv("INGEST_RETRY_ATTEMPTS", "4"))
+INGEST_RETRY_BASE_SECONDS: float = float(os.getenv("INGEST_RETRY_BASE_SECONDS", "0.5"))
+INGEST_RETRY_MAX_SECONDS: float = float(os.getenv("INGEST_RETRY_MAX_SECONDS", "8"))
+
+# Shared outbound HTTP client (paperrec-search lookups and PDF downloads)
+HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "60"))
+HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+SEARCH_TIMEOUT_SECONDS: float = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "15"))
+HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_PER_HOST_CONCURRENCY: int = int(os.getenv("HTTP_PER_HOST_CONCURRENCY", "10"))
+
 # Firestore collection names
 SESSIONS_COLLECTION = os.getenv("SESSIONS_COLLECTION", "sessions")
 SUMMARIES_COLLECTION = os.getenv("SUMMARIES_COLLECTION", "summaries")
 CHUNKS_COLLECTION = os.getenv("CHUNKS_COLLECTION", "paper_chunks")
+MANIFESTS_COLLECTION = os.getenv("MANIFESTS_COLLECTION", "ingestion_manifests")
+CHUNK_PACKS_COLLECTION = os.getenv("CHUNK_PACKS_COLLECTION", "paper_chunk_packs")
+CHUNK_DIRECTORY_COLLECTION = os.getenv("CHUNK_DIRECTORY_COLLECTION", "paper_chunk_directory")
+INGEST_LEASES_COLLECTION = os.getenv("INGEST_LEASES_COLLECTION", "ingest_leases")
+
+# Cross-instance coalescing of concurrent ingestions of the same paper
+INGEST_LEASE_ENABLED: bool = os.getenv("INGEST_LEASE_ENABLED", "false").lower() == "true"
+INGEST_LEASE_TTL_SECONDS: int = int(os.getenv("INGEST_LEASE_TTL_SECONDS", "600"))
+INGEST_LEASE_POLL_SECONDS: float = float(os.getenv("INGEST_LEASE_POLL_SECONDS", "5"))
 
 
 class SettingsError(Exception):
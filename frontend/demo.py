@@ -61,6 +61,23 @@ def login_screen():
             except Exception as e:
                 st.error(f"Error: {e}")
 
+# --- STREAMING Q&A ---
+def stream_answer(payload):
+    """Yields answer text from the /query/stream server-sent events as it arrives."""
+    with requests.post(f"{API_URL}/query/stream", json=payload, stream=True) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"Failed to get response. Status: {resp.status_code}, Body: {resp.text}")
+        event = None
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "token":
+                    yield data["text"]
+                elif event == "error":
+                    raise RuntimeError(data["detail"])
+
 # --- STUDENT UI ---
 def student_view():
     st.sidebar.title(f"👤 {st.session_state.user['username']}")
@@ -138,15 +155,13 @@ def student_view():
                     "session_id": st.session_state.session_id,
                     "question": prompt
                 }
-                resp = requests.post(f"{API_URL}/query", json=payload)
-                if resp.status_code == 200:
-                    answer = resp.json()["response"]
-                    placeholder.markdown(answer)
-                    st.session_state.messages.append({"role": "assistant", "content": answer})
-                else:
-                    error_message = f"Failed to get response. Status: {resp.status_code}, Body: {resp.text}"
-                    placeholder.error(error_message)
-                    st.session_state.messages.append({"role": "assistant", "content": error_message})
+                # Render tokens as the server streams them.
+                answer = ""
+                for piece in stream_answer(payload):
+                    answer += piece
+                    placeholder.markdown(answer + "▌")
+                placeholder.markdown(answer)
+                st.session_state.messages.append({"role": "assistant", "content": answer})
             except Exception as e:
                 error_message = f"An exception occurred: {e}"
                 placeholder.error(error_message)
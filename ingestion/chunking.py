@@ -0,0 +1,306 @@
+"""Chunkers that turn extracted paper text into embeddable chunks.
+
+Both chunkers consume the page-delimited text built by the pipeline (each
+page starts with a ``--- PAGE n ---`` line) as an iterable of pieces, so the
+same code serves whole-document and streaming ingestion, and both report the
+pages every chunk spans.
+
+``fixed`` cuts 1000-character windows with a 200-character overlap.
+``structured`` packs whole sentences up to a token budget, closes chunks at
+section headings and, once the chunk is mostly full, at paragraph breaks;
+only chunks cut inside running text carry a short sentence overlap.
+"""
+from __future__ import annotations
+
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import config
+from services.embedding import estimate_tokens
+
+PAGE_MARKER = re.compile(r"\n--- PAGE (\d+) ---\n")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+_NUMBERED_HEADING = re.compile(r"^(?:\d{1,2}(?:\.\d{1,2})*\.?|[IVX]{1,5}\.)\s+[A-Z][A-Za-z0-9 ,:&()/\-]{1,70}$")
+_NAMED_HEADING = re.compile(
+    r"^(?:\d{1,2}\.?\s+)?(?:abstract|introduction|related work|background|preliminaries|"
+    r"methods?|methodology|approach|experiments?|experimental setup|evaluation|results|"
+    r"discussion|limitations|conclusions?|future work|acknowledge?ments?|appendix)"
+    r"(?:\s+[a-z ]{1,30})?:?$",
+    re.IGNORECASE,
+)
+_ABBREVIATIONS = {"al", "cf", "e.g", "eq", "eqs", "etc", "fig", "figs", "i.e", "no", "ref", "sec", "tab", "vs"}
+# A paragraph break closes the chunk once it is at least this full.
+_PARAGRAPH_FILL = 0.75
+
+
+class Chunk(NamedTuple):
+    text: str
+    page_start: int
+    page_end: int
+
+
+def page_header(page_number: int) -> str:
+    return f"\n--- PAGE {page_number} ---\n"
+
+
+def _window_pages(window: str, first_page: int) -> Tuple[int, int]:
+    last_page = first_page
+    for match in PAGE_MARKER.finditer(window):
+        last_page = int(match.group(1))
+    return first_page, last_page
+
+
+def fixed_chunks(
+    pieces: Iterable[str], chunk_size: int = 1000, overlap: int = 200
+) -> Iterator[Chunk]:
+    """Fixed-size character windows; text may arrive in pieces of any size."""
+    buffer = ""
+    page = 1
+    stride = chunk_size - overlap
+
+    def advance() -> None:
+        nonlocal buffer, page
+        # Markers starting in the dropped prefix move the window onto their page.
+        for match in PAGE_MARKER.finditer(buffer):
+            if match.start() >= stride:
+                break
+            page = int(match.group(1))
+        buffer = buffer[stride:]
+
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_size:
+            window = buffer[:chunk_size]
+            if window.strip():
+                yield Chunk(window.strip(), *_window_pages(window, page))
+            advance()
+    while buffer:
+        window = buffer[:chunk_size]
+        if window.strip():
+            yield Chunk(window.strip(), *_window_pages(window, page))
+        advance()
+
+
+def _is_heading(line: str) -> bool:
+    if len(line) > 80 or len(line.split()) > 10 or line.endswith((".", ",", ";")):
+        return False
+    return bool(_NUMBERED_HEADING.match(line) or _NAMED_HEADING.match(line))
+
+
+class _Paragraph:
+    """Running paragraph text with the page each part of it came from."""
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.pages: List[Tuple[int, int]] = []  # (offset, page) where a page starts
+
+    def add_line(self, line: str, page: int) -> None:
+        if not self.pages or self.pages[-1][1] != page:
+            self.pages.append((len(self.text), page))
+        if not self.text:
+            self.text = line
+        elif self.text.endswith("-") and self.text[-2:-1].isalpha() and line[:1].islower():
+            # Re-join a word hyphenated across a line break.
+            self.text = self.text[:-1] + line
+        else:
+            self.text += " " + line
+
+    def page_at(self, offset: int) -> int:
+        page = self.pages[0][1]
+        for start, number in self.pages:
+            if start > offset:
+                break
+            page = number
+        return page
+
+    def take_sentences(self, keep_tail: bool) -> List[Tuple[str, int, int]]:
+        """Split off finished sentences; with ``keep_tail`` the last one stays behind."""
+        if not self.text:
+            return []
+        ends = [
+            m.end() for m in _SENTENCE_END.finditer(self.text)
+            if self.text[self.text.rfind(" ", 0, m.start()) + 1:m.start()].rstrip(".").lower()
+            not in _ABBREVIATIONS
+        ]
+        bounds = [0] + ends + [len(self.text)]
+        if keep_tail:
+            bounds = bounds[:-1]
+        sentences = []
+        for start, end in zip(bounds, bounds[1:]):
+            sentence = self.text[start:end].strip()
+            if sentence:
+                sentences.append((sentence, self.page_at(start), self.page_at(end - 1)))
+        cut = bounds[-1]
+        if cut < len(self.text):
+            self.pages = [(0, self.page_at(cut))] + [
+                (start - cut, page) for start, page in self.pages if start > cut
+            ]
+        else:
+            self.pages = []
+        self.text = self.text[cut:]
+        return sentences
+
+
+class _Part(NamedTuple):
+    sep: str
+    text: str
+    first_page: int
+    last_page: int
+    tokens: int
+
+
+class _Packer:
+    """Greedy sentence packing under a token budget."""
+
+    def __init__(self, max_tokens: int, overlap_tokens: int) -> None:
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, overlap_tokens)
+        self.sep = ""
+        self._reset()
+
+    def _reset(self, parts: List[_Part] = ()) -> None:
+        self.parts = list(parts)
+        self.tokens = sum(part.tokens for part in self.parts)
+        self.has_body = False
+        # Overlap carried from the previous chunk is dropped at a new section.
+        self.carried = bool(self.parts)
+
+    def _emit(self, overlap: bool) -> Iterator[Chunk]:
+        if not self.has_body:
+            return
+        text = "".join(part.sep + part.text for part in self.parts).strip()
+        yield Chunk(
+            text, self.parts[0].first_page, max(part.last_page for part in self.parts)
+        )
+        carried: List[_Part] = []
+        budget = self.overlap_tokens if overlap else 0
+        for part in reversed(self.parts):
+            if part.tokens > budget:
+                break
+            carried.insert(0, part)
+            budget -= part.tokens
+        if carried:
+            carried[0] = carried[0]._replace(sep="")
+        self._reset(carried)
+
+    def _append(self, text: str, first: int, last: int, tokens: int) -> None:
+        self.parts.append(_Part(self.sep if self.parts else "", text, first, last, tokens))
+        self.tokens += tokens
+
+    def _split_words(self, text: str) -> Iterator[str]:
+        piece = ""
+        for word in text.split():
+            if piece and estimate_tokens(f"{piece} {word}") > self.max_tokens:
+                yield piece
+                piece = word
+            else:
+                piece = f"{piece} {word}" if piece else word
+        if piece:
+            yield piece
+
+    def sentence(self, text: str, first: int, last: int) -> Iterator[Chunk]:
+        tokens = estimate_tokens(text)
+        if tokens > self.max_tokens:
+            # Rare run-on "sentences" (tables, equations) are split by words.
+            for piece in self._split_words(text):
+                yield from self.sentence(piece, first, last)
+            return
+        if self.tokens + tokens > self.max_tokens:
+            yield from self._emit(overlap=True)
+            if self.tokens + tokens > self.max_tokens and self.carried:
+                self._reset()
+        self._append(text, first, last, tokens)
+        self.has_body = True
+        self.sep = " "
+
+    def heading(self, text: str, page: int) -> Iterator[Chunk]:
+        yield from self._emit(overlap=False)
+        if self.carried:
+            self._reset()
+        self.sep = "\n"
+        self._append(text, page, page, estimate_tokens(text))
+        self.sep = "\n"
+
+    def paragraph(self) -> Iterator[Chunk]:
+        if self.tokens >= self.max_tokens * _PARAGRAPH_FILL:
+            yield from self._emit(overlap=False)
+        self.sep = "\n"
+
+    def finish(self) -> Iterator[Chunk]:
+        yield from self._emit(overlap=False)
+
+
+def _iter_pages(pieces: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """Re-split page-delimited text into ``(page_number, page_text)``."""
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        matches = list(PAGE_MARKER.finditer(buffer))
+        if len(matches) < 2:
+            continue
+        # Everything before the last complete marker is whole pages.
+        yield from _split_pages(buffer[:matches[-1].start()])
+        buffer = buffer[matches[-1].start():]
+    yield from _split_pages(buffer)
+
+
+def _split_pages(text: str) -> Iterator[Tuple[int, str]]:
+    matches = list(PAGE_MARKER.finditer(text))
+    if not matches:
+        if text.strip():
+            yield 1, text
+        return
+    if text[:matches[0].start()].strip():
+        yield int(matches[0].group(1)), text[:matches[0].start()]
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(text)
+        yield int(match.group(1)), text[match.end():end]
+
+
+def structured_chunks(
+    pieces: Iterable[str],
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+) -> Iterator[Chunk]:
+    """Sentence-packed chunks that respect paragraph and section boundaries."""
+    packer = _Packer(
+        config.CHUNK_MAX_TOKENS if max_tokens is None else max_tokens,
+        config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens,
+    )
+    paragraph = _Paragraph()
+
+    def close_paragraph() -> Iterator[Chunk]:
+        for sentence in paragraph.take_sentences(keep_tail=False):
+            yield from packer.sentence(*sentence)
+
+    for page, text in _iter_pages(pieces):
+        for raw_line in text.split("\n"):
+            line = raw_line.strip()
+            if not line:
+                if paragraph.text:
+                    yield from close_paragraph()
+                    yield from packer.paragraph()
+                continue
+            # Headings follow a finished sentence, not a wrapped line.
+            if _is_heading(line) and (not paragraph.text or paragraph.text.endswith((".", ":", "?", "!"))):
+                yield from close_paragraph()
+                yield from packer.heading(line, page)
+                continue
+            paragraph.add_line(line, page)
+        # Sentences may run onto the next page, so the last one waits for it.
+        for sentence in paragraph.take_sentences(keep_tail=True):
+            yield from packer.sentence(*sentence)
+    yield from close_paragraph()
+    yield from packer.finish()
+
+
+def chunk_text(pieces: Iterable[str]) -> Iterator[Chunk]:
+    """Chunk page-delimited text with the chunker selected by ``CHUNKER``."""
+    if config.CHUNKER == "structured":
+        return structured_chunks(pieces)
+    if config.CHUNKER == "fixed":
+        return fixed_chunks(pieces)
+    raise config.SettingsError(
+        f"Unknown CHUNKER '{config.CHUNKER}' (expected 'fixed' or 'structured')."
+    )
@@ -0,0 +1,137 @@
+"""Near-duplicate chunk detection with MinHash signatures and LSH banding.
+
+Each chunk is reduced to a MinHash signature over word 5-shingles (lowercased,
+digits collapsed so arXiv stamps and page footers compare equal) and looked
+up through LSH bands. A chunk is dropped before embedding when it nearly
+duplicates an earlier chunk of the same paper, so which chunks survive, and
+the chunk IDs that follow, depend only on the paper and the dedup settings
+(which are part of the manifest's ``chunker_version``).
+
+Chunks are not compared with other papers: the corpus differs between
+instances and over time, and searches restricted to a paper must still find
+its text. Text repeated verbatim across papers (license footers, stamps) is
+not embedded again anyway, since the embedding cache is keyed by text.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+import config
+
+_SHINGLE_WORDS = 5
+_NUM_PERM = 64
+_BAND_ROWS = 4
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_WORD = re.compile(r"\w+")
+_DIGITS = re.compile(r"\d+")
+
+logger = logging.getLogger(__name__)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = _NUM_PERM, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        # a < 2**31 and x < 2**32 keep a * x + b inside uint64.
+        self._a = rng.integers(1, 1 << 31, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        words = _WORD.findall(_DIGITS.sub("0", text.lower()))
+        if not words:
+            return None
+        span = min(_SHINGLE_WORDS, len(words))
+        shingles = {" ".join(words[i:i + span]) for i in range(len(words) - span + 1)}
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        values = (self._a * hashes[np.newaxis, :] + self._b) % _PRIME
+        return values.min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class DedupIndex:
+    """In-memory LSH index of one paper's chunk signatures, keyed by chunk index."""
+
+    def __init__(self) -> None:
+        self._entries: Dict[int, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], Set[int]] = defaultdict(set)
+
+    @staticmethod
+    def _bands(signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band, start in enumerate(range(0, len(signature), _BAND_ROWS)):
+            yield band, signature[start:start + _BAND_ROWS].tobytes()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, chunk_index: int, signature: np.ndarray) -> None:
+        self._entries[chunk_index] = signature
+        for key in self._bands(signature):
+            self._buckets[key].add(chunk_index)
+
+    def match(self, signature: np.ndarray, threshold: float) -> Optional[int]:
+        """Index of the first chunk at or above ``threshold`` similarity, if any."""
+        candidates: Set[int] = set()
+        for key in self._bands(signature):
+            candidates |= self._buckets.get(key, set())
+        for chunk_index in sorted(candidates):
+            if similarity(signature, self._entries[chunk_index]) >= threshold:
+                return chunk_index
+        return None
+
+
+_hasher = MinHasher()
+_totals: Dict[str, int] = defaultdict(int)
+_totals_lock = threading.Lock()
+
+
+class PaperDeduper:
+    """Decides, chunk by chunk in document order, which chunks of a paper to keep."""
+
+    def __init__(self, paper_id: str, *, threshold: Optional[float] = None) -> None:
+        self.paper_id = paper_id
+        self.enabled = config.DEDUP_ENABLED
+        self.threshold = config.DEDUP_THRESHOLD if threshold is None else threshold
+        self._own = DedupIndex()
+        self.stats = {"chunks": 0, "kept": 0, "dropped_within_paper": 0}
+
+    def keep(self, text: str) -> bool:
+        self.stats["chunks"] += 1
+        signature = _hasher.signature(text) if self.enabled else None
+        if signature is not None:
+            if self._own.match(signature, self.threshold) is not None:
+                self.stats["dropped_within_paper"] += 1
+                return False
+            self._own.add(self.stats["kept"], signature)
+        self.stats["kept"] += 1
+        return True
+
+    def finish(self) -> Dict[str, int]:
+        """Add the paper's counts to the totals and return them."""
+        with _totals_lock:
+            for key, value in self.stats.items():
+                _totals[key] += value
+            _totals["papers"] += 1
+        if self.stats["dropped_within_paper"]:
+            logger.info(
+                f"Dedup {self.paper_id}: kept {self.stats['kept']}/{self.stats['chunks']} chunks "
+                f"({self.stats['dropped_within_paper']} repeated in the paper dropped)."
+            )
+        return dict(self.stats)
+
+
+def stats() -> Dict[str, int]:
+    """Dedup totals since start-up."""
+    with _totals_lock:
+        return dict(_totals)
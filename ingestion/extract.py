@@ -0,0 +1,136 @@
+"""PDF page text extraction in a process pool.
+
+pypdf extraction is CPU-bound and holds the GIL, so pages are extracted in
+worker processes, with large PDFs split into page ranges across workers.
+Workers are started with ``spawn`` (the parent holds gRPC threads), so each
+one imports this module fresh; it imports nothing heavier than pypdf and
+config. Spawn also re-runs the parent's ``__main__`` script in every worker,
+which is why ``python main.py`` hands over to uvicorn before building the app.
+"""
+from __future__ import annotations
+
+import io
+import math
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Iterator, List, Tuple
+
+from pypdf import PdfReader
+
+import config
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _clean(page_text: str) -> str:
+    # Clean text to remove problematic characters for downstream APIs
+    return page_text.encode("utf-8", "replace").decode("utf-8")
+
+
+def extract_page_range(pdf_bytes: bytes, start: int, end: int) -> List[str]:
+    """Text of pages ``[start, end)``; runs inside a worker process."""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    return [_clean(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def _workers() -> int:
+    if config.EXTRACT_PROCESSES >= 0:
+        return config.EXTRACT_PROCESSES
+    return os.cpu_count() or 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: the parent holds gRPC and other threads.
+                _pool = ProcessPoolExecutor(
+                    max_workers=_workers(), mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def page_ranges(page_count: int, workers: int, min_pages: int) -> List[tuple[int, int]]:
+    """Split pages into contiguous ranges, one per worker but never tiny."""
+    if page_count <= 0:
+        return []
+    size = max(max(1, min_pages), math.ceil(page_count / max(1, workers)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    return len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+
+
+def extract_pages(pdf_bytes: bytes) -> List[str]:
+    """Return the text of every page, in page order."""
+    page_count = count_pages(pdf_bytes)
+    workers = _workers()
+    if workers == 0:
+        return extract_page_range(pdf_bytes, 0, page_count)
+
+    ranges = page_ranges(page_count, workers, config.EXTRACT_MIN_PAGES_PER_TASK)
+    try:
+        pool = get_pool()
+        futures = [pool.submit(extract_page_range, pdf_bytes, start, end) for start, end in ranges]
+        return [text for future in futures for text in future.result()]
+    except BrokenProcessPool as e:
+        print(f" [WARN] Extraction pool failed ({e}); extracting in-process.")
+        shutdown_pool()
+        return extract_page_range(pdf_bytes, 0, page_count)
+
+
+def iter_pages(pdf_bytes: bytes) -> Iterator[str]:
+    """Yield page texts in order while only a few page ranges are in flight.
+
+    Ranges are ``EXTRACT_MIN_PAGES_PER_TASK`` pages long and at most two per
+    worker are submitted ahead of the consumer, so memory stays bounded no
+    matter how long the PDF is.
+    """
+    page_count = count_pages(pdf_bytes)
+    workers = _workers()
+    if workers == 0:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        for i in range(page_count):
+            yield _clean(reader.pages[i].extract_text() or "")
+        return
+
+    ranges: Deque[Tuple[int, int]] = deque(
+        page_ranges(page_count, page_count, config.EXTRACT_MIN_PAGES_PER_TASK)
+    )
+    in_flight: Deque[Tuple[int, int, Future]] = deque()
+    try:
+        pool = get_pool()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < 2 * workers:
+                start, end = ranges.popleft()
+                in_flight.append((start, end, pool.submit(extract_page_range, pdf_bytes, start, end)))
+            start, end, future = in_flight[0]
+            texts = future.result()
+            in_flight.popleft()
+            yield from texts
+    except BrokenProcessPool as e:
+        print(f" [WARN] Extraction pool failed ({e}); extracting in-process.")
+        shutdown_pool()
+        remaining = [(first, last) for first, last, _ in in_flight] + list(ranges)
+        in_flight.clear()
+        for start, end in remaining:
+            yield from extract_page_range(pdf_bytes, start, end)
+    finally:
+        # The consumer may stop early, e.g. once the references section starts.
+        for _, _, future in in_flight:
+            future.cancel()
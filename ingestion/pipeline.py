@@ -1,41 +1,52 @@
 """PDF ingestion pipeline using Vertex AI embeddings and Vector Search."""
 from __future__ import annotations
 
-import io
+import hashlib
 import re
 import uuid
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from pypdf import PdfReader
 import vertexai
 from vertexai.generative_models import GenerativeModel, Part
 
 import config
+from ingestion.chunking import Chunk, chunk_text, page_header
+from ingestion.dedup import PaperDeduper
+from ingestion.extract import count_pages, extract_pages, iter_pages
 from services import embedding, storage, vector_search
+from services.retry import retry_call
 
 vertexai.init(project=config.PROJECT_ID, location=config.REGION)
 
+# Bump whenever extraction or chunking changes so manifests stop matching.
+CHUNKER_REVISION = "v1"
+SUMMARY_CHUNKS = 5
+
+_REFERENCE_HEADERS = [
+    r'\n\s*(?:References|Bibliography|Works Cited|Literature Cited|REFERENCES|BIBLIOGRAPHY)\s*(?:\n|$)',
+    r'\n\s*\d{1,2}\.?\s*(?:References|Bibliography)\s*(?:\n|$)',
+]
+# Pattern: Newline, optional space, [1], space
+_CITATION_START = r'\n\s*\[1\]\s+'
+# Text held back from the chunker so a references header spanning a page
+# boundary can still be cut before it is emitted.
+_REFERENCE_LOOKBEHIND = 200
+SUMMARY_FAILED = "Summary could not be generated."
+
 
 def _extract_text(pdf_bytes: bytes) -> str:
-    reader = PdfReader(io.BytesIO(pdf_bytes))
     text = []
-    for i, page in enumerate(reader.pages):
+    # Pages are extracted in a process pool; order is preserved.
+    for i, page_text in enumerate(extract_pages(pdf_bytes)):
         # Add page delimiters to enable citation logic
-        page_text = page.extract_text() or ""
-        # Clean text to remove problematic characters for downstream APIs
-        page_text = page_text.encode("utf-8", "replace").decode("utf-8")
-        text.append(f"\n--- PAGE {i+1} ---\n{page_text}")
+        text.append(f"{page_header(i + 1)}{page_text}")
     
     full_text = "".join(text)
 
     # Strategy 1: Explicit Headers
     # Look for standalone headers in the last 40% of the document
-    headers = [
-        r'\n\s*(?:References|Bibliography|Works Cited|Literature Cited|REFERENCES|BIBLIOGRAPHY)\s*(?:\n|$)',
-        r'\n\s*\d{1,2}\.?\s*(?:References|Bibliography)\s*(?:\n|$)',
-    ]
-    
-    for pattern in headers:
+    for pattern in _REFERENCE_HEADERS:
         matches = list(re.finditer(pattern, full_text, re.IGNORECASE))
         if matches:
             # Pick the last occurrence to avoid Table of Contents matches
@@ -49,8 +60,7 @@ def _extract_text(pdf_bytes: bytes) -> str:
     start_check = int(len(full_text) * 0.7)
     tail_text = full_text[start_check:]
     
-    # Pattern: Newline, optional space, [1], space
-    citation_match = re.search(r'\n\s*\[1\]\s+', tail_text)
+    citation_match = re.search(_CITATION_START, tail_text)
     if citation_match:
         real_cutoff = start_check + citation_match.start()
         print(f" [INFO] Detected start of citation list ([1]) at {real_cutoff}. Truncating.")
@@ -60,14 +70,40 @@ def _extract_text(pdf_bytes: bytes) -> str:
     return full_text
 
 
-def _chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    chunks: List[str] = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start = end - overlap
-    return [c.strip() for c in chunks if c.strip()]
+def _references_cut(segment: str, page_index: int, page_count: int) -> Optional[int]:
+    """Streaming counterpart of the truncation in ``_extract_text``.
+
+    The position checks use the page's place in the document instead of a
+    character offset, and the first match wins since later pages are unknown.
+    """
+    if page_index >= page_count * 0.6:
+        for pattern in _REFERENCE_HEADERS:
+            match = re.search(pattern, segment, re.IGNORECASE)
+            if match:
+                return match.start()
+    if page_index >= page_count * 0.7:
+        match = re.search(_CITATION_START, segment)
+        if match:
+            return match.start()
+    return None
+
+
+def _iter_body_text(pdf_bytes: bytes) -> Iterator[str]:
+    """Yield document text page by page, stopping where the references begin."""
+    page_count = count_pages(pdf_bytes)
+    held = ""
+    for i, page_text in enumerate(iter_pages(pdf_bytes)):
+        segment = held + page_header(i + 1) + page_text
+        cut = _references_cut(segment, i, page_count)
+        if cut is not None:
+            print(f" [INFO] Detected references section on page {i+1}. Truncating.")
+            yield segment[:cut]
+            return
+        split = max(0, len(segment) - _REFERENCE_LOOKBEHIND)
+        held = segment[split:]
+        yield segment[:split]
+    print(" [WARN] No References section detected. Indexing full text.")
+    yield held
 
 
 def _summarize(chunks: List[str]) -> str:
@@ -86,33 +122,241 @@ def _summarize(chunks: List[str]) -> str:
     )
     
     # Use first 5 chunks for summary generation to capture intro/methods/results
-    parts = [Part.from_text(prompt)] + [Part.from_text(chunk[:2000]) for chunk in chunks[:5]]
+    parts = [Part.from_text(prompt)] + [
+        Part.from_text(chunk[:2000]) for chunk in chunks[:SUMMARY_CHUNKS]
+    ]
     
     try:
         response = model.generate_content(parts)
         return response.text if hasattr(response, "text") else str(response)
     except Exception as e:
         print(f" [X] Error generating summary: {e}")
-        return "Summary could not be generated."
+        return SUMMARY_FAILED
+
+
+def content_hash(pdf_bytes: bytes) -> str:
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def chunker_version(streaming: Optional[bool] = None) -> str:
+    """Identify the chunking settings a manifest was written with."""
+    if config.CHUNKER == "structured":
+        name = f"structured-{config.CHUNK_MAX_TOKENS}-{config.CHUNK_OVERLAP_TOKENS}"
+    else:
+        name = "fixed-1000-200"
+    if config.INGEST_STREAMING if streaming is None else streaming:
+        name += "-stream"
+    if config.DEDUP_ENABLED:
+        # Dedup drops chunks and renumbers the rest, so its settings shape the chunk IDs.
+        name += f"-dedup{config.DEDUP_THRESHOLD:g}"
+    return f"{name}-{CHUNKER_REVISION}"
+
+
+def manifest_matches(manifest: Optional[Dict], pdf_hash: str) -> bool:
+    """True when a manifest shows the paper was fully ingested with the current settings."""
+    if not manifest:
+        return False
+    return (
+        manifest.get("content_hash") == pdf_hash
+        and manifest.get("chunker_version") == chunker_version()
+        and manifest.get("embedding_model") == config.EMBEDDING_MODEL
+        and bool(manifest.get("summary_present"))
+    )
+
+
+def is_ingested(paper_id: str, pdf_hash: str) -> bool:
+    return manifest_matches(storage.fetch_manifest(paper_id), pdf_hash)
+
+
+def extract_chunks(pdf_bytes: bytes) -> List[Chunk]:
+    """Extract and chunk the text of a PDF."""
+    return list(chunk_text([_extract_text(pdf_bytes)]))
+
+
+def extract_unique_chunks(paper_id: str, pdf_bytes: bytes) -> Tuple[List[Chunk], Dict[str, int]]:
+    """Extract and chunk a PDF, dropping near-duplicate chunks before they are embedded."""
+    deduper = PaperDeduper(paper_id)
+    chunks = [chunk for chunk in extract_chunks(pdf_bytes) if deduper.keep(chunk.text)]
+    return chunks, deduper.finish()
+
+
+def _plan_batches(chunks: List[str], offset: int = 0) -> List[Tuple[int, List[str]]]:
+    """Pack consecutive chunks into batches that fit the embedding API limits."""
+    batches: List[Tuple[int, List[str]]] = []
+    start, tokens = 0, 0
+    for i, chunk in enumerate(chunks):
+        cost = embedding.estimate_tokens(chunk)
+        size = i - start
+        if size and (
+            size >= config.EMBEDDING_MAX_BATCH_SIZE
+            or tokens + cost > config.EMBEDDING_MAX_BATCH_TOKENS
+        ):
+            batches.append((offset + start, chunks[start:i]))
+            start, tokens = i, 0
+        tokens += cost
+    if start < len(chunks):
+        batches.append((offset + start, chunks[start:]))
+    return batches
+
+
+def _index_batch(paper_id: str, start: int, batch_chunks: List[str]) -> None:
+    retry = dict(
+        attempts=config.INGEST_RETRY_ATTEMPTS,
+        base_delay=config.INGEST_RETRY_BASE_SECONDS,
+        max_delay=config.INGEST_RETRY_MAX_SECONDS,
+    )
+    embeddings = retry_call(
+        lambda: embedding.embed_texts(batch_chunks),
+        label=f"Embedding {paper_id}[{start}]",
+        **retry,
+    )
+    # A failed upsert retries with the vectors already computed.
+    retry_call(
+        lambda: vector_search.upsert_embeddings(paper_id, embeddings, start_index=start),
+        label=f"Upsert {paper_id}[{start}]",
+        **retry,
+    )
+
+
+def index_chunks(paper_id: str, chunks: List[Chunk], start_index: int = 0) -> None:
+    """Embed chunks and upsert them into Vector Search.
+
+    Batches run concurrently (``INGEST_MAX_INFLIGHT_BATCHES``) and each one
+    retries on its own, so a transient failure never redoes finished batches.
+    """
+    batches = _plan_batches([chunk.text for chunk in chunks], start_index)
+    if not batches:
+        return
+    workers = max(1, min(config.INGEST_MAX_INFLIGHT_BATCHES, len(batches)))
+    failed: List[int] = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_index_batch, paper_id, start, batch_chunks): start
+            for start, batch_chunks in batches
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f" [X] Indexing batch at chunk {futures[future]} of {paper_id} failed: {e}")
+                failed.append(futures[future])
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(batches)} embedding batches failed for paper {paper_id}"
+        )
+
+
+def _drop_leftover_chunks(paper_id: str, chunk_count: int) -> None:
+    """Remove vectors and chunk text past ``chunk_count`` left by a longer earlier ingestion.
+
+    Re-ingestion overwrites chunks ``0..chunk_count-1`` in place, so when a new
+    arXiv version or chunker yields fewer chunks the tail of the previous run
+    would otherwise still be retrieved.
+    """
+    previous = storage.fetch_manifest(paper_id) or {}
+    previous_count = previous.get("chunk_count") or 0
+    if previous_count <= chunk_count:
+        return
+    print(
+        f" [INFO] Paper {paper_id} shrank from {previous_count} to {chunk_count} chunks. "
+        "Removing the rest."
+    )
+    vector_search.delete_paper(paper_id, previous_count, start_index=chunk_count)
+    storage.delete_chunks(paper_id, chunk_count, previous_count)
+
+
+def _finish_paper(
+    paper_id: str,
+    head_chunks: List[str],
+    chunk_count: int,
+    pdf_hash: str,
+    streaming: bool,
+    dedup_stats: Optional[Dict[str, int]] = None,
+) -> str:
+    """Generate and store the summary, then record the ingestion manifest."""
+    summary = _summarize(head_chunks)
+    storage.persist_summary(paper_id, summary)
+    _drop_leftover_chunks(paper_id, chunk_count)
+    storage.persist_manifest(
+        paper_id,
+        {
+            "content_hash": pdf_hash,
+            "chunker_version": chunker_version(streaming),
+            "embedding_model": config.EMBEDDING_MODEL,
+            "chunk_count": chunk_count,
+            "summary_present": bool(summary) and summary != SUMMARY_FAILED,
+            "dedup": dedup_stats or {},
+        },
+    )
+    return summary
+
+
+def _persist_chunks(paper_id: str, chunks: List[Chunk], start_index: int = 0) -> None:
+    storage.persist_chunks(
+        paper_id,
+        [chunk.text for chunk in chunks],
+        start_index=start_index,
+        pages=[(chunk.page_start, chunk.page_end) for chunk in chunks],
+    )
+
+
+def persist_paper(
+    paper_id: str,
+    chunks: List[Chunk],
+    pdf_hash: str,
+    dedup_stats: Optional[Dict[str, int]] = None,
+) -> str:
+    """Store chunk text, generate the summary, then record the ingestion manifest."""
+    _persist_chunks(paper_id, chunks)
+    head = [chunk.text for chunk in chunks[:SUMMARY_CHUNKS]]
+    return _finish_paper(paper_id, head, len(chunks), pdf_hash, False, dedup_stats)
+
+
+def ingest_stream(paper_id: str, pdf_bytes: bytes, pdf_hash: str) -> str:
+    """Extract, chunk, embed and persist a paper in bounded batches.
+
+    Pages are chunked as they are extracted, carrying the chunk overlap
+    across page boundaries, and every ``INGEST_STREAM_BATCH`` chunks are
+    indexed and persisted before more text is read, so peak memory no longer
+    grows with the length of the paper.
+    """
+    deduper = PaperDeduper(paper_id)
+    head: List[str] = []
+    batch: List[Chunk] = []
+    written = 0
+
+    def flush() -> None:
+        nonlocal batch, written
+        if not batch:
+            return
+        index_chunks(paper_id, batch, start_index=written)
+        _persist_chunks(paper_id, batch, start_index=written)
+        written += len(batch)
+        batch = []
+
+    for chunk in chunk_text(_iter_body_text(pdf_bytes)):
+        if not deduper.keep(chunk.text):
+            continue
+        if len(head) < SUMMARY_CHUNKS:
+            head.append(chunk.text)
+        batch.append(chunk)
+        if len(batch) >= config.INGEST_STREAM_BATCH:
+            flush()
+    flush()
+    return _finish_paper(paper_id, head, written, pdf_hash, True, deduper.finish())
 
 
 def ingest_pdf(pdf_bytes: bytes, paper_id: Optional[str] = None) -> Tuple[str, str]:
     paper_identifier = paper_id or str(uuid.uuid4())
-    text = _extract_text(pdf_bytes)
-    chunks = _chunk_text(text)
-    
-    batch_size = 20
-    for i in range(0, len(chunks), batch_size):
-        batch_chunks = chunks[i:i+batch_size]
-        embeddings = embedding.embed_texts(batch_chunks)
-        vector_search.upsert_embeddings(
-            paper_identifier,
-            embeddings,
-            start_index=i,
-        )
+    pdf_hash = content_hash(pdf_bytes)
+    if is_ingested(paper_identifier, pdf_hash):
+        print(f" [INFO] Paper {paper_identifier} is already indexed. Skipping ingestion.")
+        return paper_identifier, storage.fetch_summary(paper_identifier) or ""
 
-    storage.persist_chunks(paper_identifier, chunks)
+    if config.INGEST_STREAMING:
+        return paper_identifier, ingest_stream(paper_identifier, pdf_bytes, pdf_hash)
 
-    summary = _summarize(chunks)
-    storage.persist_summary(paper_identifier, summary)
+    chunks, dedup_stats = extract_unique_chunks(paper_identifier, pdf_bytes)
+    index_chunks(paper_identifier, chunks)
+    summary = persist_paper(paper_identifier, chunks, pdf_hash, dedup_stats)
     return paper_identifier, summary
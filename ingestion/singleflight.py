@@ -0,0 +1,129 @@
+"""Coalesce concurrent ingestions of the same paper.
+
+Within a process, the first caller for a key becomes the leader and later
+callers await its result instead of repeating the work. If the leader is
+cancelled (its client went away), followers get ``LeaderCancelled`` rather
+than a cancellation of their own, and ``SingleFlight.run`` hands the work to
+one of them. Across Cloud Run instances, an optional Firestore lease
+(``INGEST_LEASE_ENABLED``) makes other replicas wait for the holder to finish
+before they look at the paper; the holder renews it while it works.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+import config
+from services import storage
+
+INSTANCE_ID = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+
+class LeaderCancelled(Exception):
+    """The leader of a flight was cancelled before finishing; the work can be retried."""
+
+
+class SingleFlight:
+    """Registry of in-flight work keyed by paper (or content) ID."""
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, asyncio.Future] = {}
+
+    def claim(self, key: str) -> Tuple[bool, asyncio.Future]:
+        """Return ``(is_leader, future)``; followers should await the future."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            return False, flight
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        return True, flight
+
+    def resolve(self, key: str, result: Any = None, error: Optional[BaseException] = None) -> None:
+        """Finish a flight claimed by the leader. Safe to call more than once."""
+        flight = self._flights.pop(key, None)
+        if flight is None or flight.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            # Followers were not cancelled themselves; tell them to retry instead.
+            error = LeaderCancelled(key)
+        if error is not None:
+            flight.set_exception(error)
+            # Followers may not exist; avoid "exception was never retrieved".
+            flight.exception()
+        else:
+            flight.set_result(result)
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``fn`` once per key; concurrent callers share its result.
+
+        If the leader is cancelled, the first follower to notice runs ``fn``
+        itself and the others wait for it.
+        """
+        while True:
+            leader, flight = self.claim(key)
+            if leader:
+                break
+            try:
+                return await asyncio.shield(flight)
+            except LeaderCancelled:
+                continue
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.resolve(key, error=e)
+            raise
+        self.resolve(key, result)
+        return result
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+
+flights = SingleFlight()
+# paper_id -> task renewing the lease this instance holds on it
+_heartbeats: Dict[str, asyncio.Task] = {}
+
+
+async def _renew_lease(paper_id: str) -> None:
+    ttl = config.INGEST_LEASE_TTL_SECONDS
+    while True:
+        await asyncio.sleep(ttl / 3)
+        try:
+            held = await run_in_threadpool(storage.acquire_ingest_lease, paper_id, INSTANCE_ID, ttl)
+        except Exception as e:
+            logging.warning(f"Could not renew the ingestion lease for {paper_id}: {e}")
+            continue
+        if not held:
+            logging.warning(f"Lost the ingestion lease for {paper_id} to another instance.")
+            return
+
+
+async def acquire_lease(paper_id: str) -> None:
+    """Block until this instance holds the cross-instance ingestion lease.
+
+    A no-op unless ``INGEST_LEASE_ENABLED`` is set. Leases expire after
+    ``INGEST_LEASE_TTL_SECONDS`` so a crashed holder cannot block others
+    forever; a live holder renews its lease every third of that until
+    ``release_lease``, so a long ingestion keeps it.
+    """
+    if not config.INGEST_LEASE_ENABLED:
+        return
+    while not await run_in_threadpool(
+        storage.acquire_ingest_lease, paper_id, INSTANCE_ID, config.INGEST_LEASE_TTL_SECONDS
+    ):
+        await asyncio.sleep(config.INGEST_LEASE_POLL_SECONDS)
+    _heartbeats[paper_id] = asyncio.create_task(_renew_lease(paper_id))
+
+
+async def release_lease(paper_id: str) -> None:
+    if not config.INGEST_LEASE_ENABLED:
+        return
+    heartbeat = _heartbeats.pop(paper_id, None)
+    if heartbeat is not None:
+        heartbeat.cancel()
+    await run_in_threadpool(storage.release_ingest_lease, paper_id, INSTANCE_ID)
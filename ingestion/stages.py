@@ -0,0 +1,83 @@
+"""Bounded multi-stage async pipeline used to overlap ingestion work."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Iterable, List, NamedTuple, Optional, Sequence
+
+_DONE = object()
+
+
+class Stage(NamedTuple):
+    """One step of the pipeline.
+
+    ``fn`` receives the item produced by the previous stage and returns the
+    item for the next one, or ``None`` to drop it from the pipeline.
+    """
+
+    name: str
+    fn: Callable[[Any], Awaitable[Optional[Any]]]
+    concurrency: int = 1
+
+
+async def run_stages(
+    items: Iterable[Any],
+    stages: Sequence[Stage],
+    *,
+    queue_size: int = 4,
+    on_exit: Optional[Callable[[Any], Awaitable[None]]] = None,
+) -> List[Any]:
+    """Push ``items`` through ``stages`` and return those that reach the end.
+
+    Every stage runs ``concurrency`` workers, and stages are connected by
+    bounded queues so a fast stage cannot run arbitrarily far ahead of a slow
+    one. Work therefore overlaps across stages and total time is governed by
+    the slowest stage rather than the sum of all of them. Failures are logged
+    and drop the failing item; they never abort the rest of the pipeline.
+
+    ``on_exit`` is awaited once for every item as it leaves the pipeline,
+    whether it completed, was dropped or failed.
+    """
+    if not stages:
+        return list(items)
+
+    queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in stages]
+    results: List[Any] = []
+
+    async def feed() -> None:
+        for item in items:
+            await queues[0].put(item)
+        for _ in range(stages[0].concurrency):
+            await queues[0].put(_DONE)
+
+    async def worker(index: int) -> None:
+        stage = stages[index]
+        inbox = queues[index]
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            try:
+                result = await stage.fn(item)
+            except Exception as e:
+                logging.error(f"Pipeline stage '{stage.name}' failed: {e}")
+                result = None
+            if result is not None and index + 1 < len(stages):
+                await queues[index + 1].put(result)
+                continue
+            if result is not None:
+                results.append(result)
+            if on_exit is not None:
+                try:
+                    await on_exit(item if result is None else result)
+                except Exception as e:
+                    logging.error(f"Pipeline exit hook failed: {e}")
+
+    async def run_stage(index: int) -> None:
+        await asyncio.gather(*(worker(index) for _ in range(stages[index].concurrency)))
+        if index + 1 < len(stages):
+            for _ in range(stages[index + 1].concurrency):
+                await queues[index + 1].put(_DONE)
+
+    await asyncio.gather(feed(), *(run_stage(i) for i in range(len(stages))))
+    return results
@@ -1,19 +1,50 @@
 """FastAPI entrypoint for the SciPaper Analyzer service."""
 from __future__ import annotations
 
+if __name__ == "__main__":
+    # ``python main.py`` runs as ``uvicorn main:app`` does, with uvicorn as
+    # __main__ and this file imported as ``main``. PDF extraction workers are
+    # spawned, and spawn re-runs a __main__ script in every worker (as
+    # __mp_main__), which would build the whole app and agent there too.
+    import runpy
+    import sys
+
+    sys.argv = ["uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8080"]
+    runpy.run_module("uvicorn", run_name="__main__", alter_sys=True)
+    sys.exit()
+
 import asyncio
+import json
 import logging
 import uuid
-from typing import Any
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, TypeVar
 
-import requests
-from fastapi import FastAPI, File, HTTPException, UploadFile
+import httpx
+from fastapi import FastAPI, File, HTTPException, Request, Response, UploadFile
 from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
-from agents.adk_agent import PaperRAGAgent
+from agents import adk_agent, context_packer
+from agents.adk_agent import PaperRAGAgent, StageTimings
 import config
-from ingestion.pipeline import ingest_pdf, _summarize
+from ingestion import dedup, extract
+from ingestion.pipeline import (
+    SUMMARY_CHUNKS,
+    SUMMARY_FAILED,
+    _summarize,
+    content_hash,
+    extract_unique_chunks,
+    index_chunks,
+    ingest_pdf,
+    ingest_stream,
+    is_ingested,
+    manifest_matches,
+    persist_paper,
+)
+from ingestion.singleflight import LeaderCancelled, acquire_lease, flights, release_lease
+from ingestion.stages import Stage, run_stages
 from models.api import (
     AnalyzeUrlsRequest,
     AnalyzeUrlsResponse,
@@ -23,7 +54,30 @@ from models.api import (
     UploadResponse,
     UserRequest,
 )
-from services import gcs, storage
+from services import (
+    answer_cache,
+    async_storage,
+    chat_history,
+    chunk_cache,
+    embedding,
+    gcs,
+    http,
+    storage,
+    vector_search,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    chat_history.check_settings()
+    yield
+    await http.close()
+    # Write queued chat turns before the process goes away.
+    await run_in_threadpool(chat_history.shutdown)
+    async_storage.close()
+    await run_in_threadpool(vector_search.close)
+    extract.shutdown_pool()
+
 
 app = FastAPI(
     title="SciPaper Analyzer API",
@@ -31,6 +85,7 @@ app = FastAPI(
         "Ingest PDFs, index them in Vertex AI Vector Search, and answer questions via Gemini."
     ),
     version="2.1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -49,7 +104,23 @@ def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
-def _get_similar_papers(url: str) -> list[dict[str, Any]]:
+@app.get("/metrics", tags=["system"])
+def metrics() -> dict[str, Any]:
+    """In-process cache and batching counters."""
+    return {
+        "embedding": embedding.stats(),
+        "vector_search": vector_search.stats(),
+        "dedup": dedup.stats(),
+        "chunk_writes": storage.write_stats(),
+        "chunk_cache": chunk_cache.get_cache().stats(),
+        "chat_history": chat_history.stats(),
+        "query_stages": adk_agent.stats(),
+        "context_packing": context_packer.stats(),
+        "answer_cache": answer_cache.get_cache().stats() if config.ANSWER_CACHE_ENABLED else {},
+    }
+
+
+async def _get_similar_papers(url: str) -> list[dict[str, Any]]:
     """Call the paperrec-search service to find similar papers."""
     if not config.PAPERREC_SEARCH_URL:
         logging.warning("PAPERREC_SEARCH_URL is not set. Skipping similarity search.")
@@ -57,25 +128,143 @@ def _get_similar_papers(url: str) -> list[dict[str, Any]]:
     try:
         # Ensure the URL ends with /search
         search_url = config.PAPERREC_SEARCH_URL.rstrip('/') + "/search"
-        response = requests.post(search_url, json={"url": url, "k": 5})
+        response = await http.request(
+            "POST",
+            search_url,
+            json={"url": url, "k": 5},
+            timeout=config.SEARCH_TIMEOUT_SECONDS,
+        )
         response.raise_for_status()
         return response.json().get("neighbors", [])
-    except requests.RequestException as e:
+    except (httpx.HTTPError, ValueError) as e:
         logging.error(f"Could not call paperrec-search service for url {url}: {e}")
         return []
 
 
-def _download_pdf(url: str) -> bytes | None:
+async def _download_pdf(url: str) -> bytes | None:
     """Download PDF content from a URL."""
     try:
-        response = requests.get(url, timeout=60)
+        response = await http.request("GET", url)
         response.raise_for_status()
         return response.content
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logging.error(f"Failed to download PDF from {url}: {e}")
         return None
 
 
+async def _lease_stage(paper: dict[str, Any]) -> dict[str, Any]:
+    # Wait out any other instance ingesting this paper; the manifest check
+    # after the download then sees its result. This stage runs one worker per
+    # paper so the wait never holds a download slot.
+    await acquire_lease(paper["id"])
+    paper["leased"] = True
+    return paper
+
+
+async def _download_stage(paper: dict[str, Any]) -> dict[str, Any] | None:
+    pdf_bytes = await _download_pdf(paper["link_pdf"])
+    if not pdf_bytes:
+        return None
+    paper["content_hash"] = content_hash(pdf_bytes)
+    if await run_in_threadpool(is_ingested, paper["id"], paper["content_hash"]):
+        logging.info(f"Paper {paper['id']} is already indexed. Skipping ingestion.")
+        return None
+    paper["pdf_bytes"] = pdf_bytes
+    return paper
+
+
+async def _extract_stage(paper: dict[str, Any]) -> dict[str, Any]:
+    paper["chunks"], paper["dedup"] = await run_in_threadpool(
+        extract_unique_chunks, paper["id"], paper.pop("pdf_bytes")
+    )
+    return paper
+
+
+async def _index_stage(paper: dict[str, Any]) -> dict[str, Any]:
+    await run_in_threadpool(index_chunks, paper["id"], paper["chunks"])
+    return paper
+
+
+async def _persist_stage(paper: dict[str, Any]) -> dict[str, Any]:
+    await run_in_threadpool(
+        persist_paper,
+        paper["id"],
+        paper.pop("chunks"),
+        paper["content_hash"],
+        paper.pop("dedup"),
+    )
+    return paper
+
+
+async def _stream_stage(paper: dict[str, Any]) -> dict[str, Any]:
+    await run_in_threadpool(
+        ingest_stream, paper["id"], paper.pop("pdf_bytes"), paper["content_hash"]
+    )
+    return paper
+
+
+async def _finish_ingestion(paper: dict[str, Any]) -> None:
+    if paper.pop("leased", False):
+        await release_lease(paper["id"])
+    flights.resolve(paper["id"])
+
+
+def _ingestion_stages(paper_count: int) -> list[Stage]:
+    """(Lease →) download → extract → embed/upsert → persist, each with its own worker pool."""
+    stages = []
+    if config.INGEST_LEASE_ENABLED:
+        stages.append(Stage("lease", _lease_stage, max(1, paper_count)))
+    stages.append(Stage("download", _download_stage, max(1, config.DOWNLOAD_CONCURRENCY)))
+    if config.INGEST_STREAMING:
+        # Streaming ingestion interleaves extract, index and persist per batch.
+        return stages + [Stage("ingest", _stream_stage, max(1, config.INDEX_CONCURRENCY))]
+    return stages + [
+        Stage("extract", _extract_stage, max(1, config.EXTRACT_CONCURRENCY)),
+        Stage("index", _index_stage, max(1, config.INDEX_CONCURRENCY)),
+        Stage("persist", _persist_stage, max(1, config.PERSIST_CONCURRENCY)),
+    ]
+
+
+async def _ingest_papers(links: dict[str, str]) -> None:
+    """Ingest papers (ID -> PDF URL) through the staged pipeline.
+
+    Papers another request is already ingesting are awaited, not redone; if
+    that request is cancelled, they are ingested here instead.
+    """
+    while links:
+        ingestion_items = []
+        pending_flights = {}
+        for arxiv_id, pdf_url in links.items():
+            leader, flight = flights.claim(arxiv_id)
+            if leader:
+                ingestion_items.append({"id": arxiv_id, "link_pdf": pdf_url})
+            else:
+                pending_flights[arxiv_id] = asyncio.shield(flight)
+
+        try:
+            await run_stages(
+                ingestion_items,
+                _ingestion_stages(len(ingestion_items)),
+                queue_size=config.PIPELINE_QUEUE_SIZE,
+                on_exit=_finish_ingestion,
+            )
+        except asyncio.CancelledError as e:
+            # Requests waiting on these papers take them over.
+            for item in ingestion_items:
+                flights.resolve(item["id"], error=e)
+            raise
+        finally:
+            # Items still in the pipeline when it stopped never reached on_exit.
+            for item in ingestion_items:
+                await _finish_ingestion(item)
+        outcomes = await asyncio.gather(*pending_flights.values(), return_exceptions=True)
+        links = {
+            arxiv_id: links[arxiv_id]
+            for arxiv_id, outcome in zip(pending_flights, outcomes)
+            if isinstance(outcome, LeaderCancelled)
+        }
+
+
 @app.post("/analyze_urls", response_model=AnalyzeUrlsResponse, tags=["ingestion"])
 async def analyze_urls(request: AnalyzeUrlsRequest) -> AnalyzeUrlsResponse:
     """Orchestrates the analysis of multiple arXiv URLs."""
@@ -87,6 +276,7 @@ async def analyze_urls(request: AnalyzeUrlsRequest) -> AnalyzeUrlsResponse:
     initial_paper_canonical_ids: list[str] = []
 
     # --- 1. Corpus Expansion ---
+    seed_urls: list[str] = []
     for url in initial_urls:
         # --- Process Initial Paper ---
         try:
@@ -96,6 +286,7 @@ async def analyze_urls(request: AnalyzeUrlsRequest) -> AnalyzeUrlsResponse:
                 continue
             
             initial_paper_canonical_ids.append(arxiv_id)
+            seed_urls.append(url)
             
             if arxiv_id not in papers_to_process:
                 # Construct metadata for the initial paper
@@ -109,8 +300,10 @@ async def analyze_urls(request: AnalyzeUrlsRequest) -> AnalyzeUrlsResponse:
             logging.error(f"Failed to process initial URL {url}: {e}")
             continue
 
-        # --- Find and Process Similar Papers ---
-        similar_papers = await run_in_threadpool(_get_similar_papers, url)
+    # --- Find and Process Similar Papers ---
+    # All lookups are issued at once over the shared client.
+    neighbor_lists = await asyncio.gather(*(_get_similar_papers(url) for url in seed_urls))
+    for similar_papers in neighbor_lists:
         for paper in similar_papers:
             similar_arxiv_id = paper.get("id")
             if similar_arxiv_id and similar_arxiv_id not in papers_to_process:
@@ -118,34 +311,36 @@ async def analyze_urls(request: AnalyzeUrlsRequest) -> AnalyzeUrlsResponse:
                 papers_to_process[similar_arxiv_id]["id"] = similar_arxiv_id
 
     # --- 2. Full-Text Ingestion ---
-    ingestion_tasks = []
+    # Papers flow through bounded stages so downloads overlap with embedding.
+    links: dict[str, str] = {}
     for arxiv_id, paper_meta in papers_to_process.items():
         pdf_url = paper_meta.get("link_pdf")
         if not pdf_url:
             logging.warning(f"No PDF link found for paper {arxiv_id}. Skipping.")
             continue
-
-        pdf_bytes = await run_in_threadpool(_download_pdf, pdf_url)
-        if pdf_bytes:
-            # Ingest the paper using its arXiv ID as the document ID
-            task = run_in_threadpool(ingest_pdf, pdf_bytes, arxiv_id)
-            ingestion_tasks.append(task)
-
-    # Run all ingestion tasks concurrently
-    await asyncio.gather(*ingestion_tasks)
+        links[arxiv_id] = pdf_url
+    await _ingest_papers(links)
 
     # --- 3. Individual Summarization ---
     summaries: dict[str, str] = {}
     unique_initial_ids = sorted(list(set(initial_paper_canonical_ids)))
 
     for paper_id in unique_initial_ids:
+        # Summaries generated during ingestion are reused as-is.
+        stored_summary = await async_storage.fetch_summary(paper_id)
+        if stored_summary and stored_summary != SUMMARY_FAILED:
+            summaries[paper_id] = stored_summary
+            continue
+
         summary_text = f"Could not generate a summary for paper {paper_id}."
-        chunks = await run_in_threadpool(
-            storage.fetch_chunks_for_papers, [paper_id]
-        )
+        # Only the opening chunks feed the summary; read exactly those, in order.
+        chunks = await async_storage.fetch_chunk_range(paper_id, 0, SUMMARY_CHUNKS)
 
         if chunks:
             summary_text = await run_in_threadpool(_summarize, chunks)
+            if summary_text != SUMMARY_FAILED:
+                # Later requests for this paper reuse it instead of asking Gemini again.
+                await async_storage.persist_summary(paper_id, summary_text)
         elif paper_id in papers_to_process:
             # Fallback to abstract if chunks are not found
             abstract = papers_to_process[paper_id].get("abstract", "")
@@ -166,37 +361,110 @@ async def upload_pdf(file: UploadFile = File(...)) -> UploadResponse:
         raise HTTPException(status_code=400, detail="Only PDF uploads are supported.")
 
     contents = await file.read()
-    paper_id = str(uuid.uuid4())
-    gcs_uri = None
-    if config.GCS_BUCKET:
-        gcs_uri = await run_in_threadpool(
-            gcs.upload_pdf, contents, f"{paper_id}.pdf", config.GCS_BUCKET
-        )
+    pdf_hash = content_hash(contents)
 
-    paper_id, summary = await run_in_threadpool(ingest_pdf, contents, paper_id)
-    return UploadResponse(paper_id=paper_id, summary=summary, gcs_uri=gcs_uri)
+    async def ingest_upload() -> UploadResponse:
+        manifest = await async_storage.find_manifest_by_hash(pdf_hash)
+        if manifest_matches(manifest, pdf_hash):
+            paper_id = manifest["paper_id"]
+            summary = await async_storage.fetch_summary(paper_id)
+            gcs_uri = f"gs://{config.GCS_BUCKET}/{paper_id}.pdf" if config.GCS_BUCKET else None
+            return UploadResponse(paper_id=paper_id, summary=summary or "", gcs_uri=gcs_uri)
 
+        paper_id = str(uuid.uuid4())
+        gcs_uri = None
+        if config.GCS_BUCKET:
+            gcs_uri = await run_in_threadpool(
+                gcs.upload_pdf, contents, f"{paper_id}.pdf", config.GCS_BUCKET
+            )
 
+        paper_id, summary = await run_in_threadpool(ingest_pdf, contents, paper_id)
+        return UploadResponse(paper_id=paper_id, summary=summary, gcs_uri=gcs_uri)
 
-@app.post("/query", response_model=QueryResponse, tags=["query"])
-async def query(request: QueryRequest) -> QueryResponse:
+    # Identical concurrent uploads share one ingestion.
+    return await flights.run(f"sha256:{pdf_hash}", ingest_upload)
+
+
+
+T = TypeVar("T")
+
+
+async def _cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """Await ``work``, cancelling it if the client goes away first."""
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=config.QUERY_DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                logging.info(f"Client disconnected from {request.url.path}; cancelled.")
+                # 499: client closed request. Nobody reads it, but it shows in access logs.
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        task.cancel()
+
+
+def _query_args(request: QueryRequest) -> dict[str, Any]:
     if not request.question:
         raise HTTPException(status_code=400, detail="Question is required")
     if not request.paper_ids:
         raise HTTPException(status_code=400, detail="At least one paper_id is required")
-    response = await run_in_threadpool(
-        agent.answer_question,
-        paper_ids=request.paper_ids,
-        session_id=request.session_id,
-        question=request.question,
-        top_k=request.top_k or config.DEFAULT_TOP_K,
+    return {
+        "paper_ids": request.paper_ids,
+        "session_id": request.session_id,
+        "question": request.question,
+        "top_k": request.top_k or config.DEFAULT_TOP_K,
+    }
+
+
+@app.post("/query", response_model=QueryResponse, tags=["query"])
+async def query(request: QueryRequest, http_request: Request, response: Response) -> QueryResponse:
+    args = _query_args(request)
+    timings = StageTimings()
+    answer = await _cancel_on_disconnect(
+        http_request, agent.answer_question_async(**args, timings=timings)
+    )
+    response.headers["Server-Timing"] = timings.server_timing()
+    return QueryResponse(response=answer)
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream", tags=["query"])
+async def query_stream(request: QueryRequest) -> StreamingResponse:
+    """``/query`` as server-sent events: ``token`` events, then ``done`` or ``error``.
+
+    If the client disconnects, the response stream (and with it generation)
+    is cancelled and nothing is written to history.
+    """
+    args = _query_args(request)
+    timings = StageTimings()
+
+    async def events():
+        try:
+            async for piece in agent.stream_answer(**args, timings=timings):
+                yield _sse("token", {"text": piece})
+        except Exception as e:
+            logging.error(f"Streaming answer failed: {e}")
+            yield _sse("error", {"detail": "Failed to generate an answer."})
+            return
+        yield _sse("done", {"server_timing": timings.server_timing()})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    return QueryResponse(response=response)
 
 
 @app.get("/summary/{paper_id}", response_model=SummaryResponse, tags=["summary"])
 async def get_summary(paper_id: str) -> SummaryResponse:
-    summary = await run_in_threadpool(storage.fetch_summary, paper_id)
+    summary = await async_storage.fetch_summary(paper_id)
     if summary is None:
         raise HTTPException(status_code=404, detail="Summary not found")
     return SummaryResponse(paper_id=paper_id, summary=summary)
@@ -206,7 +474,7 @@ async def get_summary(paper_id: str) -> SummaryResponse:
 
 @app.post("/users", tags=["admin"])
 async def create_user(request: UserRequest):
-    success = await run_in_threadpool(storage.create_user, request.username, request.role)
+    success = await async_storage.create_user(request.username, request.role)
     if not success:
         raise HTTPException(status_code=400, detail="User already exists or invalid data.")
     return {"status": "created", "username": request.username}
@@ -214,11 +482,5 @@ async def create_user(request: UserRequest):
 
 @app.get("/users", tags=["admin"])
 async def list_users():
-    users = await run_in_threadpool(storage.list_users)
+    users = await async_storage.list_users()
     return {"users": users, "count": len(users)}
-
-
-if __name__ == "__main__":
-    import uvicorn
-
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
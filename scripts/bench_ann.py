@@ -0,0 +1,102 @@
+"""Recall-vs-latency report for the local IVF index against exact search.
+
+Builds a LocalVectorStore in a temporary directory from synthetic clustered
+unit vectors (shaped like text-embedding-004 output), then compares IVF
+search at several nprobe values with brute-force search, both unfiltered
+and restricted to a subset of paper_ids.
+
+    python scripts/bench_ann.py --rows 200000 --dim 768 --papers 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.ivf_index import IVFIndex  # noqa: E402
+from services.local_vector_store import LocalVectorStore  # noqa: E402
+
+
+def _synthetic(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    data = centers[labels] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def _timed(fn, queries):
+    results, start = [], time.perf_counter()
+    for q in queries:
+        results.append(fn(q))
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def _recall(approx, exact) -> float:
+    hits = sum(len({r["id"] for r in a} & {r["id"] for r in e}) for a, e in zip(approx, exact))
+    return hits / max(1, sum(len(e) for e in exact))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--papers", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--filter-papers", type=int, default=100,
+                        help="paper_ids per restricted query")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    data = _synthetic(args.rows, args.dim, clusters=max(8, args.rows // 500), rng=rng)
+    per_paper = max(1, args.rows // args.papers)
+    paper_ids = [f"paper{i}" for i in range(args.papers)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        ann = IVFIndex(nlist=args.nlist, train_min=args.rows)
+        # exact_max_rows=0 forces every query through the ANN index.
+        store = LocalVectorStore(directory, ann=ann, exact_max_rows=0)
+        start = time.perf_counter()
+        for p, paper_id in enumerate(paper_ids):
+            rows = data[p * per_paper:(p + 1) * per_paper]
+            if p == len(paper_ids) - 1:
+                rows = data[p * per_paper:]
+            store.upsert(paper_id, rows.tolist())
+        build_s = time.perf_counter() - start
+        print(f"rows={args.rows} dim={args.dim} papers={args.papers} "
+              f"nlist={len(ann.centroids)} build={build_s:.1f}s (incl. training)")
+
+        queries = data[rng.integers(0, args.rows, size=args.queries)]
+        queries = queries + 0.1 * rng.normal(size=queries.shape).astype(np.float32)
+        restricts = [list(rng.choice(paper_ids, size=args.filter_papers, replace=False))
+                     for _ in range(args.queries)]
+
+        for label, filters in (("unfiltered", None), (f"{args.filter_papers} papers", restricts)):
+            def restrict(i):
+                return filters[i] if filters else []
+
+            store.ann = None
+            exact, exact_ms = _timed(
+                lambda i: store.query(queries[i].tolist(), restrict(i), args.top_k),
+                range(args.queries),
+            )
+            store.ann = ann
+            print(f"\n[{label}] exact: {exact_ms:.2f} ms/query")
+            print(f"{'nprobe':>8} {'recall@k':>9} {'ms/query':>9} {'speedup':>8}")
+            for nprobe in (int(n) for n in args.nprobe.split(",")):
+                ann.nprobe = nprobe
+                approx, ms = _timed(
+                    lambda i: store.query(queries[i].tolist(), restrict(i), args.top_k),
+                    range(args.queries),
+                )
+                print(f"{nprobe:>8} {_recall(approx, exact):>9.3f} {ms:>9.2f} {exact_ms / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Compare the fixed and structured chunkers on a set of local PDFs.
+
+For every PDF the body text is extracted exactly as ingestion does, then
+chunked by each chunker. Reported per chunker: chunk count, estimated
+embedded tokens, embedding API calls (batches as planned by ingestion) and
+retrieval hit rate. Queries are sentences sampled from the body text; a
+query hits when one of the top-k chunks of its paper contains the whole
+sentence. Retrieval is TF-IDF by default, or text embeddings with
+``--embed`` (needs Vertex AI credentials).
+
+    python scripts/bench_chunker.py ~/papers/*.pdf --queries 50 --top-k 3
+"""
+import argparse
+import math
+import os
+import random
+import re
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion import pipeline  # noqa: E402
+from ingestion.chunking import PAGE_MARKER, fixed_chunks, structured_chunks  # noqa: E402
+from services import embedding  # noqa: E402
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+
+
+def _normalize(text: str) -> str:
+    text = PAGE_MARKER.sub("\n", text)
+    text = re.sub(r"(?<=[A-Za-z])-\n(?=[a-z])", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _sample_queries(body: str, count: int, rng: random.Random) -> list:
+    sentences = [s for s in _SENTENCE.split(_normalize(body)) if 12 <= len(s.split()) <= 60]
+    return rng.sample(sentences, min(count, len(sentences)))
+
+
+def _tfidf_rank(chunks: list, queries: list, top_k: int) -> list:
+    docs = [Counter(_WORD.findall(c.lower())) for c in chunks]
+    df = Counter(term for doc in docs for term in doc)
+    idf = {term: math.log(len(docs) / n) + 1 for term, n in df.items()}
+
+    def vector(counts):
+        weights = {t: c * idf.get(t, 0.0) for t, c in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {t: w / norm for t, w in weights.items()}
+
+    doc_vectors = [vector(doc) for doc in docs]
+    ranked = []
+    for query in queries:
+        q = vector(Counter(_WORD.findall(query.lower())))
+        scores = [sum(w * d.get(t, 0.0) for t, w in q.items()) for d in doc_vectors]
+        ranked.append(sorted(range(len(chunks)), key=lambda i: -scores[i])[:top_k])
+    return ranked
+
+
+def _embedding_rank(chunks: list, queries: list, top_k: int) -> list:
+    import numpy as np
+
+    docs = np.asarray(embedding.embed_texts(chunks), dtype=np.float32)
+    qs = np.asarray(embedding.embed_texts(queries), dtype=np.float32)
+    docs /= np.linalg.norm(docs, axis=1, keepdims=True)
+    qs /= np.linalg.norm(qs, axis=1, keepdims=True)
+    return [list(np.argsort(-row)[:top_k]) for row in qs @ docs.T]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--queries", type=int, default=50, help="sampled sentences per PDF")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--max-tokens", type=int, default=320)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    parser.add_argument("--embed", action="store_true", help="rank with Vertex AI embeddings")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    chunkers = {
+        "fixed": lambda body: fixed_chunks([body]),
+        "structured": lambda body: structured_chunks([body], args.max_tokens, args.overlap_tokens),
+    }
+    rank = _embedding_rank if args.embed else _tfidf_rank
+    totals = {name: Counter() for name in chunkers}
+
+    for path in args.pdfs:
+        with open(path, "rb") as f:
+            body = pipeline._extract_text(f.read())
+        queries = _sample_queries(body, args.queries, rng)
+        for name, chunker in chunkers.items():
+            chunks = [chunk.text for chunk in chunker(body)]
+            total = totals[name]
+            total["chunks"] += len(chunks)
+            total["tokens"] += sum(embedding.estimate_tokens(c) for c in chunks)
+            total["calls"] += len(pipeline._plan_batches(chunks))
+            total["queries"] += len(queries)
+            if not chunks or not queries:
+                continue
+            normalized = [_normalize(c) for c in chunks]
+            for query, top in zip(queries, rank(chunks, queries, args.top_k)):
+                contained = [query in normalized[i] for i in top]
+                total["hit@1"] += contained[0]
+                total[f"hit@{args.top_k}"] += any(contained)
+
+    print(f"pdfs={len(args.pdfs)} queries/pdf<={args.queries} "
+          f"retrieval={'embeddings' if args.embed else 'tf-idf'}")
+    print(f"{'chunker':>11} {'chunks':>7} {'tokens':>9} {'calls':>6} "
+          f"{'hit@1':>6} {f'hit@{args.top_k}':>6}")
+    for name, total in totals.items():
+        queries = max(1, total["queries"])
+        print(f"{name:>11} {total['chunks']:>7} {total['tokens']:>9} {total['calls']:>6} "
+              f"{total['hit@1'] / queries:>6.3f} {total[f'hit@{args.top_k}'] / queries:>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Semantic cache of /query answers, keyed by the set of papers searched and ``top_k``.
+
+Students in a cohort ask nearly the same questions over the same papers. An
+answer is reused when a cached question for the same paper set and ``top_k``
+has a question embedding within ``ANSWER_CACHE_THRESHOLD`` cosine similarity.
+Paper sets are held in a bytes-bounded LRU, each with its newest
+``ANSWER_CACHE_PER_SET`` answers, and answers expire after
+``ANSWER_CACHE_TTL_SECONDS``.
+
+Re-ingesting a paper drops every set containing it, but only in the process
+that ingested it; other instances keep serving their copies until the TTL
+runs out, which is why the TTL is short.
+
+Follow-up questions that refer back to the conversation ("what are *its*
+limitations?", "why is that?") are not looked up or stored when the session
+has history, since the same words then ask something else.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+from services.lru import BytesLRU
+
+# Words that usually point back at earlier turns rather than at the papers.
+# "this"/"that" only count on their own ("why is that?"), not in "this paper".
+_REFERS_BACK = re.compile(
+    r"\b(?:it|its|they|them|their|above|previous|previously|earlier|again|elaborate"
+    r"|you (?:said|mentioned|meant))\b"
+    r"|\b(?:this|that|these|those)(?: ones?)?(?=\s*(?:[?.!,;]|$))",
+    re.IGNORECASE,
+)
+# Vector plus answer text plus tuple/list overhead, per entry.
+_ENTRY_OVERHEAD = 128
+
+
+class CachedAnswer(NamedTuple):
+    vector: np.ndarray  # unit-length question embedding
+    answer: str
+    generation_ms: float
+    expires_at: float
+
+
+def refers_back(question: str) -> bool:
+    return bool(_REFERS_BACK.search(question))
+
+
+def paper_set_key(paper_ids: Sequence[str]) -> Tuple[str, ...]:
+    return tuple(sorted(set(paper_ids)))
+
+
+def _key(paper_ids: Sequence[str], top_k: int) -> Tuple[Tuple[str, ...], int]:
+    # top_k changes the retrieved context, so answers for different values differ.
+    return paper_set_key(paper_ids), top_k
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm else array
+
+
+def _sizeof(entries: List[CachedAnswer]) -> int:
+    return sum(e.vector.nbytes + len(e.answer.encode("utf-8")) + _ENTRY_OVERHEAD for e in entries)
+
+
+class AnswerCache:
+    def __init__(
+        self, *, max_bytes: int, ttl_seconds: float, threshold: float, per_set: int
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.per_set = max(1, per_set)
+        self._sets: BytesLRU[List[CachedAnswer]] = BytesLRU(max_bytes, _sizeof, ttl_seconds)
+        # Serializes read-modify-write of a set's entry list.
+        self._lock = threading.Lock()
+        # paper_id -> when it was last invalidated, to refuse answers built before that.
+        # Kept for one TTL, past which no answer retrieved before it can still arrive.
+        self._invalidated_at: Dict[str, float] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stored": 0,
+            "invalidated_sets": 0,
+            "saved_generation_ms": 0.0,
+        }
+
+    def lookup(
+        self, paper_ids: Sequence[str], top_k: int, vector: Sequence[float]
+    ) -> Optional[CachedAnswer]:
+        now = time.monotonic()
+        entries = [e for e in self._sets.get(_key(paper_ids, top_k)) or [] if e.expires_at > now]
+        best: Optional[CachedAnswer] = None
+        if entries:
+            scores = np.stack([e.vector for e in entries]) @ _unit(vector)
+            top = int(np.argmax(scores))
+            if scores[top] >= self.threshold:
+                best = entries[top]
+                logging.info(f"Answer cache hit (similarity {scores[top]:.3f})")
+        with self._lock:
+            if best is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats["hits"] += 1
+                self._stats["saved_generation_ms"] += best.generation_ms
+        return best
+
+    def store(
+        self,
+        paper_ids: Sequence[str],
+        top_k: int,
+        vector: Sequence[float],
+        answer: str,
+        generation_ms: float,
+        *,
+        retrieved_at: float,
+    ) -> None:
+        """Cache an answer whose context was retrieved at ``retrieved_at`` (monotonic clock)."""
+        if not answer:
+            return
+        key = _key(paper_ids, top_k)
+        now = time.monotonic()
+        entry = CachedAnswer(_unit(vector), answer, generation_ms, now + self.ttl_seconds)
+        with self._lock:
+            if any(self._invalidated_at.get(paper_id, 0.0) >= retrieved_at for paper_id in key[0]):
+                # A paper was re-ingested while this answer was being generated.
+                return
+            entries = [e for e in self._sets.get(key) or [] if e.expires_at > now]
+            entries.append(entry)
+            self._sets.put(key, entries[-self.per_set:])
+            self._stats["stored"] += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def invalidate_paper(self, paper_id: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            cutoff = now - self.ttl_seconds
+            self._invalidated_at = {
+                pid: at for pid, at in self._invalidated_at.items() if at > cutoff
+            }
+            self._invalidated_at[paper_id] = now
+            dropped = self._sets.discard_where(lambda key: paper_id in key[0])
+            self._stats["invalidated_sets"] += dropped
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats: Dict[str, float] = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats.update(self._sets.stats())
+        return stats
+
+
+_cache: AnswerCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache(
+                    max_bytes=config.ANSWER_CACHE_MAX_BYTES,
+                    ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS,
+                    threshold=config.ANSWER_CACHE_THRESHOLD,
+                    per_set=config.ANSWER_CACHE_PER_SET,
+                )
+    return _cache
@@ -0,0 +1,202 @@
+"""Async Firestore persistence for request handlers.
+
+Mirrors the request-path functions of ``services.storage`` (chat history
+reads and writes, summaries, chunk reads, users and manifest lookups) on
+``firestore.AsyncClient`` so FastAPI handlers await Firestore directly
+instead of holding a worker thread. Ingestion, and the write-behind chat
+history flusher, keep using the sync module from their own threads.
+
+The client is created lazily; ``set_client`` injects another one, e.g. an
+in-memory fake in tests. The async client honours ``FIRESTORE_EMULATOR_HOST``
+like the sync one, so the module can also be exercised against the emulator.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from google.api_core import exceptions
+from google.cloud import firestore
+
+import config
+from services import chunk_cache, chunk_packs
+from services.storage import USERS_COLLECTION, format_message
+
+_db: firestore.AsyncClient | None = None
+
+
+def get_client() -> firestore.AsyncClient:
+    global _db
+    if _db is None:
+        _db = firestore.AsyncClient(project=config.PROJECT_ID)
+    return _db
+
+
+def set_client(client: Optional[firestore.AsyncClient]) -> None:
+    """Use ``client`` for every call; ``None`` restores the lazily created default."""
+    global _db
+    _db = client
+
+
+def close() -> None:
+    global _db
+    if _db is not None:
+        _db.close()
+        _db = None
+
+
+# --- chat history ------------------------------------------------------------
+
+
+def _messages(session_id: str):
+    return (
+        get_client()
+        .collection(config.SESSIONS_COLLECTION)
+        .document(session_id)
+        .collection("messages")
+    )
+
+
+async def save_chat_history(session_id: str, role: str, content: str) -> None:
+    if not session_id:
+        return
+    await _messages(session_id).add(
+        {"role": role, "content": content, "timestamp": datetime.utcnow()}
+    )
+
+
+async def fetch_recent_messages(
+    session_id: Optional[str], limit: int = 10, after: Optional[datetime] = None
+) -> List[Dict]:
+    """The newest ``limit`` messages of a session (newer than ``after``), oldest first, with IDs."""
+    if not session_id or limit <= 0:
+        return []
+    query = _messages(session_id)
+    if after is not None:
+        query = query.where(filter=firestore.FieldFilter("timestamp", ">", after))
+    query = query.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit)
+    messages = [dict(doc.to_dict(), id=doc.id) async for doc in query.stream()]
+    return messages[::-1]
+
+
+async def fetch_session_summary(session_id: str) -> Optional[Dict]:
+    """``summary`` and ``summarized_until`` stored on the session document, if any."""
+    doc = await get_client().collection(config.SESSIONS_COLLECTION).document(session_id).get()
+    return doc.to_dict() if doc.exists else None
+
+
+async def load_chat_history(session_id: Optional[str], limit: int = 10) -> List[str]:
+    messages = await fetch_recent_messages(session_id, limit)
+    return [format_message(m["role"], m["content"]) for m in messages]
+
+
+# --- summaries and manifests -------------------------------------------------
+
+
+async def persist_summary(paper_id: str, summary: str) -> None:
+    if not paper_id:
+        return
+    summaries = get_client().collection(config.SUMMARIES_COLLECTION)
+    await summaries.document(paper_id).set(
+        {"summary": summary, "updated_at": datetime.utcnow()}, merge=True
+    )
+
+
+async def fetch_summary(paper_id: str) -> Optional[str]:
+    if not paper_id:
+        return None
+    doc = await get_client().collection(config.SUMMARIES_COLLECTION).document(paper_id).get()
+    if not doc.exists:
+        return None
+    return doc.to_dict().get("summary")
+
+
+async def find_manifest_by_hash(content_hash: str) -> Optional[Dict]:
+    """Return any manifest recorded for a PDF with this content hash."""
+    if not content_hash:
+        return None
+    query = (
+        get_client()
+        .collection(config.MANIFESTS_COLLECTION)
+        .where(filter=firestore.FieldFilter("content_hash", "==", content_hash))
+        .limit(1)
+    )
+    async for doc in query.stream():
+        return doc.to_dict()
+    return None
+
+
+# --- chunks ------------------------------------------------------------------
+
+
+async def _get_all(collection_name: str, doc_ids: List[str]) -> Dict[str, Dict]:
+    if not doc_ids:
+        return {}
+    client = get_client()
+    collection = client.collection(collection_name)
+    refs = [collection.document(doc_id) for doc_id in dict.fromkeys(doc_ids)]
+    return {doc.id: doc.to_dict() or {} async for doc in client.get_all(refs) if doc.exists}
+
+
+async def _read_chunks(chunk_ids: List[str]) -> Dict[str, Dict]:
+    if config.CHUNK_LAYOUT != "packed":
+        return await _get_all(config.CHUNKS_COLLECTION, chunk_ids)
+
+    wanted = chunk_packs.group_by_paper(chunk_ids)
+    directories = await _get_all(config.CHUNK_DIRECTORY_COLLECTION, list(wanted))
+    locations = chunk_packs.locate_chunks(wanted, directories)
+    packs = await _get_all(
+        config.CHUNK_PACKS_COLLECTION, [loc[0] for loc in locations.values()]
+    )
+    found = chunk_packs.read_chunks(locations, packs)
+    # Papers ingested before the switch to packed storage are still per-chunk documents.
+    missing = [cid for cid in chunk_ids if cid not in found]
+    if missing:
+        found.update(await _get_all(config.CHUNKS_COLLECTION, missing))
+    return found
+
+
+async def fetch_chunks(chunk_ids: List[str]) -> Dict[str, Dict]:
+    if not chunk_ids:
+        return {}
+    if not config.CHUNK_CACHE_ENABLED:
+        return await _read_chunks(chunk_ids)
+
+    cache = chunk_cache.get_cache()
+    found, missing = cache.get_many(chunk_ids)
+    if missing:
+        fetched = await _read_chunks(missing)
+        cache.put_many(fetched)
+        found.update(fetched)
+    return found
+
+
+async def fetch_chunk_range(paper_id: str, start: int = 0, count: int = 5) -> List[str]:
+    """Texts of chunks ``[start, start + count)`` of a paper, in document order."""
+    if not paper_id or count <= 0:
+        return []
+    chunk_ids = [f"{paper_id}-{idx}" for idx in range(start, start + count)]
+    found = await fetch_chunks(chunk_ids)
+    return [found[cid]["text"] for cid in chunk_ids if "text" in found.get(cid, {})]
+
+
+# --- users -------------------------------------------------------------------
+
+
+async def create_user(username: str, role: str) -> bool:
+    """Registers a new user for the demo."""
+    if not username:
+        return False
+    doc_ref = get_client().collection(USERS_COLLECTION).document(username)
+    try:
+        # create() fails if the document exists, so two concurrent requests
+        # cannot both register the same username.
+        await doc_ref.create({"username": username, "role": role, "joined_at": datetime.utcnow()})
+    except exceptions.AlreadyExists:
+        return False
+    return True
+
+
+async def list_users() -> List[Dict]:
+    """Fetches all users for the Admin dashboard."""
+    return [doc.to_dict() async for doc in get_client().collection(USERS_COLLECTION).stream()]
@@ -0,0 +1,482 @@
+"""Write-behind chat history with a cached tail per session.
+
+Each session's newest ``CHAT_HISTORY_TAIL`` messages are read from Firestore
+once and then kept in a bounded in-memory ring buffer; new turns go into
+that buffer right away and are written to Firestore by a background thread
+in batches. Answering a question therefore does no history I/O beyond the
+first load of a session, which request handlers await on the async client.
+Pending writes are flushed on shutdown.
+
+Tails are reloaded after ``CHAT_HISTORY_IDLE_SECONDS`` without use, which is
+how turns written by other instances are picked up. Messages carry their
+document ID, so a reload never duplicates turns still waiting to be written.
+
+With ``CHAT_HISTORY_SUMMARY`` on, long sessions are compacted: the newest
+``CHAT_HISTORY_VERBATIM`` messages stay verbatim, and once the older ones
+exceed ``CHAT_HISTORY_SUMMARY_TRIGGER_TOKENS`` they are folded into a running
+summary in the background. The prompt then carries the summary plus the
+messages not folded into it yet (up to twice the trigger while folds fail),
+so ``CHAT_HISTORY_TAIL`` does not apply.
+Messages are only let go of once a fold has succeeded; a failed fold is
+retried after a back-off. The summary, and the timestamp of the last message
+folded into it, are stored on the session document; loads then read only the
+messages after that point. Compaction needs the write-behind buffer.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+import vertexai
+from vertexai.generative_models import GenerationConfig, GenerativeModel, Part
+
+import config
+from services import async_storage, storage
+
+# A Firestore batch takes at most 500 writes.
+_MAX_BATCH = 500
+_SUMMARY_WORKERS = 2
+# Unsummarized messages read per load; more only piles up while folds keep failing.
+_UNSUMMARIZED_LOAD_LIMIT = 500
+_SUMMARY_RETRY_SECONDS = 30.0
+
+_SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant "
+    "about a collection of scientific papers. Update the summary with the new turns below. "
+    "Keep the questions asked, the answers given, the paper IDs cited and anything the user "
+    "may refer back to. Write plain prose in at most {words} words.\n\n"
+    "Current summary:\n{summary}\n\nNew turns:\n{turns}"
+)
+
+_model: GenerativeModel | None = None
+_model_lock = threading.Lock()
+
+
+def _get_model() -> GenerativeModel:
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                vertexai.init(project=config.PROJECT_ID, location=config.REGION)
+                _model = GenerativeModel(config.GENERATION_MODEL)
+    return _model
+
+
+def summarize_turns(summary: str, lines: List[str]) -> str:
+    """Fold ``"ROLE: content"`` lines into ``summary`` with Gemini."""
+    max_tokens = max(1, config.CHAT_HISTORY_SUMMARY_MAX_TOKENS)
+    prompt = _SUMMARY_PROMPT.format(
+        # ~0.75 words per token leaves room to finish the last sentence.
+        words=max(1, max_tokens * 3 // 5),
+        summary=summary or "(none yet)",
+        turns="\n".join(lines),
+    )
+    response = _get_model().generate_content(
+        [Part.from_text(prompt)],
+        generation_config=GenerationConfig(max_output_tokens=max_tokens, temperature=0.0),
+    )
+    return response.text.strip()
+
+
+def _tokens(message: Dict) -> int:
+    # Same ~4 characters per token estimate used for embedding batches.
+    return len(message["content"]) // 4 + 1
+
+
+def _newest_within(messages: List[Dict], budget: int) -> List[Dict]:
+    """The newest messages whose tokens fit ``budget``, at least one."""
+    kept: List[Dict] = []
+    used = 0
+    for message in reversed(messages):
+        used += _tokens(message)
+        if kept and used > budget:
+            break
+        kept.append(message)
+    return kept[::-1]
+
+
+def _utc(timestamp: datetime) -> datetime:
+    # Firestore returns aware UTC timestamps; turns created here are naive UTC.
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def _order(message: Dict) -> datetime:
+    return _utc(message["timestamp"])
+
+
+class _Session:
+    def __init__(self, capacity: Optional[int]) -> None:
+        # With compaction on, every message not yet folded into the summary (unbounded).
+        self.messages: Deque[Dict] = deque(maxlen=capacity)
+        self.loaded_at: Optional[float] = None
+        self.summary = ""
+        self.summarized_until: Optional[datetime] = None
+        self.summarizing = False
+        self.retry_summary_at = 0.0
+        self.lock = threading.Lock()
+
+
+class ChatHistoryBuffer:
+    """Per-session ring buffers in front of Firestore, plus a write-behind queue."""
+
+    def __init__(
+        self,
+        *,
+        tail: int,
+        max_sessions: int,
+        idle_seconds: float,
+        flush_seconds: float,
+        max_batch: int,
+        summarize: Optional[Callable[[str, List[str]], str]] = None,
+        verbatim: int = 4,
+        summary_trigger_tokens: int = 1500,
+    ) -> None:
+        """``summarize(summary, lines)`` turns on compaction; see the module docstring."""
+        self.tail = max(1, tail)
+        self.max_sessions = max(1, max_sessions)
+        self.idle_seconds = idle_seconds
+        self.flush_seconds = max(0.0, flush_seconds)
+        self.max_batch = min(_MAX_BATCH, max(1, max_batch))
+        self._summarize = summarize
+        self.verbatim = max(0, min(verbatim, self.tail - 1))
+        self.summary_trigger_tokens = max(1, summary_trigger_tokens)
+        # Compaction keeps every unsummarized message until a fold succeeds.
+        self._capacity = None if summarize else self.tail
+        self._summary_pool = (
+            ThreadPoolExecutor(max_workers=_SUMMARY_WORKERS, thread_name_prefix="chat-summary")
+            if summarize
+            else None
+        )
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        # (session_id, message_id, data, queued at)
+        self._pending: Deque[Tuple[str, str, Dict, float]] = deque()
+        self._cond = threading.Condition()
+        # Serializes Firestore writes between the flusher thread and flush().
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            "loads": 0,
+            "cached_reads": 0,
+            "messages_written": 0,
+            "write_batches": 0,
+            "write_errors": 0,
+            "summaries": 0,
+            "summary_errors": 0,
+            "messages_summarized": 0,
+        }
+        self._flusher = threading.Thread(target=self._run, name="chat-history-flush", daemon=True)
+        self._flusher.start()
+
+    def _session(self, session_id: str) -> _Session:
+        with self._cond:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self._capacity)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def _fresh(self, session: _Session) -> bool:
+        return (
+            session.loaded_at is not None
+            and time.monotonic() - session.loaded_at < self.idle_seconds
+        )
+
+    def _count_cached_read(self) -> None:
+        with self._cond:
+            self._stats["cached_reads"] += 1
+
+    @staticmethod
+    def _newer_fold(session: _Session, state: Dict) -> Optional[datetime]:
+        """``summarized_until`` of a stored summary newer than the session's, if any."""
+        until = state.get("summarized_until")
+        if until and (session.summarized_until is None or _utc(until) > _utc(session.summarized_until)):
+            return until
+        return None
+
+    def _apply_summary(self, session: _Session, state: Dict) -> None:
+        if self._newer_fold(session, state):
+            session.summary = state.get("summary", "")
+            session.summarized_until = state["summarized_until"]
+
+    def _ensure_loaded(self, session_id: str, session: _Session) -> None:
+        """Load the persisted tail unless the cached one is fresh. Caller holds ``session.lock``."""
+        if self._fresh(session):
+            self._count_cached_read()
+            return
+        if self._summarize:
+            self._apply_summary(session, storage.fetch_session_summary(session_id) or {})
+        self._apply_loaded(
+            session,
+            storage.fetch_recent_messages(
+                session_id,
+                self._capacity or _UNSUMMARIZED_LOAD_LIMIT,
+                after=session.summarized_until,
+            ),
+        )
+
+    def _apply_loaded(self, session: _Session, persisted: List[Dict]) -> None:
+        known = {m["id"] for m in persisted}
+        # Turns appended here that are not in Firestore yet stay in the tail.
+        local = [m for m in session.messages if m["id"] not in known]
+        merged = sorted(persisted + local, key=_order)
+        if session.summarized_until is not None:
+            folded_until = _utc(session.summarized_until)
+            merged = [m for m in merged if _order(m) > folded_until]
+        session.messages.clear()
+        session.messages.extend(merged)
+        session.loaded_at = time.monotonic()
+        with self._cond:
+            self._stats["loads"] += 1
+
+    def history(self, session_id: Optional[str]) -> List[str]:
+        """The session's recent turns as ``"ROLE: content"`` lines, oldest first.
+
+        With compaction, the running summary of earlier turns comes first,
+        followed by the turns not folded into it yet.
+        """
+        if not session_id:
+            return []
+        session = self._session(session_id)
+        with session.lock:
+            self._ensure_loaded(session_id, session)
+            return self._lines(session_id, session)
+
+    async def history_async(self, session_id: Optional[str]) -> List[str]:
+        """Like ``history``, awaiting a (re)load on the async Firestore client."""
+        if not session_id:
+            return []
+        session = self._session(session_id)
+        persisted: Optional[List[Dict]] = None
+        state: Dict = {}
+        if not self._fresh(session):
+            # Read without the session lock; a fold finishing meanwhile is
+            # reconciled when the result is merged below.
+            if self._summarize:
+                state = await async_storage.fetch_session_summary(session_id) or {}
+            persisted = await async_storage.fetch_recent_messages(
+                session_id,
+                self._capacity or _UNSUMMARIZED_LOAD_LIMIT,
+                after=self._newer_fold(session, state) or session.summarized_until,
+            )
+        with session.lock:
+            if persisted is not None and not self._fresh(session):
+                self._apply_summary(session, state)
+                self._apply_loaded(session, persisted)
+            else:
+                self._count_cached_read()
+            return self._lines(session_id, session)
+
+    def _lines(self, session_id: str, session: _Session) -> List[str]:
+        """Caller holds ``session.lock``."""
+        recent = list(session.messages)
+        if self._summarize:
+            # Folds keep this near the trigger; the cap only bites while they fail.
+            recent = _newest_within(recent, 2 * self.summary_trigger_tokens)
+        else:
+            recent = recent[-self.tail:]
+        lines = [storage.format_message(m["role"], m["content"]) for m in recent]
+        if session.summary:
+            lines.insert(0, f"SUMMARY OF EARLIER CONVERSATION: {session.summary}")
+        self._maybe_summarize(session_id, session)
+        return lines
+
+    def _maybe_summarize(self, session_id: str, session: _Session) -> None:
+        """Fold older messages into the summary in the background once they grow too long.
+
+        Caller holds ``session.lock``.
+        """
+        if not self._summarize or session.summarizing or self._closed:
+            return
+        if time.monotonic() < session.retry_summary_at:
+            return
+        older = list(session.messages)[: len(session.messages) - self.verbatim]
+        if sum(_tokens(m) for m in older) < self.summary_trigger_tokens:
+            return
+        session.summarizing = True
+        self._summary_pool.submit(self._fold, session_id, session, older, session.summary)
+
+    def _fold(self, session_id: str, session: _Session, older: List[Dict], summary: str) -> None:
+        try:
+            lines = [storage.format_message(m["role"], m["content"]) for m in older]
+            new_summary = self._summarize(summary, lines)
+            until = older[-1]["timestamp"]
+            storage.save_session_summary(session_id, new_summary, until)
+        except Exception as e:
+            logging.warning(f"Could not summarize chat history of session {session_id}: {e}")
+            with self._cond:
+                self._stats["summary_errors"] += 1
+            with session.lock:
+                # The messages stay in the session until a later fold succeeds.
+                session.summarizing = False
+                session.retry_summary_at = time.monotonic() + _SUMMARY_RETRY_SECONDS
+            return
+        folded = {m["id"] for m in older}
+        with session.lock:
+            session.summary = new_summary
+            session.summarized_until = until
+            remaining = [m for m in session.messages if m["id"] not in folded]
+            session.messages.clear()
+            session.messages.extend(remaining)
+            session.summarizing = False
+        with self._cond:
+            self._stats["summaries"] += 1
+            self._stats["messages_summarized"] += len(older)
+
+    def append(self, session_id: Optional[str], turns: Sequence[Tuple[str, str]]) -> None:
+        """Add ``(role, content)`` turns to the tail and queue them for writing."""
+        if not session_id or not turns:
+            return
+        now = datetime.utcnow()
+        messages = [
+            # Distinct timestamps keep the turns of one call in order in Firestore.
+            {
+                "id": uuid.uuid4().hex,
+                "role": role,
+                "content": content,
+                "timestamp": now + timedelta(microseconds=i),
+            }
+            for i, (role, content) in enumerate(turns)
+        ]
+        session = self._session(session_id)
+        with session.lock:
+            session.messages.extend(messages)
+            self._maybe_summarize(session_id, session)
+        queued_at = time.monotonic()
+        with self._cond:
+            for message in messages:
+                data = {k: v for k, v in message.items() if k != "id"}
+                self._pending.append((session_id, message["id"], data, queued_at))
+            self._cond.notify()
+
+    def _take_batch(self) -> List[Tuple[str, str, Dict, float]]:
+        batch = []
+        while self._pending and len(batch) < self.max_batch:
+            batch.append(self._pending.popleft())
+        return batch
+
+    def _write(self, batch: List[Tuple[str, str, Dict, float]]) -> bool:
+        try:
+            with self._write_lock:
+                storage.save_chat_messages([entry[:3] for entry in batch])
+        except Exception as e:
+            logging.warning(f"Could not write {len(batch)} chat messages, will retry: {e}")
+            with self._cond:
+                self._stats["write_errors"] += 1
+                self._pending.extendleft(reversed(batch))
+            return False
+        with self._cond:
+            self._stats["messages_written"] += len(batch)
+            self._stats["write_batches"] += 1
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    if self._pending:
+                        remaining = self._pending[0][3] + self.flush_seconds - time.monotonic()
+                        if len(self._pending) >= self.max_batch or remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                batch = self._take_batch()
+            if not self._write(batch):
+                # Back off before retrying the same messages.
+                with self._cond:
+                    self._cond.wait(max(1.0, self.flush_seconds))
+
+    def flush(self) -> int:
+        """Write everything queued now; returns how many messages are still pending."""
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch or not self._write(batch):
+                break
+        with self._cond:
+            return len(self._pending)
+
+    def close(self) -> None:
+        """Stop the flusher thread and write what is still queued."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._summary_pool is not None:
+            # Summaries in progress are finished; a failed one is retried after restart.
+            self._summary_pool.shutdown(wait=True, cancel_futures=True)
+        self._flusher.join(timeout=5)
+        left = self.flush()
+        if left:
+            logging.error(f"{left} chat messages could not be written before shutdown.")
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._stats, sessions=len(self._sessions), pending=len(self._pending))
+
+
+_buffer: ChatHistoryBuffer | None = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer() -> ChatHistoryBuffer:
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ChatHistoryBuffer(
+                    tail=config.CHAT_HISTORY_TAIL,
+                    max_sessions=config.CHAT_HISTORY_MAX_SESSIONS,
+                    idle_seconds=config.CHAT_HISTORY_IDLE_SECONDS,
+                    flush_seconds=config.CHAT_HISTORY_FLUSH_SECONDS,
+                    max_batch=config.CHAT_HISTORY_FLUSH_BATCH,
+                    summarize=summarize_turns if config.CHAT_HISTORY_SUMMARY else None,
+                    verbatim=config.CHAT_HISTORY_VERBATIM,
+                    summary_trigger_tokens=config.CHAT_HISTORY_SUMMARY_TRIGGER_TOKENS,
+                )
+    return _buffer
+
+
+def check_settings() -> None:
+    """Warn at start-up about settings that have no effect."""
+    if config.CHAT_HISTORY_SUMMARY and not config.CHAT_HISTORY_WRITE_BEHIND:
+        logging.warning(
+            "CHAT_HISTORY_SUMMARY needs CHAT_HISTORY_WRITE_BEHIND=true; "
+            "chat history will not be compacted."
+        )
+
+
+async def load(session_id: Optional[str]) -> List[str]:
+    if not config.CHAT_HISTORY_WRITE_BEHIND:
+        return await async_storage.load_chat_history(session_id, config.CHAT_HISTORY_TAIL)
+    return await get_buffer().history_async(session_id)
+
+
+async def append(session_id: Optional[str], turns: Sequence[Tuple[str, str]]) -> None:
+    if not config.CHAT_HISTORY_WRITE_BEHIND:
+        for role, content in turns:
+            await async_storage.save_chat_history(session_id, role, content)
+        return
+    get_buffer().append(session_id, turns)
+
+
+def shutdown() -> None:
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.close()
+
+
+def stats() -> Dict[str, int]:
+    return get_buffer().stats() if _buffer is not None else {}
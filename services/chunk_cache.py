@@ -0,0 +1,78 @@
+"""Process-local cache of chunk records in front of ``storage.fetch_chunks``.
+
+Chat sessions keep retrieving the same top-k chunks, so records are held in
+a bytes-bounded LRU keyed by chunk ID (``{paper_id}-{idx}``) with a TTL. Only
+misses go to Firestore. Writing a paper's chunks drops that paper's entries
+here; other instances rely on the TTL.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Tuple
+
+import config
+from services.chunk_packs import split_chunk_id
+from services.lru import BytesLRU
+
+# Rough per-record overhead of the dict and its small fields.
+_RECORD_OVERHEAD = 256
+
+
+def _sizeof(record: Dict) -> int:
+    return len(str(record.get("text", "")).encode("utf-8")) + _RECORD_OVERHEAD
+
+
+class ChunkCache:
+    def __init__(self, max_bytes: int, ttl_seconds: float) -> None:
+        self._memory: BytesLRU[Dict] = BytesLRU(max_bytes, _sizeof, ttl_seconds)
+        self._stats = {"hits": 0, "misses": 0, "invalidated": 0}
+        self._stats_lock = threading.Lock()
+
+    def get_many(self, chunk_ids: List[str]) -> Tuple[Dict[str, Dict], List[str]]:
+        """Split IDs into cached records and the IDs still to be read."""
+        found: Dict[str, Dict] = {}
+        missing: List[str] = []
+        for cid in chunk_ids:
+            record = self._memory.get(cid)
+            if record is None:
+                missing.append(cid)
+            else:
+                found[cid] = dict(record)
+        with self._stats_lock:
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(missing)
+        return found, missing
+
+    def put_many(self, records: Dict[str, Dict]) -> None:
+        for cid, record in records.items():
+            self._memory.put(cid, dict(record))
+
+    def invalidate_paper(self, paper_id: str) -> None:
+        def belongs(cid: str) -> bool:
+            parsed = split_chunk_id(cid)
+            return parsed is not None and parsed[0] == paper_id
+
+        dropped = self._memory.discard_where(belongs)
+        with self._stats_lock:
+            self._stats["invalidated"] += dropped
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            stats: Dict[str, float] = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats.update(self._memory.stats())
+        return stats
+
+
+_cache: ChunkCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ChunkCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ChunkCache(config.CHUNK_CACHE_MAX_BYTES, config.CHUNK_CACHE_TTL_SECONDS)
+    return _cache
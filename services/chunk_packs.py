@@ -0,0 +1,125 @@
+"""Encoding for the packed chunk layout (``CHUNK_LAYOUT=packed``).
+
+A paper's chunks are grouped into blocks of ``BLOCK_SIZE`` consecutive chunks,
+each block a zlib-compressed JSON list of ``[text, page_start, page_end]``
+stored in a pack document of its own, and a per-paper directory lists the
+packs. A chunk index resolves to ``(pack doc, offset)`` without reading
+anything else, so a lookup downloads and decompresses only the blocks
+holding the requested chunks.
+"""
+from __future__ import annotations
+
+import json
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+BLOCK_SIZE = 16
+
+
+def encode_block(texts: Sequence[str], pages: Sequence[Optional[Tuple[int, int]]]) -> bytes:
+    rows = [[text, *(page or (None, None))] for text, page in zip(texts, pages)]
+    return zlib.compress(json.dumps(rows, ensure_ascii=False).encode("utf-8"), 6)
+
+
+def decode_block(blob: bytes) -> List[Tuple[str, Optional[int], Optional[int]]]:
+    return [tuple(row) for row in json.loads(zlib.decompress(blob).decode("utf-8"))]
+
+
+def build_packs(
+    paper_id: str,
+    texts: Sequence[str],
+    start_index: int = 0,
+    pages: Optional[Sequence[Tuple[int, int]]] = None,
+) -> List[Dict]:
+    """Split chunks into one-block pack documents: ``{"doc", "start", "count", "block"}``."""
+    pages = pages or [None] * len(texts)
+    packs: List[Dict] = []
+    for offset in range(0, len(texts), BLOCK_SIZE):
+        start = start_index + offset
+        packs.append(
+            {
+                "doc": f"{paper_id}-{start}",
+                "start": start,
+                "count": min(BLOCK_SIZE, len(texts) - offset),
+                "block": encode_block(
+                    texts[offset:offset + BLOCK_SIZE], pages[offset:offset + BLOCK_SIZE]
+                ),
+            }
+        )
+    return packs
+
+
+def locate(packs: Sequence[Dict], chunk_index: int) -> Optional[Tuple[str, int]]:
+    """Map a chunk index to ``(pack doc id, offset in its block)`` via the directory."""
+    for pack in packs:
+        relative = chunk_index - pack["start"]
+        if 0 <= relative < pack["count"]:
+            return pack["doc"], relative
+    return None
+
+
+def split_chunk_id(chunk_id: str) -> Optional[Tuple[str, int]]:
+    paper_id, _, index = chunk_id.rpartition("-")
+    if not paper_id or not index.isdigit():
+        return None
+    return paper_id, int(index)
+
+
+# The helpers below are shared by the sync and async storage modules, which
+# only differ in how they read the directory and pack documents.
+
+Location = Tuple[str, int, str, int]  # pack doc, offset, paper_id, chunk index
+
+
+def group_by_paper(chunk_ids: Sequence[str]) -> Dict[str, List[Tuple[str, int]]]:
+    wanted: Dict[str, List[Tuple[str, int]]] = {}
+    for cid in chunk_ids:
+        parsed = split_chunk_id(cid)
+        if parsed:
+            wanted.setdefault(parsed[0], []).append((cid, parsed[1]))
+    return wanted
+
+
+def locate_chunks(
+    wanted: Dict[str, List[Tuple[str, int]]], directories: Dict[str, Dict]
+) -> Dict[str, Location]:
+    """Resolve chunk IDs through their papers' directories."""
+    locations: Dict[str, Location] = {}
+    for paper_id, directory in directories.items():
+        for cid, index in wanted.get(paper_id, []):
+            location = locate(directory.get("packs", []), index)
+            if location:
+                locations[cid] = (*location, paper_id, index)
+    return locations
+
+
+def chunk_record(paper_id: str, index: int, row: Tuple) -> Dict:
+    text, page_start, page_end = row
+    record = {"paper_id": paper_id, "chunk_index": index, "text": text}
+    if page_start is not None:
+        record["page_start"], record["page_end"] = page_start, page_end
+    return record
+
+
+def read_chunks(locations: Dict[str, Location], packs: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Build chunk records, decompressing each needed block once."""
+    blocks: Dict[str, List[Tuple]] = {}
+    found: Dict[str, Dict] = {}
+    for cid, (doc_id, offset, paper_id, index) in locations.items():
+        pack = packs.get(doc_id)
+        if pack is None:
+            continue
+        if doc_id not in blocks:
+            blocks[doc_id] = decode_block(pack["block"])
+        found[cid] = chunk_record(paper_id, index, blocks[doc_id][offset])
+    return found
+
+
+def paper_texts(directory: Dict, packs: Dict[str, Dict]) -> List[str]:
+    """Every chunk text listed by a paper's directory, in chunk order."""
+    texts: List[str] = []
+    for entry in sorted(directory.get("packs", []), key=lambda entry: entry["start"]):
+        pack = packs.get(entry["doc"])
+        if pack is not None:
+            texts.extend(row[0] for row in decode_block(pack["block"]))
+    return texts
@@ -1,20 +1,226 @@
 """Vertex AI embedding utilities."""
 from __future__ import annotations
 
-from typing import List
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, List, Tuple
 
 import vertexai
 from vertexai.language_models import TextEmbeddingModel
 
 import config
+from services import embedding_cache
+
+_model: TextEmbeddingModel | None = None
+_model_lock = threading.Lock()
+
+# Inputs longer than this are truncated by the API, so they never count for more.
+_MAX_TOKENS_PER_TEXT = 2048
 
 
 def get_model() -> TextEmbeddingModel:
-    vertexai.init(project=config.PROJECT_ID, location=config.REGION)
-    return TextEmbeddingModel.from_pretrained(config.EMBEDDING_MODEL)
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                vertexai.init(project=config.PROJECT_ID, location=config.REGION)
+                _model = TextEmbeddingModel.from_pretrained(config.EMBEDDING_MODEL)
+    return _model
 
 
-def embed_texts(chunks: List[str]) -> List[list[float]]:
-    model = get_model()
-    responses = model.get_embeddings(chunks)
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used to respect request limits."""
+    return min(len(text) // 4 + 1, _MAX_TOKENS_PER_TEXT)
+
+
+def _call_api(texts: List[str]) -> List[list[float]]:
+    responses = get_model().get_embeddings(texts)
     return [embedding.values for embedding in responses]
+
+
+class _Request:
+    def __init__(self, texts: List[str]) -> None:
+        self.texts = texts
+        self.vectors: List[list[float] | None] = [None] * len(texts)
+        self.remaining = len(texts)
+        self.future: Future = Future()
+
+
+class EmbeddingBatcher:
+    """Gathers concurrent ``embed_texts`` calls into full API requests.
+
+    Texts from all callers are queued and a dispatcher thread sends a batch
+    as soon as it reaches the per-request instance or token limit, or when
+    the oldest queued text has waited ``flush_ms``. A text queued more than
+    once is sent once per batch and its vector handed to every caller. Up to
+    ``max_inflight`` batches are sent concurrently.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_batch_size: int,
+        max_batch_tokens: int,
+        flush_ms: float,
+        max_inflight: int,
+    ) -> None:
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_tokens = max(1, max_batch_tokens)
+        self.flush_seconds = max(0.0, flush_ms) / 1000
+        self._pending: Deque[Tuple[_Request, int, float]] = deque()
+        self._pending_tokens = 0
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_inflight), thread_name_prefix="embed-batch"
+        )
+        self._semaphore = threading.BoundedSemaphore(max(1, max_inflight))
+        self._stats = {"requests": 0, "texts": 0, "api_calls": 0, "deduplicated": 0}
+        threading.Thread(target=self._dispatch, name="embed-dispatch", daemon=True).start()
+
+    def embed(self, texts: List[str]) -> List[list[float]]:
+        if not texts:
+            return []
+        request = _Request(texts)
+        now = time.monotonic()
+        with self._cond:
+            self._stats["requests"] += 1
+            self._stats["texts"] += len(texts)
+            for i, text in enumerate(texts):
+                self._pending.append((request, i, now))
+                self._pending_tokens += estimate_tokens(text)
+            self._cond.notify()
+        return request.future.result()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._stats, pending=len(self._pending))
+
+    def _full(self) -> bool:
+        return (
+            len(self._pending) >= self.max_batch_size
+            or self._pending_tokens >= self.max_batch_tokens
+        )
+
+    def _take_batch(self) -> List[Tuple[_Request, int]]:
+        batch: List[Tuple[_Request, int]] = []
+        unique = set()
+        tokens = 0
+        while self._pending:
+            request, i, _ = self._pending[0]
+            text = request.texts[i]
+            cost = estimate_tokens(text)
+            # Repeats of a text already in the batch ride along for free.
+            if text not in unique:
+                if len(unique) >= self.max_batch_size or (unique and tokens + cost > self.max_batch_tokens):
+                    break
+                unique.add(text)
+                tokens += cost
+            else:
+                self._stats["deduplicated"] += 1
+            self._pending.popleft()
+            self._pending_tokens -= cost
+            batch.append((request, i))
+        return batch
+
+    def _dispatch(self) -> None:
+        while True:
+            # Wait for a free in-flight slot first so batches keep filling meanwhile.
+            self._semaphore.acquire()
+            with self._cond:
+                while True:
+                    if self._pending:
+                        deadline = self._pending[0][2] + self.flush_seconds
+                        remaining = deadline - time.monotonic()
+                        if self._full() or remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                batch = self._take_batch()
+                self._stats["api_calls"] += 1
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: List[Tuple[_Request, int]]) -> None:
+        finished: List[_Request] = []
+        try:
+            texts = list(dict.fromkeys(request.texts[i] for request, i in batch))
+            vectors = _call_api(texts)
+            if len(vectors) != len(texts):
+                raise RuntimeError(
+                    f"Embedding API returned {len(vectors)} vectors for {len(texts)} texts"
+                )
+            by_text = dict(zip(texts, vectors))
+            with self._cond:
+                for request, i in batch:
+                    request.vectors[i] = by_text[request.texts[i]]
+                    request.remaining -= 1
+                    if request.remaining == 0:
+                        finished.append(request)
+        except Exception as e:
+            # Every caller in the batch must hear back, or it blocks forever.
+            for request, _ in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        finally:
+            self._semaphore.release()
+
+        for request in finished:
+            if not request.future.done():
+                request.future.set_result(request.vectors)
+
+
+_batcher: EmbeddingBatcher | None = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> EmbeddingBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = EmbeddingBatcher(
+                    max_batch_size=config.EMBEDDING_MAX_BATCH_SIZE,
+                    max_batch_tokens=config.EMBEDDING_MAX_BATCH_TOKENS,
+                    flush_ms=config.EMBEDDING_FLUSH_MS,
+                    max_inflight=config.EMBEDDING_MAX_INFLIGHT,
+                )
+    return _batcher
+
+
+def _embed_uncached(chunks: List[str]) -> List[list[float]]:
+    if config.EMBEDDING_BATCHING:
+        return get_batcher().embed(chunks)
+    return _call_api(chunks)
+
+
+def embed_texts(chunks: List[str]) -> List[list[float]]:
+    if not chunks:
+        return []
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return _embed_uncached(chunks)
+
+    cache = embedding_cache.get_cache()
+    vectors = cache.get_many(chunks)
+    missing: Dict[str, List[int]] = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(chunks[i], []).append(i)
+    if missing:
+        texts = list(missing)
+        fresh = cache.put_many(texts, _embed_uncached(texts))
+        for text, vector in zip(texts, fresh):
+            for i in missing[text]:
+                vectors[i] = vector
+    return vectors
+
+
+def stats() -> Dict[str, Dict]:
+    result: Dict[str, Dict] = {}
+    if config.EMBEDDING_CACHE_ENABLED:
+        result["cache"] = embedding_cache.get_cache().stats()
+    if config.EMBEDDING_BATCHING:
+        result["batcher"] = get_batcher().stats()
+    return result
@@ -0,0 +1,134 @@
+"""Two-tier cache of text embeddings keyed by (model, normalized text hash).
+
+Vectors are held as packed float32 bytes: a bytes-bounded in-memory LRU in
+front of an optional SQLite file (``EMBEDDING_CACHE_PATH``) that survives
+restarts. Every vector handed out, cached or fresh, is the float32 value, so
+a hit returns exactly what the original call returned.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from typing import Dict, List, Optional
+
+import config
+from services.lru import BytesLRU
+
+
+def cache_key(text: str, model: Optional[str] = None) -> str:
+    normalized = unicodedata.normalize("NFC", text).strip()
+    digest = hashlib.sha256(f"{model or config.EMBEDDING_MODEL}\0{normalized}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def pack(vector: list[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def unpack(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    def __init__(self, max_bytes: int, path: Optional[str] = None) -> None:
+        self._memory: BytesLRU[bytes] = BytesLRU(max_bytes, len)
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._stats_lock = threading.Lock()
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"Embedding disk cache at {path} unavailable: {e}")
+                self._db = None
+
+    def get_many(self, texts: List[str]) -> List[Optional[list[float]]]:
+        """Look texts up in memory, then on disk; ``None`` marks a miss."""
+        keys = [cache_key(text) for text in texts]
+        blobs: List[Optional[bytes]] = [self._memory.get(key) for key in keys]
+        memory_hits = sum(blob is not None for blob in blobs)
+
+        disk_hits = 0
+        missing = [i for i, blob in enumerate(blobs) if blob is None]
+        if missing and self._db is not None:
+            found = self._read_disk([keys[i] for i in missing])
+            for i in missing:
+                blob = found.get(keys[i])
+                if blob is not None:
+                    blobs[i] = blob
+                    self._memory.put(keys[i], blob)
+                    disk_hits += 1
+
+        with self._stats_lock:
+            self._stats["memory_hits"] += memory_hits
+            self._stats["disk_hits"] += disk_hits
+            self._stats["misses"] += len(texts) - memory_hits - disk_hits
+        return [unpack(blob) if blob is not None else None for blob in blobs]
+
+    def put_many(self, texts: List[str], vectors: List[list[float]]) -> List[list[float]]:
+        """Store fresh vectors and return them as the cache will serve them."""
+        rows = [(cache_key(text), pack(vector)) for text, vector in zip(texts, vectors)]
+        for key, blob in rows:
+            self._memory.put(key, blob)
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+                    )
+                    self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"Could not write embeddings to disk cache: {e}")
+        return [unpack(blob) for _, blob in rows]
+
+    def _read_disk(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        try:
+            with self._db_lock:
+                # Stay well under SQLite's bound-parameter limit.
+                for i in range(0, len(keys), 500):
+                    part = keys[i:i + 500]
+                    placeholders = ",".join("?" * len(part))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                    )
+                    found.update(rows)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read embeddings from disk cache: {e}")
+        return found
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            stats: Dict[str, float] = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats.update({f"memory_{k}": v for k, v in self._memory.stats().items()})
+        stats["disk_enabled"] = self._db is not None
+        return stats
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    config.EMBEDDING_CACHE_MAX_BYTES, config.EMBEDDING_CACHE_PATH
+                )
+    return _cache
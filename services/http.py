@@ -0,0 +1,57 @@
+"""Shared async HTTP client with pooled keep-alive connections."""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+import config
+
+_client: httpx.AsyncClient | None = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide client; connections are kept alive per host."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                config.HTTP_TIMEOUT_SECONDS, connect=config.HTTP_CONNECT_TIMEOUT_SECONDS
+            ),
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=60,
+            ),
+            follow_redirects=True,
+        )
+    return _client
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = asyncio.Semaphore(max(1, config.HTTP_PER_HOST_CONCURRENCY))
+    return limit
+
+
+async def request(
+    method: str, url: str, *, timeout: Optional[float] = None, **kwargs: Any
+) -> httpx.Response:
+    """Send a request, waiting for a free per-host slot first."""
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    async with _host_limit(url):
+        return await get_client().request(method, url, **kwargs)
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_limits.clear()
@@ -0,0 +1,200 @@
+"""Inverted-file (IVF) approximate nearest neighbour index for the local store.
+
+Rows are clustered around ``nlist`` centroids (spherical k-means on inner
+product, matching the unit-norm embeddings we index) and a query only scores
+rows in its ``nprobe`` closest lists. Every row also carries a paper code, so
+paper_id restricts are applied while scanning each list rather than after
+the search; probing continues past ``nprobe`` until ``top_k`` rows that pass
+the restricts have been found.
+"""
+from __future__ import annotations
+
+import math
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+_ASSIGN_BLOCK = 65536
+
+
+class IVFIndex:
+    def __init__(
+        self,
+        *,
+        nlist: int = 0,
+        nprobe: int = 8,
+        train_min: int = 10000,
+        iterations: int = 10,
+        seed: int = 0,
+    ) -> None:
+        self.nlist = nlist
+        self.nprobe = max(1, nprobe)
+        self.train_min = train_min
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._assign = np.empty(0, dtype=np.int32)  # row -> list, -1 unassigned
+        self._paper = np.empty(0, dtype=np.int32)  # row -> paper code, -1 deleted
+        self._lists: List[List[int]] = []
+        self._list_arrays: List[Optional[np.ndarray]] = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # --- maintenance -------------------------------------------------------
+
+    def _grow(self, rows: int) -> None:
+        if rows <= len(self._assign):
+            return
+        size = max(rows, 2 * len(self._assign), 1024)
+        self._assign = np.concatenate(
+            [self._assign, np.full(size - len(self._assign), -1, dtype=np.int32)]
+        )
+        self._paper = np.concatenate(
+            [self._paper, np.full(size - len(self._paper), -1, dtype=np.int32)]
+        )
+
+    def _nearest(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _append(self, rows: np.ndarray, lists: np.ndarray) -> None:
+        self._assign[rows] = lists
+        for row, list_id in zip(rows.tolist(), lists.tolist()):
+            self._lists[list_id].append(row)
+            self._list_arrays[list_id] = None
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray, paper_code: int) -> None:
+        """Insert (or move) rows; before training they are only tracked."""
+        rows = np.asarray(rows, dtype=np.int64)
+        self._grow(int(rows.max()) + 1)
+        self._paper[rows] = paper_code
+        if self.trained:
+            self._append(rows, self._nearest(np.asarray(vectors, dtype=np.float32)))
+
+    def set_papers(self, rows: np.ndarray, paper_code: int) -> None:
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size:
+            self._grow(int(rows.max()) + 1)
+            self._paper[rows] = paper_code
+
+    def remove(self, rows: np.ndarray) -> None:
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < len(self._paper)]
+        self._paper[rows] = -1
+
+    def live_rows(self) -> int:
+        return int(np.count_nonzero(self._paper >= 0))
+
+    def assign_missing(self, vectors: np.ndarray) -> int:
+        """Assign live rows that have no list yet (e.g. added after the last save); return how many."""
+        if not self.trained:
+            return 0
+        pending = np.flatnonzero((self._assign < 0) & (self._paper >= 0))
+        for i in range(0, pending.size, _ASSIGN_BLOCK):
+            rows = pending[i:i + _ASSIGN_BLOCK]
+            self._append(rows, self._nearest(np.asarray(vectors[rows], dtype=np.float32)))
+        return int(pending.size)
+
+    def train(self, vectors: np.ndarray) -> None:
+        """Fit centroids on a sample of the live rows, then assign all of them."""
+        live = np.flatnonzero(self._paper >= 0)
+        if live.size == 0:
+            return
+        nlist = self.nlist or int(4 * math.sqrt(live.size))
+        nlist = max(1, min(nlist, live.size))
+        rng = np.random.default_rng(self.seed)
+        sample = rng.choice(live, size=min(live.size, nlist * 64), replace=False)
+        data = np.asarray(vectors[np.sort(sample)], dtype=np.float32)
+
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # Re-seed empty lists from random points so every list stays useful.
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        self.centroids = centroids.astype(np.float32)
+        self._lists = [[] for _ in range(nlist)]
+        self._list_arrays = [None] * nlist
+        self._assign[:] = -1
+        self.assign_missing(vectors)
+
+    # --- search ------------------------------------------------------------
+
+    def _list_rows(self, list_id: int) -> np.ndarray:
+        rows = self._list_arrays[list_id]
+        if rows is None:
+            rows = np.asarray(self._lists[list_id], dtype=np.int64)
+            self._list_arrays[list_id] = rows
+        return rows
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        query: np.ndarray,
+        top_k: int,
+        paper_codes: Optional[np.ndarray] = None,
+        nprobe: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(rows, scores)`` of the best ``top_k`` rows, best first."""
+        nprobe = nprobe or self.nprobe
+        order = np.argsort(-(self.centroids @ query))
+        chunks: List[np.ndarray] = []
+        found = 0
+        for probed, list_id in enumerate(order):
+            if probed >= nprobe and found >= top_k:
+                break
+            rows = self._list_rows(int(list_id))
+            if rows.size == 0:
+                continue
+            # Stale entries (rows moved to another list) are skipped here too.
+            keep = self._assign[rows] == list_id
+            if paper_codes is None:
+                keep &= self._paper[rows] >= 0
+            else:
+                keep &= np.isin(self._paper[rows], paper_codes)
+            rows = rows[keep]
+            if rows.size:
+                chunks.append(rows)
+                found += rows.size
+
+        if not chunks:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # A row moved away and back can appear twice in one list.
+        candidates = np.unique(np.concatenate(chunks))
+        scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+        k = min(top_k, candidates.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return candidates[best], scores[best]
+
+    # --- persistence -------------------------------------------------------
+
+    def save(self, path: str) -> None:
+        if not self.trained:
+            return
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, assign=self._assign)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as saved:
+            self.centroids = saved["centroids"]
+            assign = saved["assign"]
+        self._grow(len(assign))
+        self._assign[:] = -1
+        self._assign[: len(assign)] = assign
+        self._lists = [[] for _ in range(len(self.centroids))]
+        self._list_arrays = [None] * len(self.centroids)
+        for row in np.flatnonzero(self._assign >= 0).tolist():
+            self._lists[self._assign[row]].append(row)
+        return True
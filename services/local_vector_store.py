@@ -0,0 +1,257 @@
+"""Local vector store backed by memory-mapped float32 arrays.
+
+Vectors live in ``vectors.f32`` (one row per datapoint) and every change is
+appended to ``log.jsonl`` so the row index can be rebuilt on start-up. Each
+paper_id maps to the rows it owns, so a filtered query only scores the rows
+of the requested papers with a single vectorized dot product.
+
+With an ``IVFIndex`` attached, queries whose restricts cover more than
+``exact_max_rows`` rows go through the ANN index instead; smaller filtered
+sets are still scored exactly since that is both faster and exact. The index
+is saved to ``ivf.npz`` when it is trained and on ``close``, and loaded on
+open; rows added since the last save are assigned (and saved) then.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.ivf_index import IVFIndex
+
+_INITIAL_CAPACITY = 1024
+
+
+def _chunk_index(datapoint_id: str) -> int:
+    return int(datapoint_id.rpartition("-")[2])
+
+
+class LocalVectorStore:
+    def __init__(
+        self, directory: str, ann: Optional[IVFIndex] = None, exact_max_rows: int = 20000
+    ) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._log_path = os.path.join(directory, "log.jsonl")
+        self._ann_path = os.path.join(directory, "ivf.npz")
+        self._lock = threading.RLock()
+        self.ann = ann
+        self.exact_max_rows = exact_max_rows
+
+        self.dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0
+        self._count = 0
+        self._ids: List[Optional[str]] = []
+        self._row_of: Dict[str, int] = {}
+        # paper_id -> [start, end) row ranges, usually a single contiguous range
+        self._paper_ranges: Dict[str, List[List[int]]] = {}
+        self._paper_codes: Dict[str, int] = {}
+        self._load()
+
+    # --- persistence -------------------------------------------------------
+
+    def _load(self) -> None:
+        if not os.path.exists(self._log_path):
+            return
+        with open(self._log_path, "r", encoding="utf-8") as log:
+            for line in log:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["op"] == "init":
+                    self.dim = entry["dim"]
+                elif entry["op"] == "add":
+                    self._index_row(entry["id"], entry["paper_id"], entry["row"])
+                elif entry["op"] == "delete":
+                    self._unindex_paper(entry["paper_id"], entry.get("start_index", 0))
+        if self.dim is not None:
+            row_bytes = self.dim * 4
+            capacity = max(os.path.getsize(self._vectors_path) // row_bytes, self._count)
+            if capacity:
+                self._open(capacity)
+        if self.ann is not None and self._vectors is not None:
+            self.ann.load(self._ann_path)
+            for paper_id in self._paper_ranges:
+                self.ann.set_papers(self._rows_for([paper_id]), self._paper_code(paper_id))
+            if not self.ann.trained and self.ann.live_rows() >= self.ann.train_min:
+                # Stopped before the index was saved: train it now.
+                self.ann.train(self._vectors)
+                self.ann.save(self._ann_path)
+            elif self.ann.assign_missing(self._vectors):
+                self.ann.save(self._ann_path)
+
+    def _append_log(self, entries: List[dict]) -> None:
+        with open(self._log_path, "a", encoding="utf-8") as log:
+            log.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+    def _open(self, capacity: int) -> None:
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+        )
+        self._capacity = capacity
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._capacity:
+            return
+        capacity = max(self._capacity, _INITIAL_CAPACITY)
+        while capacity < rows:
+            capacity *= 2
+        self._open(capacity)
+
+    # --- row index ---------------------------------------------------------
+
+    def _paper_code(self, paper_id: str) -> int:
+        code = self._paper_codes.get(paper_id)
+        if code is None:
+            code = self._paper_codes[paper_id] = len(self._paper_codes)
+        return code
+
+    def _index_row(self, datapoint_id: str, paper_id: str, row: int) -> None:
+        while len(self._ids) <= row:
+            self._ids.append(None)
+        self._ids[row] = datapoint_id
+        self._row_of[datapoint_id] = row
+        ranges = self._paper_ranges.setdefault(paper_id, [])
+        if ranges and ranges[-1][1] == row:
+            ranges[-1][1] = row + 1
+        else:
+            ranges.append([row, row + 1])
+        self._count = max(self._count, row + 1)
+
+    def _unindex_paper(self, paper_id: str, start_index: int = 0) -> List[int]:
+        """Unindex a paper's rows from chunk ``start_index`` on and return them."""
+        removed: List[int] = []
+        kept: List[List[int]] = []
+        for start, end in self._paper_ranges.pop(paper_id, []):
+            for row in range(start, end):
+                datapoint_id = self._ids[row]
+                if start_index and datapoint_id and _chunk_index(datapoint_id) < start_index:
+                    if kept and kept[-1][1] == row:
+                        kept[-1][1] = row + 1
+                    else:
+                        kept.append([row, row + 1])
+                    continue
+                if datapoint_id is not None:
+                    self._row_of.pop(datapoint_id, None)
+                self._ids[row] = None
+                removed.append(row)
+        if kept:
+            self._paper_ranges[paper_id] = kept
+        return removed
+
+    def _rows_for(self, paper_ids: List[str]) -> np.ndarray:
+        ranges = (
+            [r for pid in paper_ids for r in self._paper_ranges.get(pid, [])]
+            if paper_ids
+            else [r for ranges in self._paper_ranges.values() for r in ranges]
+        )
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end, dtype=np.int64) for start, end in ranges])
+
+    # --- VectorStore -------------------------------------------------------
+
+    def upsert(self, paper_id: str, embeddings: List[list[float]], *, start_index: int = 0) -> None:
+        if not embeddings:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            log_entries: List[dict] = []
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                log_entries.append({"op": "init", "dim": self.dim})
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dim vectors, got {vectors.shape[1]}")
+
+            rows = []
+            for i in range(len(vectors)):
+                datapoint_id = f"{paper_id}-{start_index + i}"
+                row = self._row_of.get(datapoint_id)
+                if row is None:
+                    row = self._count
+                    self._ensure_capacity(row + 1)
+                    self._index_row(datapoint_id, paper_id, row)
+                    log_entries.append(
+                        {"op": "add", "id": datapoint_id, "paper_id": paper_id, "row": row}
+                    )
+                rows.append(row)
+            self._vectors[rows] = vectors
+            self._vectors.flush()
+            self._append_log(log_entries)
+
+            if self.ann is not None:
+                self.ann.add(np.asarray(rows), vectors, self._paper_code(paper_id))
+                if not self.ann.trained and self.ann.live_rows() >= self.ann.train_min:
+                    self.ann.train(self._vectors)
+                    self.ann.save(self._ann_path)
+
+    def save_index(self) -> None:
+        """Persist the ANN index; rows added later are assigned again on load."""
+        with self._lock:
+            if self.ann is not None:
+                self.ann.save(self._ann_path)
+
+    def close(self) -> None:
+        with self._lock:
+            self.save_index()
+            if self._vectors is not None:
+                self._vectors.flush()
+
+    def query(self, query_vector: list[float], paper_ids: list[str], top_k: int) -> List[dict]:
+        with self._lock:
+            if self._vectors is None or top_k <= 0:
+                return []
+            rows = self._rows_for(paper_ids)
+            if rows.size == 0:
+                return []
+            query = np.asarray(query_vector, dtype=np.float32)
+            if self.ann is not None and self.ann.trained and rows.size > self.exact_max_rows:
+                codes = None
+                if paper_ids:
+                    codes = np.asarray(
+                        [self._paper_codes[pid] for pid in paper_ids if pid in self._paper_codes],
+                        dtype=np.int32,
+                    )
+                best_rows, best_scores = self.ann.search(self._vectors, query, top_k, codes)
+            else:
+                best_rows, best_scores = self._exact(rows, query, top_k)
+            return [
+                {
+                    "id": self._ids[row],
+                    "score": float(score),
+                    "metadata": {},
+                    "namespace_filters": [],
+                }
+                for row, score in zip(best_rows.tolist(), best_scores.tolist())
+            ]
+
+    def _exact(self, rows: np.ndarray, query: np.ndarray, top_k: int):
+        scores = self._vectors[rows] @ query
+        k = min(top_k, rows.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return rows[best], scores[best]
+
+    def delete(
+        self, paper_id: str, chunk_count: Optional[int] = None, *, start_index: int = 0
+    ) -> None:
+        """Drop a paper's vectors from chunk ``start_index`` on. Their rows are left unused on disk."""
+        with self._lock:
+            if paper_id not in self._paper_ranges:
+                return
+            removed = self._unindex_paper(paper_id, start_index)
+            if not removed:
+                return
+            if self.ann is not None:
+                self.ann.remove(np.asarray(removed))
+            self._append_log([{"op": "delete", "paper_id": paper_id, "start_index": start_index}])
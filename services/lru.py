@@ -0,0 +1,84 @@
+"""Thread-safe LRU cache bounded by the bytes its values hold."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class BytesLRU(Generic[V]):
+    """Least-recently-used mapping that evicts once ``max_bytes`` is exceeded.
+
+    ``sizeof`` reports the approximate footprint of a value; entries larger
+    than the whole budget are not cached at all. With ``ttl_seconds`` an
+    entry also expires that long after it was stored.
+    """
+
+    def __init__(
+        self, max_bytes: int, sizeof: Callable[[V], int], ttl_seconds: Optional[float] = None
+    ) -> None:
+        self.max_bytes = max(0, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self._sizeof = sizeof
+        # key -> (value, size, expiry on the monotonic clock or None)
+        self._entries: "OrderedDict[Hashable, Tuple[V, int, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] is not None and entry[2] <= time.monotonic():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: V) -> None:
+        size = self._sizeof(value)
+        expires = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, expires)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._discard(key)
+            return entry[0] if entry else None
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches; returns how many were dropped."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._discard(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _discard(self, key: Hashable) -> Optional[Tuple[V, int, Optional[float]]]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,43 @@
+"""Retry helper with exponential backoff and full jitter."""
+from __future__ import annotations
+
+import logging
+import random
+import time
+from typing import Callable, Tuple, Type, TypeVar
+
+from google.api_core import exceptions
+
+T = TypeVar("T")
+
+# Errors worth retrying: throttling, server-side failures and dropped connections.
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    exceptions.TooManyRequests,
+    exceptions.ServerError,
+    exceptions.DeadlineExceeded,
+    exceptions.Aborted,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def retry_call(
+    fn: Callable[[], T],
+    *,
+    attempts: int = 4,
+    base_delay: float = 0.5,
+    max_delay: float = 8.0,
+    retry_on: Tuple[Type[BaseException], ...] = TRANSIENT_ERRORS,
+    label: str = "call",
+) -> T:
+    """Call ``fn`` until it succeeds, sleeping ``uniform(0, base * 2**n)`` between tries."""
+    for attempt in range(1, max(1, attempts) + 1):
+        try:
+            return fn()
+        except retry_on as e:
+            if attempt >= attempts:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            logging.warning(f"{label} failed (attempt {attempt}/{attempts}): {e}; retrying in {delay:.2f}s")
+            time.sleep(delay)
+    raise AssertionError("unreachable")
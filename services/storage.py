@@ -1,16 +1,41 @@
 """Firestore-backed persistence utilities."""
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Dict, List, Optional
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 
 from google.cloud import firestore
+from google.cloud.firestore_v1.bulk_writer import (
+    BulkRetry,
+    BulkWriteFailure,
+    BulkWriter,
+    BulkWriterOptions,
+    SendMode,
+)
 
 import config
+from services import answer_cache, chunk_cache, chunk_packs
 
 _db: firestore.Client | None = None
 USERS_COLLECTION = "users"
 
+# gRPC codes worth retrying a single write for: deadline exceeded, resource
+# exhausted, aborted, internal, unavailable.
+_RETRYABLE_WRITE_CODES = {4, 8, 10, 13, 14}
+# chunk_write_seconds is wall-clock time with at least one chunk write running,
+# so concurrent papers do not count the same second twice.
+_write_stats = {"chunk_docs_written": 0, "chunk_write_failures": 0, "chunk_write_seconds": 0.0}
+_write_stats_lock = threading.Lock()
+_active_chunk_writes = 0
+_chunk_writes_busy_since = 0.0
+# Papers writing chunk documents at once; each BulkWriter sends from its own threads.
+_chunk_writers = threading.BoundedSemaphore(max(1, config.CHUNK_WRITE_CONCURRENCY))
+# Packed-layout writes per commit, under Firestore's 10 MiB request limit.
+_PACK_BATCH_BYTES = 4 * 1024 * 1024
+
 
 def get_client() -> firestore.Client:
     global _db
@@ -19,31 +44,67 @@ def get_client() -> firestore.Client:
     return _db
 
 
-def save_chat_history(session_id: str, role: str, content: str) -> None:
-    if not session_id:
-        return
-    doc_ref = (
+def format_message(role: str, content: str) -> str:
+    return f"{role.upper()}: {content}"
+
+
+def _messages(session_id: str):
+    return (
         get_client()
         .collection(config.SESSIONS_COLLECTION)
         .document(session_id)
         .collection("messages")
     )
-    doc_ref.add({"role": role, "content": content, "timestamp": datetime.utcnow()})
 
 
-def load_chat_history(session_id: Optional[str], limit: int = 10) -> List[str]:
+def save_chat_history(session_id: str, role: str, content: str) -> None:
     if not session_id:
+        return
+    _messages(session_id).add({"role": role, "content": content, "timestamp": datetime.utcnow()})
+
+
+def save_chat_messages(messages: List[Tuple[str, str, Dict]]) -> None:
+    """Write ``(session_id, message_id, data)`` triples, up to 500 per batch."""
+    for start in range(0, len(messages), 500):
+        batch = get_client().batch()
+        for session_id, message_id, data in messages[start:start + 500]:
+            batch.set(_messages(session_id).document(message_id), data)
+        batch.commit()
+
+
+def fetch_recent_messages(
+    session_id: Optional[str], limit: int = 10, after: Optional[datetime] = None
+) -> List[Dict]:
+    """The newest ``limit`` messages of a session (newer than ``after``), oldest first, with IDs."""
+    if not session_id or limit <= 0:
         return []
-    messages = (
-        get_client()
-        .collection(config.SESSIONS_COLLECTION)
-        .document(session_id)
-        .collection("messages")
-        .order_by("timestamp")
-        .limit(limit)
-        .stream()
+    query = _messages(session_id)
+    if after is not None:
+        query = query.where(filter=firestore.FieldFilter("timestamp", ">", after))
+    query = query.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit)
+    messages = [dict(doc.to_dict(), id=doc.id) for doc in query.stream()]
+    return messages[::-1]
+
+
+def fetch_session_summary(session_id: str) -> Optional[Dict]:
+    """``summary`` and ``summarized_until`` stored on the session document, if any."""
+    doc = get_client().collection(config.SESSIONS_COLLECTION).document(session_id).get()
+    return doc.to_dict() if doc.exists else None
+
+
+def save_session_summary(session_id: str, summary: str, summarized_until: datetime) -> None:
+    get_client().collection(config.SESSIONS_COLLECTION).document(session_id).set(
+        {
+            "summary": summary,
+            "summarized_until": summarized_until,
+            "summary_updated_at": datetime.utcnow(),
+        },
+        merge=True,
     )
-    return [f"{m.to_dict()['role'].upper()}: {m.to_dict()['content']}" for m in messages]
+
+
+def load_chat_history(session_id: Optional[str], limit: int = 10) -> List[str]:
+    return [format_message(m["role"], m["content"]) for m in fetch_recent_messages(session_id, limit)]
 
 
 def persist_summary(paper_id: str, summary: str) -> None:
@@ -64,35 +125,262 @@ def fetch_summary(paper_id: str) -> Optional[str]:
     return doc.to_dict().get("summary")
 
 
-def persist_chunks(paper_id: str, chunks: List[str]) -> None:
-    """Persist chunk text in Firestore keyed by vector ID."""
+def persist_chunks(
+    paper_id: str,
+    chunks: List[str],
+    start_index: int = 0,
+    pages: Optional[List[Tuple[int, int]]] = None,
+) -> None:
+    """Persist chunk text (and the pages each chunk spans) in Firestore keyed by vector ID."""
     if not paper_id or not chunks:
         return
+    try:
+        if config.CHUNK_LAYOUT == "packed":
+            _persist_chunk_packs(paper_id, chunks, start_index, pages)
+        else:
+            _persist_chunk_documents(paper_id, chunks, start_index, pages)
+    finally:
+        # A re-ingested paper must not be served from cached records or answers; doing this
+        # after the write also drops records read while it was in progress.
+        if config.CHUNK_CACHE_ENABLED:
+            chunk_cache.get_cache().invalidate_paper(paper_id)
+        if config.ANSWER_CACHE_ENABLED:
+            answer_cache.get_cache().invalidate_paper(paper_id)
+
 
+def delete_chunks(paper_id: str, start: int, end: int) -> None:
+    """Delete chunk documents ``[start, end)`` left over from a longer earlier ingestion.
+
+    Packs need no cleanup here: rewriting the directory already dropped the
+    ones it no longer lists. The per-chunk documents go in both layouts since
+    packed reads fall back to them.
+    """
+    if not paper_id or end <= start:
+        return
     client = get_client()
     collection = client.collection(config.CHUNKS_COLLECTION)
-    batch = client.batch()
+    for offset in range(start, end, 500):
+        batch = client.batch()
+        for idx in range(offset, min(offset + 500, end)):
+            batch.delete(collection.document(f"{paper_id}-{idx}"))
+        batch.commit()
+    if config.CHUNK_CACHE_ENABLED:
+        chunk_cache.get_cache().invalidate_paper(paper_id)
 
-    for idx, text in enumerate(chunks):
-        doc_id = f"{paper_id}-{idx}"
-        doc_ref = collection.document(doc_id)
-        batch.set(
-            doc_ref,
-            {
+
+def _begin_chunk_write() -> None:
+    global _active_chunk_writes, _chunk_writes_busy_since
+    with _write_stats_lock:
+        if _active_chunk_writes == 0:
+            _chunk_writes_busy_since = time.perf_counter()
+        _active_chunk_writes += 1
+
+
+def _end_chunk_write(written: int, failed: int) -> None:
+    global _active_chunk_writes
+    with _write_stats_lock:
+        _write_stats["chunk_docs_written"] += written
+        _write_stats["chunk_write_failures"] += failed
+        _active_chunk_writes -= 1
+        if _active_chunk_writes == 0:
+            _write_stats["chunk_write_seconds"] += time.perf_counter() - _chunk_writes_busy_since
+
+
+def _persist_chunk_documents(
+    paper_id: str,
+    chunks: List[str],
+    start_index: int,
+    pages: Optional[List[Tuple[int, int]]],
+) -> None:
+    """Write one document per chunk through a BulkWriter.
+
+    At most ``CHUNK_WRITE_CONCURRENCY`` papers write at once. Each writer
+    sends small batches in parallel, ramped up to
+    ``CHUNK_WRITE_MAX_OPS_PER_SECOND``, and a failed write is retried on its
+    own with backoff instead of failing the whole paper.
+    """
+    with _chunk_writers:
+        _write_chunk_documents(paper_id, chunks, start_index, pages)
+
+
+def _write_chunk_documents(
+    paper_id: str,
+    chunks: List[str],
+    start_index: int,
+    pages: Optional[List[Tuple[int, int]]],
+) -> None:
+    client = get_client()
+    collection = client.collection(config.CHUNKS_COLLECTION)
+    writer = BulkWriter(
+        client,
+        BulkWriterOptions(
+            initial_ops_per_second=min(500, config.CHUNK_WRITE_MAX_OPS_PER_SECOND),
+            max_ops_per_second=config.CHUNK_WRITE_MAX_OPS_PER_SECOND,
+            mode=SendMode.parallel,
+            retry=BulkRetry.linear,
+        ),
+    )
+    failures: List[BulkWriteFailure] = []
+    succeeded = 0
+    succeeded_lock = threading.Lock()
+
+    def on_success(*_) -> None:
+        nonlocal succeeded
+        with succeeded_lock:
+            succeeded += 1
+
+    def on_error(failure: BulkWriteFailure, _: BulkWriter) -> bool:
+        if failure.code in _RETRYABLE_WRITE_CODES and failure.attempts < config.CHUNK_WRITE_RETRY_ATTEMPTS:
+            return True
+        failures.append(failure)
+        return False
+
+    writer.on_write_result(on_success)
+    writer.on_write_error(on_error)
+    _begin_chunk_write()
+    started = time.perf_counter()
+    try:
+        for idx, text in enumerate(chunks, start=start_index):
+            doc_id = f"{paper_id}-{idx}"
+            doc_ref = collection.document(doc_id)
+            data = {
                 "paper_id": paper_id,
                 "chunk_index": idx,
                 "text": text,
                 "updated_at": datetime.utcnow(),
+            }
+            if pages:
+                data["page_start"], data["page_end"] = pages[idx - start_index]
+            writer.set(doc_ref, data)
+
+        # flush() before close(): close() stops accepting the writes it re-queues
+        # for retry.
+        writer.flush()
+        writer.close()
+    finally:
+        elapsed = time.perf_counter() - started
+        # Count successes: a batch whose request raised never reaches on_error.
+        written = succeeded
+        failed = len(chunks) - written
+        _end_chunk_write(written, failed)
+    logging.info(
+        f"Wrote {written} chunk documents for {paper_id} in {elapsed:.2f}s "
+        f"({written / elapsed if elapsed else 0:.0f} docs/s)"
+    )
+    if failed:
+        reason = f": {failures[0].message}" if failures and failures[0].message else ""
+        raise RuntimeError(
+            f"{failed} of {len(chunks)} chunk writes failed for paper {paper_id}{reason}"
+        )
+
+
+def write_stats() -> Dict[str, float]:
+    """Per-chunk document write totals and throughput over the time writes were running."""
+    with _write_stats_lock:
+        stats: Dict[str, float] = dict(_write_stats)
+        if _active_chunk_writes:
+            stats["chunk_write_seconds"] += time.perf_counter() - _chunk_writes_busy_since
+    seconds = stats["chunk_write_seconds"]
+    stats["chunk_docs_per_second"] = stats["chunk_docs_written"] / seconds if seconds else 0.0
+    return stats
+
+
+def _persist_chunk_packs(
+    paper_id: str,
+    chunks: List[str],
+    start_index: int,
+    pages: Optional[List[Tuple[int, int]]],
+) -> None:
+    client = get_client()
+    packs_collection = client.collection(config.CHUNK_PACKS_COLLECTION)
+    directory_ref = client.collection(config.CHUNK_DIRECTORY_COLLECTION).document(paper_id)
+    now = datetime.utcnow()
+
+    packs = chunk_packs.build_packs(paper_id, chunks, start_index, pages)
+    # Packs are written before the directory points at them, batched under
+    # the commit size limit.
+    batch, batch_bytes = client.batch(), 0
+    for pack in packs:
+        size = len(pack["block"])
+        if len(batch) and (len(batch) >= 500 or batch_bytes + size > _PACK_BATCH_BYTES):
+            batch.commit()
+            batch, batch_bytes = client.batch(), 0
+        batch.set(
+            packs_collection.document(pack["doc"]),
+            {
+                "paper_id": paper_id,
+                "start": pack["start"],
+                "count": pack["count"],
+                "block": pack["block"],
+                "updated_at": now,
             },
         )
+        batch_bytes += size
+    if len(batch):
+        batch.commit()
 
-    batch.commit()
+    entries = [{"doc": p["doc"], "start": p["start"], "count": p["count"]} for p in packs]
+    if start_index:
+        # Streaming ingestion appends one batch of chunks at a time.
+        directory_ref.set(
+            {
+                "packs": firestore.ArrayUnion(entries),
+                "chunk_count": start_index + len(chunks),
+                "updated_at": now,
+            },
+            merge=True,
+        )
+        return
 
+    previous = directory_ref.get()
+    directory_ref.set(
+        {
+            "paper_id": paper_id,
+            "packs": entries,
+            "chunk_count": len(chunks),
+            "updated_at": now,
+        }
+    )
+    if previous.exists:
+        # A re-ingestion replaces the directory; drop packs it no longer lists.
+        current = {entry["doc"] for entry in entries}
+        stale = [
+            entry["doc"]
+            for entry in (previous.to_dict() or {}).get("packs", [])
+            if entry["doc"] not in current
+        ]
+        for offset in range(0, len(stale), 500):
+            batch = client.batch()
+            for doc_id in stale[offset:offset + 500]:
+                batch.delete(packs_collection.document(doc_id))
+            batch.commit()
 
-def fetch_chunks(chunk_ids: List[str]) -> Dict[str, Dict]:
-    if not chunk_ids:
+
+def _fetch_directories(paper_ids: List[str]) -> Dict[str, Dict]:
+    client = get_client()
+    collection = client.collection(config.CHUNK_DIRECTORY_COLLECTION)
+    documents = client.get_all([collection.document(pid) for pid in dict.fromkeys(paper_ids)])
+    return {doc.id: doc.to_dict() or {} for doc in documents if doc.exists}
+
+
+def _fetch_packs(doc_ids: List[str]) -> Dict[str, Dict]:
+    if not doc_ids:
         return {}
+    client = get_client()
+    collection = client.collection(config.CHUNK_PACKS_COLLECTION)
+    documents = client.get_all([collection.document(doc_id) for doc_id in doc_ids])
+    return {doc.id: doc.to_dict() or {} for doc in documents if doc.exists}
+
+
+def _fetch_packed_chunks(chunk_ids: List[str]) -> Dict[str, Dict]:
+    wanted = chunk_packs.group_by_paper(chunk_ids)
+    locations = chunk_packs.locate_chunks(wanted, _fetch_directories(list(wanted)))
+    # Only the packs (one block each) holding requested chunks are read.
+    packs = _fetch_packs(list(dict.fromkeys(loc[0] for loc in locations.values())))
+    return chunk_packs.read_chunks(locations, packs)
+
 
+def _fetch_chunk_documents(chunk_ids: List[str]) -> Dict[str, Dict]:
     client = get_client()
     collection = client.collection(config.CHUNKS_COLLECTION)
     doc_refs = [collection.document(cid) for cid in chunk_ids]
@@ -105,17 +393,78 @@ def fetch_chunks(chunk_ids: List[str]) -> Dict[str, Dict]:
     return found
 
 
+def fetch_chunks(chunk_ids: List[str]) -> Dict[str, Dict]:
+    if not chunk_ids:
+        return {}
+    if not config.CHUNK_CACHE_ENABLED:
+        return _read_chunks(chunk_ids)
+
+    cache = chunk_cache.get_cache()
+    found, missing = cache.get_many(chunk_ids)
+    if missing:
+        fetched = _read_chunks(missing)
+        cache.put_many(fetched)
+        found.update(fetched)
+    return found
+
+
+def _read_chunks(chunk_ids: List[str]) -> Dict[str, Dict]:
+    if config.CHUNK_LAYOUT != "packed":
+        return _fetch_chunk_documents(chunk_ids)
+
+    found = _fetch_packed_chunks(chunk_ids)
+    # Papers ingested before the switch to packed storage are still per-chunk documents.
+    missing = [cid for cid in chunk_ids if cid not in found]
+    if missing:
+        found.update(_fetch_chunk_documents(missing))
+    return found
+
+
+def fetch_chunk_range(paper_id: str, start: int = 0, count: int = 5) -> List[str]:
+    """Texts of chunks ``[start, start + count)`` of a paper, in document order.
+
+    Chunks are read by their known ``{paper_id}-{idx}`` IDs, so the cost does
+    not grow with the length of the paper.
+    """
+    if not paper_id or count <= 0:
+        return []
+    chunk_ids = [f"{paper_id}-{idx}" for idx in range(start, start + count)]
+    found = fetch_chunks(chunk_ids)
+    return [found[cid]["text"] for cid in chunk_ids if "text" in found.get(cid, {})]
+
+
+def _fetch_packed_papers(paper_ids: List[str]) -> Dict[str, List[str]]:
+    """All chunk texts of the papers stored in the packed layout, in chunk order."""
+    directories = _fetch_directories(paper_ids)
+    doc_ids = [
+        entry["doc"] for directory in directories.values() for entry in directory.get("packs", [])
+    ]
+    packs = _fetch_packs(doc_ids)
+    return {
+        paper_id: chunk_packs.paper_texts(directory, packs)
+        for paper_id, directory in directories.items()
+    }
+
+
 def fetch_chunks_for_papers(paper_ids: List[str]) -> List[str]:
     """Fetches all chunk texts for a list of paper IDs."""
     if not paper_ids:
         return []
 
+    text_chunks = []
+    if config.CHUNK_LAYOUT == "packed":
+        packed = _fetch_packed_papers(paper_ids)
+        for texts in packed.values():
+            text_chunks.extend(texts)
+        paper_ids = [pid for pid in paper_ids if pid not in packed]
+        if not paper_ids:
+            return text_chunks
+
     client = get_client()
     collection = client.collection(config.CHUNKS_COLLECTION)
     
     # Firestore 'in' query supports up to 30 values.
     # If more are needed, chunk the requests.
-    text_chunks = []
     for i in range(0, len(paper_ids), 30):
         chunk_of_ids = paper_ids[i:i+30]
         query = collection.where(filter=firestore.FieldFilter("paper_id", "in", chunk_of_ids))
@@ -128,6 +477,75 @@ def fetch_chunks_for_papers(paper_ids: List[str]) -> List[str]:
     return text_chunks
 
 
+def persist_manifest(paper_id: str, manifest: Dict) -> None:
+    """Record how a paper was ingested so identical re-ingestions can be skipped."""
+    if not paper_id:
+        return
+    manifests = get_client().collection(config.MANIFESTS_COLLECTION)
+    manifests.document(paper_id).set(
+        {**manifest, "paper_id": paper_id, "updated_at": datetime.utcnow()}
+    )
+
+
+def fetch_manifest(paper_id: str) -> Optional[Dict]:
+    if not paper_id:
+        return None
+    doc = get_client().collection(config.MANIFESTS_COLLECTION).document(paper_id).get()
+    if not doc.exists:
+        return None
+    return doc.to_dict()
+
+
+def find_manifest_by_hash(content_hash: str) -> Optional[Dict]:
+    """Return any manifest recorded for a PDF with this content hash."""
+    if not content_hash:
+        return None
+    query = (
+        get_client()
+        .collection(config.MANIFESTS_COLLECTION)
+        .where(filter=firestore.FieldFilter("content_hash", "==", content_hash))
+        .limit(1)
+    )
+    for doc in query.stream():
+        return doc.to_dict()
+    return None
+
+
+def acquire_ingest_lease(paper_id: str, owner: str, ttl_seconds: int) -> bool:
+    """Take (or renew) the ingestion lease for a paper unless another owner holds it."""
+    client = get_client()
+    doc_ref = client.collection(config.INGEST_LEASES_COLLECTION).document(paper_id)
+
+    @firestore.transactional
+    def _acquire(transaction: firestore.Transaction) -> bool:
+        snapshot = doc_ref.get(transaction=transaction)
+        now = datetime.now(timezone.utc)
+        if snapshot.exists:
+            lease = snapshot.to_dict() or {}
+            expires_at = lease.get("expires_at")
+            if lease.get("owner") != owner and expires_at and expires_at > now:
+                return False
+        transaction.set(
+            doc_ref, {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds)}
+        )
+        return True
+
+    return _acquire(client.transaction())
+
+
+def release_ingest_lease(paper_id: str, owner: str) -> None:
+    client = get_client()
+    doc_ref = client.collection(config.INGEST_LEASES_COLLECTION).document(paper_id)
+    snapshot = doc_ref.get()
+    if not snapshot.exists or (snapshot.to_dict() or {}).get("owner") != owner:
+        return
+    try:
+        # Only delete the exact lease we read; a newer holder's lease survives.
+        doc_ref.delete(option=client.write_option(last_update_time=snapshot.update_time))
+    except Exception as e:
+        logging.warning(f"Could not release ingestion lease for {paper_id}: {e}")
+
+
 # --- NEW: User Management for Demo ---
 
 def create_user(username: str, role: str) -> bool:
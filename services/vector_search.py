@@ -1,7 +1,15 @@
-"""Vertex AI Vector Search integration."""
+"""Vector search backends behind a common VectorStore interface.
+
+``VECTOR_BACKEND`` selects Vertex AI Vector Search (``vertex``, the default)
+or the local memory-mapped NumPy store (``local``) used for development,
+load tests and small deployments.
+"""
 from __future__ import annotations
 
-from typing import List, Optional
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Protocol
 
 from google.cloud import aiplatform
 # Use v1 types for the Datapoint definition
@@ -10,19 +18,223 @@ from google.cloud.aiplatform_v1.types import IndexDatapoint
 import config
 
 
+class VectorStore(Protocol):
+    """Datapoints are ``{paper_id}-{chunk_index}`` and restricted by paper_id."""
+
+    def upsert(self, paper_id: str, embeddings: List[list[float]], *, start_index: int = 0) -> None:
+        ...
+
+    def query(self, query_vector: list[float], paper_ids: list[str], top_k: int) -> List[dict]:
+        ...
+
+    def delete(
+        self, paper_id: str, chunk_count: Optional[int] = None, *, start_index: int = 0
+    ) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+_vertex_lock = threading.Lock()
+_vertex_initialized = False
+_endpoint: aiplatform.MatchingEngineIndexEndpoint | None = None
+_index: aiplatform.MatchingEngineIndex | None = None
+
+
+def _init_aiplatform() -> None:
+    global _vertex_initialized
+    if not _vertex_initialized:
+        aiplatform.init(project=config.PROJECT_ID, location=config.REGION)
+        _vertex_initialized = True
+
+
 def _get_endpoint() -> aiplatform.MatchingEngineIndexEndpoint:
-    aiplatform.init(project=config.PROJECT_ID, location=config.REGION)
-    if not config.VERTEX_INDEX_ENDPOINT_ID:
-        raise config.SettingsError("VERTEX_INDEX_ENDPOINT_ID must be set for vector search.")
-    return aiplatform.MatchingEngineIndexEndpoint(index_endpoint_name=config.VERTEX_INDEX_ENDPOINT_ID)
+    """Resolve the endpoint once per process; its match client channel stays open."""
+    global _endpoint
+    if _endpoint is None:
+        with _vertex_lock:
+            if _endpoint is None:
+                if not config.VERTEX_INDEX_ENDPOINT_ID:
+                    raise config.SettingsError("VERTEX_INDEX_ENDPOINT_ID must be set for vector search.")
+                _init_aiplatform()
+                _endpoint = aiplatform.MatchingEngineIndexEndpoint(
+                    index_endpoint_name=config.VERTEX_INDEX_ENDPOINT_ID
+                )
+    return _endpoint
 
 
 def _get_index() -> aiplatform.MatchingEngineIndex:
-    """Retrieve the Vector Search Index resource (for upserts)."""
-    aiplatform.init(project=config.PROJECT_ID, location=config.REGION)
-    if not config.VERTEX_INDEX_ID:
-        raise config.SettingsError("VERTEX_INDEX_ID must be set for upserts.")
-    return aiplatform.MatchingEngineIndex(index_name=config.VERTEX_INDEX_ID)
+    """Retrieve the Vector Search Index resource (for upserts), once per process."""
+    global _index
+    if _index is None:
+        with _vertex_lock:
+            if _index is None:
+                if not config.VERTEX_INDEX_ID:
+                    raise config.SettingsError("VERTEX_INDEX_ID must be set for upserts.")
+                _init_aiplatform()
+                _index = aiplatform.MatchingEngineIndex(index_name=config.VERTEX_INDEX_ID)
+    return _index
+
+
+class _CallTimings:
+    """Running totals of resolve vs. remote call time, per operation."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, operation: str, resolve_ms: float, call_ms: float) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(
+                operation, {"calls": 0, "resolve_ms": 0.0, "call_ms": 0.0}
+            )
+            totals["calls"] += 1
+            totals["resolve_ms"] += resolve_ms
+            totals["call_ms"] += call_ms
+        logging.info(
+            f"Vector search {operation}: resolve {resolve_ms:.1f} ms, call {call_ms:.1f} ms"
+        )
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                operation: {
+                    "calls": totals["calls"],
+                    "avg_resolve_ms": totals["resolve_ms"] / totals["calls"],
+                    "avg_call_ms": totals["call_ms"] / totals["calls"],
+                }
+                for operation, totals in self._totals.items()
+            }
+
+
+_timings = _CallTimings()
+
+
+class VertexVectorStore:
+    """Vertex AI Vector Search (Matching Engine) backend."""
+
+    def __init__(self, deployed_index_id: Optional[str] = None) -> None:
+        self.deployed_index_id = deployed_index_id
+
+    def upsert(self, paper_id: str, embeddings: List[list[float]], *, start_index: int = 0) -> None:
+        # Upserts must be done on the Index resource, not the Endpoint
+        started = time.perf_counter()
+        index = _get_index()
+        resolved = time.perf_counter()
+
+        datapoints = []
+        for i, vector in enumerate(embeddings):
+            # Construct the v1 IndexDatapoint
+            datapoints.append(
+                IndexDatapoint(
+                    datapoint_id=f"{paper_id}-{start_index + i}",
+                    feature_vector=vector,
+                    restricts=[
+                        IndexDatapoint.Restriction(
+                            namespace="paper_id",
+                            allow_list=[paper_id]
+                        )
+                    ],
+                )
+            )
+
+        # Call upsert on the Index object
+        index.upsert_datapoints(datapoints=datapoints)
+        _timings.record(
+            "upsert", (resolved - started) * 1000, (time.perf_counter() - resolved) * 1000
+        )
+
+    def query(self, query_vector: list[float], paper_ids: list[str], top_k: int) -> List[dict]:
+        # Queries must be done on the Index Endpoint
+        started = time.perf_counter()
+        endpoint = _get_endpoint()
+        resolved = time.perf_counter()
+        deployed = self.deployed_index_id or config.VERTEX_DEPLOYED_INDEX_ID
+        if not deployed:
+            raise config.SettingsError("VERTEX_DEPLOYED_INDEX_ID must be set for queries.")
+
+        # Import namespace helper for filtering
+        from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import Namespace
+
+        categorical_filters = []
+        if paper_ids:
+            categorical_filters.append(Namespace(name="paper_id", allow_tokens=paper_ids))
+
+        # find_neighbors returns a list of lists (one per query)
+        neighbors_list = endpoint.find_neighbors(
+            deployed_index_id=deployed,
+            queries=[query_vector],
+            num_neighbors=top_k,
+            filter=categorical_filters,
+        )
+        _timings.record(
+            "query", (resolved - started) * 1000, (time.perf_counter() - resolved) * 1000
+        )
+
+        if not neighbors_list:
+            return []
+
+        # Get results for the single query we sent
+        matches = neighbors_list[0]
+        results = []
+        for match in matches:
+            # MatchNeighbor object has 'id' and 'distance' properties
+            results.append(
+                {
+                    "id": match.id,
+                    "score": match.distance,
+                    # Safe defaults since accessing metadata caused issues
+                    "metadata": {},
+                    "namespace_filters": [],
+                }
+            )
+        return results
+
+    def delete(
+        self, paper_id: str, chunk_count: Optional[int] = None, *, start_index: int = 0
+    ) -> None:
+        """Remove datapoints ``[start_index, chunk_count)``; Vertex needs explicit IDs."""
+        if not chunk_count or chunk_count <= start_index:
+            return
+        _get_index().remove_datapoints(
+            datapoint_ids=[f"{paper_id}-{i}" for i in range(start_index, chunk_count)]
+        )
+
+    def close(self) -> None:
+        pass
+
+
+_store: VectorStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> VectorStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if config.VECTOR_BACKEND == "local":
+                    from services.ivf_index import IVFIndex
+                    from services.local_vector_store import LocalVectorStore
+
+                    ann = None
+                    if config.LOCAL_VECTOR_ANN == "ivf":
+                        ann = IVFIndex(
+                            nlist=config.IVF_NLIST,
+                            nprobe=config.IVF_NPROBE,
+                            train_min=config.IVF_TRAIN_MIN,
+                        )
+                    _store = LocalVectorStore(
+                        config.LOCAL_VECTOR_DIR, ann=ann, exact_max_rows=config.ANN_EXACT_MAX_ROWS
+                    )
+                elif config.VECTOR_BACKEND == "vertex":
+                    _store = VertexVectorStore()
+                else:
+                    raise config.SettingsError(
+                        f"Unknown VECTOR_BACKEND '{config.VECTOR_BACKEND}' (expected 'vertex' or 'local')."
+                    )
+    return _store
 
 
 def upsert_embeddings(
@@ -32,27 +244,7 @@ def upsert_embeddings(
     deployed_index_id: Optional[str] = None,
     start_index: int = 0,
 ) -> None:
-    # Upserts must be done on the Index resource, not the Endpoint
-    index = _get_index()
-
-    datapoints = []
-    for i, vector in enumerate(embeddings):
-        # Construct the v1 IndexDatapoint
-        datapoints.append(
-            IndexDatapoint(
-                datapoint_id=f"{paper_id}-{start_index + i}",
-                feature_vector=vector,
-                restricts=[
-                    IndexDatapoint.Restriction(
-                        namespace="paper_id", 
-                        allow_list=[paper_id]
-                    )
-                ],
-            )
-        )
-    
-    # Call upsert on the Index object
-    index.upsert_datapoints(datapoints=datapoints)
+    get_store().upsert(paper_id, embeddings, start_index=start_index)
 
 
 def query(
@@ -62,42 +254,25 @@ def query(
     top_k: int,
     deployed_index_id: Optional[str] = None,
 ) -> List[dict]:
-    # Queries must be done on the Index Endpoint
-    endpoint = _get_endpoint()
-    deployed = deployed_index_id or config.VERTEX_DEPLOYED_INDEX_ID
-    if not deployed:
-        raise config.SettingsError("VERTEX_DEPLOYED_INDEX_ID must be set for queries.")
-
-    # Import namespace helper for filtering
-    from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import Namespace
-
-    categorical_filters = []
-    if paper_ids:
-        categorical_filters.append(Namespace(name="paper_id", allow_tokens=paper_ids))
-
-    # find_neighbors returns a list of lists (one per query)
-    neighbors_list = endpoint.find_neighbors(
-        deployed_index_id=deployed,
-        queries=[query_vector],
-        num_neighbors=top_k,
-        filter=categorical_filters,
-    )
-    
-    if not neighbors_list:
-        return []
-
-    # Get results for the single query we sent
-    matches = neighbors_list[0]
-    results = []
-    for match in matches:
-        # MatchNeighbor object has 'id' and 'distance' properties
-        results.append(
-            {
-                "id": match.id,
-                "score": match.distance,
-                # Safe defaults since accessing metadata caused issues
-                "metadata": {}, 
-                "namespace_filters": [],
-            }
-        )
-    return results
\ No newline at end of file
+    store = get_store()
+    if deployed_index_id and isinstance(store, VertexVectorStore):
+        store = VertexVectorStore(deployed_index_id)
+    return store.query(query_vector, paper_ids, top_k)
+
+
+def delete_paper(
+    paper_id: str, chunk_count: Optional[int] = None, *, start_index: int = 0
+) -> None:
+    """Delete a paper's vectors, or only those from chunk ``start_index`` on."""
+    get_store().delete(paper_id, chunk_count, start_index=start_index)
+
+
+def close() -> None:
+    """Save the local store's ANN index so the next start does not re-assign every row."""
+    if _store is not None:
+        _store.close()
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """Average Vertex resolve vs. call time per operation (empty for the local backend)."""
+    return _timings.stats()
@@ -0,0 +1,29 @@
+import os
+
+# config reads the environment at import time; the services only need a project id.
+os.environ.setdefault("PROJECT_ID", "test")
+
+import pytest  # noqa: E402
+
+from tests.fakes import AsyncFakeFirestore, FakeFirestore  # noqa: E402
+
+
+@pytest.fixture
+def firestore_db(monkeypatch):
+    """A fake sync Firestore client installed in ``services.storage``."""
+    from services import storage
+
+    db = FakeFirestore()
+    monkeypatch.setattr(storage, "_db", db)
+    return db
+
+
+@pytest.fixture
+def async_firestore_db():
+    """A fake AsyncClient installed in ``services.async_storage``."""
+    from services import async_storage
+
+    db = AsyncFakeFirestore()
+    async_storage.set_client(db)
+    yield db
+    async_storage.set_client(None)
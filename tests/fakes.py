@@ -0,0 +1,240 @@
+"""In-memory stand-ins for the Firestore clients used by the services.
+
+Only the calls the services make are implemented: documents with merge and
+``ArrayUnion``, batches, ``get_all`` (with ``field_paths``), and queries with
+``where``/``order_by``/``limit``. Reads and writes are counted so tests can
+assert on round trips.
+"""
+from __future__ import annotations
+
+import copy
+import operator
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from google.api_core import exceptions
+from google.cloud import firestore
+
+_OPS = {
+    "==": operator.eq,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda value, allowed: value in allowed,
+}
+
+
+def _merge(current: Optional[Dict], data: Dict, merge: bool) -> Dict:
+    merged = dict(current or {}) if merge else {}
+    for key, value in data.items():
+        if isinstance(value, firestore.ArrayUnion):
+            values = list(merged.get(key, []))
+            values.extend(v for v in value.values if v not in values)
+            merged[key] = values
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _project(data: Optional[Dict], field_paths: Optional[Iterable[str]]) -> Optional[Dict]:
+    if data is None or field_paths is None:
+        return data
+    return {path: data[path] for path in field_paths if path in data}
+
+
+class Snapshot:
+    def __init__(self, doc_id: str, data: Optional[Dict]) -> None:
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = None
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data)
+
+
+class _Store:
+    def __init__(self) -> None:
+        self.data: Dict[str, Dict[str, Dict]] = {}
+        self.reads = 0
+        self.writes = 0
+
+    def docs(self, path: str) -> Dict[str, Dict]:
+        return self.data.setdefault(path, {})
+
+
+class _Query:
+    def __init__(self, store: _Store, path: str, filters=(), order=None, limit=None) -> None:
+        self._store = store
+        self._path = path
+        self._filters = list(filters)
+        self._order = order
+        self._limit = limit
+
+    def where(self, *, filter: firestore.FieldFilter) -> "_Query":
+        return type(self)(self._store, self._path, self._filters + [filter], self._order, self._limit)
+
+    def order_by(self, field: str, direction: str = firestore.Query.ASCENDING) -> "_Query":
+        return type(self)(self._store, self._path, self._filters, (field, direction), self._limit)
+
+    def limit(self, count: int) -> "_Query":
+        return type(self)(self._store, self._path, self._filters, self._order, count)
+
+    def _results(self) -> List[Snapshot]:
+        items = list(self._store.docs(self._path).items())
+        for f in self._filters:
+            items = [
+                (doc_id, data)
+                for doc_id, data in items
+                if f.field_path in data and _OPS[f.op_string](data[f.field_path], f.value)
+            ]
+        if self._order:
+            field, direction = self._order
+            items.sort(key=lambda item: item[1][field], reverse=direction == firestore.Query.DESCENDING)
+        if self._limit is not None:
+            items = items[: self._limit]
+        self._store.reads += len(items)
+        return [Snapshot(doc_id, copy.deepcopy(data)) for doc_id, data in items]
+
+
+# --- sync client -------------------------------------------------------------
+
+
+class DocumentReference:
+    def __init__(self, store: _Store, path: str, doc_id: str) -> None:
+        self._store = store
+        self._path = path
+        self.id = doc_id
+
+    def set(self, data: Dict, merge: bool = False) -> None:
+        self._store.writes += 1
+        docs = self._store.docs(self._path)
+        docs[self.id] = _merge(docs.get(self.id), data, merge)
+
+    def create(self, data: Dict) -> None:
+        if self.id in self._store.docs(self._path):
+            raise exceptions.AlreadyExists(f"{self._path}/{self.id}")
+        DocumentReference.set(self, data)
+
+    def get(self, field_paths: Optional[Iterable[str]] = None, transaction=None) -> Snapshot:
+        self._store.reads += 1
+        return Snapshot(self.id, _project(copy.deepcopy(self._store.docs(self._path).get(self.id)), field_paths))
+
+    def delete(self, option=None) -> None:
+        self._store.writes += 1
+        self._store.docs(self._path).pop(self.id, None)
+
+    def collection(self, name: str) -> "CollectionReference":
+        return CollectionReference(self._store, f"{self._path}/{self.id}/{name}")
+
+
+class CollectionReference(_Query):
+    def __init__(self, store: _Store, path: str, *args) -> None:
+        super().__init__(store, path, *args)
+
+    def document(self, doc_id: Optional[str] = None) -> DocumentReference:
+        return DocumentReference(self._store, self._path, doc_id or uuid.uuid4().hex)
+
+    def add(self, data: Dict):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def stream(self):
+        return iter(self._results())
+
+
+class WriteBatch:
+    def __init__(self) -> None:
+        self._ops: List = []
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def set(self, ref: DocumentReference, data: Dict, merge: bool = False) -> None:
+        self._ops.append(lambda: ref.set(data, merge=merge))
+
+    def delete(self, ref: DocumentReference) -> None:
+        self._ops.append(ref.delete)
+
+    def commit(self) -> None:
+        assert len(self._ops) <= 500, "Firestore batches hold at most 500 writes"
+        for op in self._ops:
+            op()
+
+
+class FakeFirestore:
+    def __init__(self, shared: Optional["FakeFirestore"] = None) -> None:
+        # ``shared`` makes a sync and an async fake see the same documents.
+        self._store = shared._store if shared is not None else _Store()
+
+    @property
+    def data(self) -> Dict[str, Dict[str, Dict]]:
+        return self._store.data
+
+    @property
+    def reads(self) -> int:
+        return self._store.reads
+
+    @property
+    def writes(self) -> int:
+        return self._store.writes
+
+    def collection(self, name: str) -> CollectionReference:
+        return CollectionReference(self._store, name)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch()
+
+    def get_all(self, references, field_paths: Optional[Iterable[str]] = None):
+        return [ref.get(field_paths=field_paths) for ref in references]
+
+
+# --- async client ------------------------------------------------------------
+
+
+class AsyncDocumentReference(DocumentReference):
+    async def set(self, data: Dict, merge: bool = False) -> None:
+        DocumentReference.set(self, data, merge)
+
+    async def create(self, data: Dict) -> None:
+        DocumentReference.create(self, data)
+
+    async def get(self, field_paths: Optional[Iterable[str]] = None, transaction=None) -> Snapshot:
+        return DocumentReference.get(self, field_paths)
+
+    async def delete(self, option=None) -> None:
+        DocumentReference.delete(self)
+
+    def collection(self, name: str) -> "AsyncCollectionReference":
+        return AsyncCollectionReference(self._store, f"{self._path}/{self.id}/{name}")
+
+
+class AsyncCollectionReference(_Query):
+    def __init__(self, store: _Store, path: str, *args) -> None:
+        super().__init__(store, path, *args)
+
+    def document(self, doc_id: Optional[str] = None) -> AsyncDocumentReference:
+        return AsyncDocumentReference(self._store, self._path, doc_id or uuid.uuid4().hex)
+
+    async def add(self, data: Dict):
+        ref = self.document()
+        await ref.set(data)
+        return None, ref
+
+    async def stream(self):
+        for snapshot in self._results():
+            yield snapshot
+
+
+class AsyncFakeFirestore(FakeFirestore):
+    def collection(self, name: str) -> AsyncCollectionReference:
+        return AsyncCollectionReference(self._store, name)
+
+    async def get_all(self, references, field_paths: Optional[Iterable[str]] = None):
+        for ref in references:
+            yield await ref.get(field_paths=field_paths)
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from services.answer_cache import AnswerCache, refers_back
+
+
+def make_cache(**overrides):
+    settings = dict(max_bytes=1 << 20, ttl_seconds=60, threshold=0.95, per_set=4)
+    settings.update(overrides)
+    return AnswerCache(**settings)
+
+
+def store(cache, paper_ids, vector, answer, top_k=5, retrieved_at=None):
+    cache.store(
+        paper_ids, top_k, vector, answer, 100.0,
+        retrieved_at=time.monotonic() if retrieved_at is None else retrieved_at,
+    )
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What are its limitations?",
+        "Why is that?",
+        "Can you elaborate on the second point?",
+        "What did you mention earlier about the dataset?",
+        "Explain the above in simpler terms.",
+        "How do they evaluate it?",
+    ],
+)
+def test_follow_ups_refer_back(question):
+    assert refers_back(question)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What is the main contribution of this paper?",
+        "Which datasets does this work use?",
+        "Summarize these results for a beginner.",
+        "Is the method in that section novel?",
+        "What items are in the benchmark?",
+    ],
+)
+def test_standalone_questions_do_not_refer_back(question):
+    assert not refers_back(question)
+
+
+def test_similar_question_hits_same_paper_set_in_any_order():
+    cache = make_cache()
+    store(cache, ["b", "a"], [1.0, 0.0], "answer")
+    hit = cache.lookup(["a", "b"], 5, [0.99, 0.05])
+    assert hit is not None and hit.answer == "answer"
+    assert cache.lookup(["a", "b"], 5, [0.0, 1.0]) is None
+    assert cache.lookup(["a"], 5, [1.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_top_k_is_part_of_the_key():
+    cache = make_cache()
+    store(cache, ["a"], [1.0, 0.0], "from five chunks", top_k=5)
+    assert cache.lookup(["a"], 10, [1.0, 0.0]) is None
+    assert cache.lookup(["a"], 5, [1.0, 0.0]).answer == "from five chunks"
+
+
+def test_answers_expire():
+    cache = make_cache(ttl_seconds=0.01)
+    store(cache, ["a"], [1.0, 0.0], "answer")
+    time.sleep(0.02)
+    assert cache.lookup(["a"], 5, [1.0, 0.0]) is None
+
+
+def test_invalidation_drops_sets_and_refuses_answers_retrieved_before_it():
+    cache = make_cache()
+    retrieved_at = time.monotonic()
+    store(cache, ["a", "b"], [1.0, 0.0], "stale")
+    store(cache, ["c"], [1.0, 0.0], "unrelated")
+    cache.invalidate_paper("a")
+    assert cache.lookup(["a", "b"], 5, [1.0, 0.0]) is None
+    assert cache.lookup(["c"], 5, [1.0, 0.0]) is not None
+
+    store(cache, ["a"], [1.0, 0.0], "generated during re-ingestion", retrieved_at=retrieved_at)
+    assert cache.lookup(["a"], 5, [1.0, 0.0]) is None
+    store(cache, ["a"], [1.0, 0.0], "fresh")
+    assert cache.lookup(["a"], 5, [1.0, 0.0]).answer == "fresh"
+
+
+def test_invalidation_timestamps_are_pruned_after_the_ttl():
+    cache = make_cache(ttl_seconds=0.01)
+    for i in range(100):
+        cache.invalidate_paper(f"p{i}")
+    time.sleep(0.02)
+    cache.invalidate_paper("last")
+    assert list(cache._invalidated_at) == ["last"]
+
+
+def test_each_set_keeps_its_newest_answers():
+    cache = make_cache(per_set=2)
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        store(cache, ["a"], vector, f"answer {i}")
+    assert cache.lookup(["a"], 5, [1.0, 0.0, 0.0]) is None
+    assert cache.lookup(["a"], 5, [0.0, 0.0, 1.0]).answer == "answer 2"
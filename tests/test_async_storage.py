@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import config
+from services import async_storage, chunk_cache, storage
+from tests.fakes import AsyncFakeFirestore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def fresh_chunk_cache(monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_CACHE_ENABLED", True)
+    monkeypatch.setattr(chunk_cache, "_cache", chunk_cache.ChunkCache(1 << 20, 60))
+
+
+def test_summaries_round_trip(async_firestore_db):
+    run(async_storage.persist_summary("p", "a summary"))
+    assert run(async_storage.fetch_summary("p")) == "a summary"
+    assert run(async_storage.fetch_summary("missing")) is None
+    assert run(async_storage.fetch_summary("")) is None
+
+
+def test_find_manifest_by_hash(async_firestore_db):
+    manifests = async_firestore_db.data.setdefault(config.MANIFESTS_COLLECTION, {})
+    manifests["p"] = {"paper_id": "p", "content_hash": "abc"}
+    assert run(async_storage.find_manifest_by_hash("abc"))["paper_id"] == "p"
+    assert run(async_storage.find_manifest_by_hash("def")) is None
+
+
+def test_chunk_reads_go_through_the_cache(async_firestore_db, fresh_chunk_cache, monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_LAYOUT", "documents")
+    chunks = async_firestore_db.data.setdefault(config.CHUNKS_COLLECTION, {})
+    for i in range(3):
+        chunks[f"p-{i}"] = {"paper_id": "p", "chunk_index": i, "text": f"text {i}"}
+
+    assert run(async_storage.fetch_chunk_range("p", 0, 5)) == ["text 0", "text 1", "text 2"]
+    reads = async_firestore_db.reads
+    found = run(async_storage.fetch_chunks(["p-2", "p-0"]))
+    assert found["p-2"]["text"] == "text 2"
+    assert async_firestore_db.reads == reads
+
+
+def test_packed_chunks_written_by_ingestion_are_readable(firestore_db, fresh_chunk_cache, monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_LAYOUT", "packed")
+    monkeypatch.setattr(config, "ANSWER_CACHE_ENABLED", False)
+    texts = [f"chunk {i}" for i in range(40)]
+    storage.persist_chunks("p", texts, pages=[(i // 10 + 1, i // 10 + 1) for i in range(40)])
+    # Papers stored before the switch to packed storage are still per-chunk documents.
+    firestore_db.collection(config.CHUNKS_COLLECTION).document("old-0").set({"text": "legacy"})
+
+    async_storage.set_client(AsyncFakeFirestore(shared=firestore_db))
+    try:
+        found = run(async_storage.fetch_chunks(["p-0", "p-17", "p-39", "p-40", "old-0"]))
+    finally:
+        async_storage.set_client(None)
+    assert found["p-17"] == {
+        "paper_id": "p", "chunk_index": 17, "text": "chunk 17", "page_start": 2, "page_end": 2
+    }
+    assert found["p-39"]["text"] == "chunk 39"
+    assert found["old-0"]["text"] == "legacy"
+    assert "p-40" not in found
+
+
+def test_create_user_refuses_duplicates(async_firestore_db):
+    assert run(async_storage.create_user("ada", "student"))
+    assert not run(async_storage.create_user("ada", "admin"))
+    assert not run(async_storage.create_user("", "admin"))
+    users = run(async_storage.list_users())
+    assert [(u["username"], u["role"]) for u in users] == [("ada", "student")]
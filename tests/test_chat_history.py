@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import config
+from services import async_storage, chat_history, storage
+from tests.fakes import AsyncFakeFirestore
+
+
+def make_buffer(**overrides):
+    settings = dict(tail=4, max_sessions=10, idle_seconds=60, flush_seconds=0.01, max_batch=50)
+    settings.update(overrides)
+    return chat_history.ChatHistoryBuffer(**settings)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def turn(buffer, i, size=10):
+    buffer.history("s")
+    buffer.append("s", [("user", f"question {i} " + "q" * size), ("ai", f"answer {i} " + "a" * size)])
+
+
+def test_turns_are_cached_and_written_behind(firestore_db):
+    buffer = make_buffer()
+    for i in range(3):
+        turn(buffer, i)
+    assert buffer.history("s")[-1].startswith("AI: answer 2")
+    assert len(buffer.history("s")) == 4
+    buffer.close()
+    assert buffer.stats()["loads"] == 1
+    assert len(storage.fetch_recent_messages("s", 100)) == 6
+
+    reloaded = make_buffer()
+    assert reloaded.history("s") == buffer.history("s")
+    reloaded.close()
+
+
+def test_failed_writes_are_retried(firestore_db, monkeypatch):
+    save = storage.save_chat_messages
+    failures = []
+
+    def flaky(messages):
+        if not failures:
+            failures.append(len(messages))
+            raise RuntimeError("unavailable")
+        save(messages)
+
+    monkeypatch.setattr(storage, "save_chat_messages", flaky)
+    buffer = make_buffer()
+    turn(buffer, 0)
+    wait_for(lambda: buffer.stats()["write_errors"] == 1)
+    buffer.close()
+    assert failures == [2]
+    assert len(storage.fetch_recent_messages("s", 100)) == 2
+
+
+def test_compaction_triggers_on_tokens_only(firestore_db):
+    calls = []
+
+    def summarize(summary, lines):
+        calls.append(lines)
+        return f"{summary} +{len(lines)}".strip()
+
+    buffer = make_buffer(summarize=summarize, verbatim=2, summary_trigger_tokens=200)
+    for i in range(10):
+        turn(buffer, i, size=5)
+    # Twenty short messages are well under the trigger: nothing is folded.
+    assert calls == []
+    assert len(buffer.history("s")) == 20
+
+    # Once a long turn is past the verbatim messages, everything before them is folded.
+    turn(buffer, 10, size=800)
+    turn(buffer, 11, size=5)
+    wait_for(lambda: buffer.stats()["summaries"] == 1)
+    history = buffer.history("s")
+    assert history[0] == "SUMMARY OF EARLIER CONVERSATION: +22"
+    assert len(history) == 3
+    buffer.close()
+
+    reloaded = make_buffer(summarize=summarize, verbatim=2, summary_trigger_tokens=200)
+    assert reloaded.history("s") == history
+    reloaded.close()
+
+
+def test_failed_folds_keep_messages_until_one_succeeds(firestore_db, monkeypatch):
+    monkeypatch.setattr(chat_history, "_SUMMARY_RETRY_SECONDS", 0.0)
+    attempts = []
+
+    def summarize(summary, lines):
+        attempts.append(len(lines))
+        if len(attempts) < 3:
+            raise RuntimeError("model unavailable")
+        return "summary"
+
+    buffer = make_buffer(summarize=summarize, verbatim=2, summary_trigger_tokens=40)
+    for i in range(6):
+        turn(buffer, i, size=100)
+        wait_for(lambda: not buffer._sessions["s"].summarizing)
+    wait_for(lambda: buffer.stats()["summaries"] >= 1)
+    assert buffer.stats()["summary_errors"] == 2
+    # Every message was either folded or is still held: none fell out unsummarized.
+    wait_for(
+        lambda: buffer.stats()["messages_summarized"] + len(buffer._sessions["s"].messages) == 12
+    )
+    assert buffer.history("s")[0] == "SUMMARY OF EARLIER CONVERSATION: summary"
+    buffer.close()
+
+
+def test_failed_fold_backs_off(firestore_db):
+    attempts = []
+
+    def summarize(summary, lines):
+        attempts.append(len(lines))
+        raise RuntimeError("model unavailable")
+
+    buffer = make_buffer(summarize=summarize, verbatim=2, summary_trigger_tokens=40)
+    for i in range(4):
+        turn(buffer, i, size=100)
+        wait_for(lambda: not buffer._sessions["s"].summarizing)
+    assert len(attempts) == 1
+    assert len(buffer._sessions["s"].messages) == 8
+    # The prompt stays within twice the trigger while folds fail.
+    assert len(buffer.history("s")) == 2
+    buffer.close()
+
+
+def test_summary_without_write_behind_is_reported(monkeypatch, caplog):
+    monkeypatch.setattr(config, "CHAT_HISTORY_SUMMARY", True)
+    monkeypatch.setattr(config, "CHAT_HISTORY_WRITE_BEHIND", False)
+    with caplog.at_level(logging.WARNING):
+        chat_history.check_settings()
+    assert "CHAT_HISTORY_WRITE_BEHIND" in caplog.text
+
+
+@pytest.fixture
+def both_clients(firestore_db):
+    """Sync and async fakes over the same documents."""
+    async_storage.set_client(AsyncFakeFirestore(shared=firestore_db))
+    yield firestore_db
+    async_storage.set_client(None)
+
+
+def test_async_history_loads_through_the_async_client(both_clients):
+    writer = make_buffer()
+    for i in range(3):
+        turn(writer, i)
+    writer.close()
+    reads = both_clients.reads
+
+    buffer = make_buffer()
+    lines = asyncio.run(buffer.history_async("s"))
+    assert lines == writer.history("s")
+    assert both_clients.reads > reads
+    reads = both_clients.reads
+    assert asyncio.run(buffer.history_async("s")) == lines
+    assert both_clients.reads == reads
+    assert buffer.stats()["loads"] == 1 and buffer.stats()["cached_reads"] == 1
+    buffer.close()
+
+
+def test_async_history_reads_only_messages_after_the_stored_summary(both_clients):
+    start = datetime.utcnow()
+    for i in range(4):
+        storage._messages("s").add(
+            {"role": "user", "content": f"turn {i}", "timestamp": start + timedelta(seconds=i)}
+        )
+    storage.save_session_summary("s", "earlier turns", start + timedelta(seconds=1))
+
+    buffer = make_buffer(summarize=lambda summary, lines: summary, summary_trigger_tokens=1000)
+    assert asyncio.run(buffer.history_async("s")) == [
+        "SUMMARY OF EARLIER CONVERSATION: earlier turns",
+        "USER: turn 2",
+        "USER: turn 3",
+    ]
+    buffer.close()
+
+
+def test_direct_history_goes_through_the_async_client(async_firestore_db, monkeypatch):
+    monkeypatch.setattr(config, "CHAT_HISTORY_WRITE_BEHIND", False)
+
+    async def scenario():
+        await chat_history.append("s", [("user", "question"), ("ai", "answer")])
+        return await chat_history.load("s")
+
+    # Direct writes are timestamped one by one and may tie, so order is not checked.
+    assert sorted(asyncio.run(scenario())) == ["AI: answer", "USER: question"]
+
+
+@pytest.fixture(autouse=True)
+def _no_shared_buffer():
+    yield
+    chat_history.shutdown()
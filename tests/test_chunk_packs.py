@@ -0,0 +1,70 @@
+import pytest
+
+import config
+from services import chunk_packs, storage
+
+
+def test_blocks_round_trip_with_pages():
+    blob = chunk_packs.encode_block(["één", "two"], [(1, 2), None])
+    assert chunk_packs.decode_block(blob) == [("één", 1, 2), ("two", None, None)]
+
+
+def test_each_block_is_its_own_pack():
+    texts = [f"chunk {i}" for i in range(40)]
+    packs = chunk_packs.build_packs("p", texts, start_index=10)
+    assert [(p["doc"], p["start"], p["count"]) for p in packs] == [
+        ("p-10", 10, 16),
+        ("p-26", 26, 16),
+        ("p-42", 42, 8),
+    ]
+    assert chunk_packs.locate(packs, 45) == ("p-42", 3)
+    assert chunk_packs.locate(packs, 50) is None
+    assert chunk_packs.locate(packs, 9) is None
+
+
+def test_chunks_are_read_through_the_directory():
+    texts = [f"chunk {i}" for i in range(40)]
+    packs = chunk_packs.build_packs("p", texts)
+    directory = {"packs": [{k: p[k] for k in ("doc", "start", "count")} for p in packs]}
+    docs = {p["doc"]: {"block": p["block"]} for p in packs}
+
+    wanted = chunk_packs.group_by_paper(["p-0", "p-33", "bad", "p-x"])
+    locations = chunk_packs.locate_chunks(wanted, {"p": directory})
+    assert locations["p-33"] == ("p-32", 1, "p", 33)
+    found = chunk_packs.read_chunks(locations, docs)
+    assert [found[cid]["text"] for cid in ("p-0", "p-33")] == ["chunk 0", "chunk 33"]
+    assert chunk_packs.paper_texts(directory, docs) == texts
+
+
+@pytest.fixture
+def packed(firestore_db, monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_LAYOUT", "packed")
+    monkeypatch.setattr(config, "CHUNK_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "ANSWER_CACHE_ENABLED", False)
+    return firestore_db
+
+
+def test_lookups_read_only_the_blocks_they_need(packed):
+    texts = [f"chunk {i}" for i in range(100)]
+    storage.persist_chunks("p", texts, pages=[(i + 1, i + 1) for i in range(100)])
+    assert len(packed.data[config.CHUNK_PACKS_COLLECTION]) == 7
+
+    reads = packed.reads
+    found = storage.fetch_chunks(["p-3", "p-5", "p-70"])
+    # The directory plus the two blocks holding the chunks.
+    assert packed.reads - reads == 3
+    assert found["p-70"] == {
+        "paper_id": "p", "chunk_index": 70, "text": "chunk 70", "page_start": 71, "page_end": 71
+    }
+    assert storage.fetch_chunks_for_papers(["p"]) == texts
+
+
+def test_streamed_appends_and_rewrites(packed):
+    storage.persist_chunks("p", [f"a{i}" for i in range(20)])
+    storage.persist_chunks("p", [f"a{i}" for i in range(20, 40)], start_index=20)
+    assert storage.fetch_chunk_range("p", 18, 4) == ["a18", "a19", "a20", "a21"]
+
+    # A shorter re-ingestion replaces the directory and drops the packs it no longer lists.
+    storage.persist_chunks("p", ["b0", "b1"])
+    assert sorted(packed.data[config.CHUNK_PACKS_COLLECTION]) == ["p-0"]
+    assert storage.fetch_chunks_for_papers(["p"]) == ["b0", "b1"]
@@ -0,0 +1,101 @@
+import pytest
+
+import config
+from ingestion import chunking
+from ingestion.chunking import Chunk, fixed_chunks, page_header, structured_chunks
+from services.embedding import estimate_tokens
+
+
+def _document(pages):
+    return "".join(page_header(number) + text for number, text in enumerate(pages, start=1))
+
+
+def _pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _sentences(prefix, count):
+    return " ".join(f"{prefix} sentence number {i} says something useful." for i in range(count))
+
+
+def test_fixed_chunks_are_the_same_whatever_the_piece_size():
+    text = _document(["a" * 1500, "b" * 1500])
+    whole = list(fixed_chunks([text]))
+    assert list(fixed_chunks(_pieces(text, 37))) == whole
+    assert all(len(chunk.text) <= 1000 for chunk in whole)
+    assert whole[0].page_start == 1
+    assert whole[-1].page_end == 2
+    assert any(chunk.page_start == 1 and chunk.page_end == 2 for chunk in whole)
+
+
+def test_fixed_chunks_overlap_by_200_characters():
+    text = "".join(chr(ord("a") + i % 26) for i in range(2500))
+    chunks = list(fixed_chunks([text]))
+    assert chunks[0].text[-200:] == chunks[1].text[:200]
+
+
+def test_structured_chunks_respect_the_token_budget_and_keep_sentences_whole():
+    text = _document([_sentences("First", 40), _sentences("Second", 40)])
+    chunks = list(structured_chunks([text], max_tokens=60, overlap_tokens=0))
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert estimate_tokens(chunk.text) <= 60 + 5  # separators are not budgeted
+        assert chunk.text.endswith(".")
+        assert chunk.text[0].isupper()
+    assert chunks[0].page_start == 1
+    assert chunks[-1].page_end == 2
+
+
+def test_structured_chunks_break_at_headings_without_overlap():
+    text = _document([
+        "1 Introduction\n" + _sentences("Intro", 3) + "\n\n2 Methods\n" + _sentences("Method", 3)
+    ])
+    chunks = list(structured_chunks([text], max_tokens=500, overlap_tokens=50))
+    assert [chunk.text.split("\n")[0] for chunk in chunks] == ["1 Introduction", "2 Methods"]
+    assert "Intro" not in chunks[1].text
+
+
+def test_structured_chunks_overlap_when_cut_mid_paragraph():
+    text = _document([_sentences("Body", 30)])
+    chunks = list(structured_chunks([text], max_tokens=60, overlap_tokens=15))
+    first_tail = chunks[0].text.rsplit(". ", 1)[-1]
+    assert chunks[1].text.startswith(first_tail)
+
+
+def test_structured_chunks_track_sentences_across_pages():
+    text = _document(["It starts on one page and", "ends on the next. Then more text follows here."])
+    chunks = list(structured_chunks([text], max_tokens=500, overlap_tokens=0))
+    assert chunks == [
+        Chunk("It starts on one page and ends on the next. Then more text follows here.", 1, 2)
+    ]
+
+
+def test_structured_chunks_rejoin_hyphenated_words_and_skip_abbreviations():
+    text = _document(["The experi-\nment follows Smith et al. and works. Fig. 2 shows it."])
+    chunks = list(structured_chunks([text], max_tokens=500, overlap_tokens=0))
+    assert chunks[0].text == "The experiment follows Smith et al. and works. Fig. 2 shows it."
+
+
+def test_structured_chunks_split_run_on_text_by_words():
+    text = _document([" ".join(["word"] * 400)])
+    chunks = list(structured_chunks([text], max_tokens=50, overlap_tokens=0))
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk.text) <= 50 for chunk in chunks)
+    assert sum(len(chunk.text.split()) for chunk in chunks) == 400
+
+
+def test_structured_chunks_are_the_same_whatever_the_piece_size():
+    text = _document([_sentences("First", 20) + "\n\n2 Results\n" + _sentences("Second", 20)] * 3)
+    whole = list(structured_chunks([text], max_tokens=80, overlap_tokens=20))
+    assert list(structured_chunks(_pieces(text, 53), max_tokens=80, overlap_tokens=20)) == whole
+
+
+def test_chunk_text_selects_the_configured_chunker(monkeypatch):
+    text = _document([_sentences("Body", 5)])
+    monkeypatch.setattr(config, "CHUNKER", "structured")
+    assert list(chunking.chunk_text([text])) == list(structured_chunks([text]))
+    monkeypatch.setattr(config, "CHUNKER", "fixed")
+    assert list(chunking.chunk_text([text])) == list(fixed_chunks([text]))
+    monkeypatch.setattr(config, "CHUNKER", "other")
+    with pytest.raises(config.SettingsError):
+        chunking.chunk_text([text])
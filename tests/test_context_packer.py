@@ -0,0 +1,62 @@
+from agents import context_packer
+from agents.context_packer import overlap, pack_contexts
+
+TEXT = "".join(f"Sentence {i} of the paper body. " for i in range(60))
+
+
+def _chunk(index, start, end, paper_id="p", **extra):
+    return {"paper_id": paper_id, "chunk_index": index, "text": TEXT[start:end], **extra}
+
+
+def test_overlap_finds_shared_span_and_ignores_short_coincidences():
+    assert overlap("x" * 10 + "0123456789abcdefgh", "0123456789abcdefgh tail") == 18
+    assert overlap("ends with abc", "abc starts") == 0  # under the 16-character minimum
+
+
+def test_neighbouring_chunks_merge_without_repeating_the_overlap():
+    chunks = [_chunk(1, 300, 700), _chunk(0, 0, 400), _chunk(2, 600, 1000)]
+    packed = pack_contexts(chunks, budget_tokens=0)
+    assert packed == [{"paper_id": "p", "chunk_index": 0, "text": TEXT[0:1000]}]
+
+
+def test_gaps_and_papers_make_separate_passages_in_relevance_order():
+    chunks = [_chunk(5, 1200, 1500), _chunk(0, 0, 300), _chunk(0, 0, 300, paper_id="q")]
+    packed = pack_contexts(chunks, budget_tokens=0)
+    assert [(p["paper_id"], p["chunk_index"]) for p in packed] == [("p", 5), ("p", 0), ("q", 0)]
+
+
+def test_budget_counts_only_new_text():
+    # Each chunk is 100 tokens; the second adds only 50 new ones.
+    chunks = [_chunk(0, 0, 400), _chunk(1, 200, 600), _chunk(7, 1400, 1800)]
+    packed = pack_contexts(chunks, budget_tokens=160)
+    assert packed == [{"paper_id": "p", "chunk_index": 0, "text": TEXT[0:600]}]
+
+
+def test_first_chunk_is_truncated_to_an_undersized_budget():
+    packed = pack_contexts([_chunk(0, 0, 800)], budget_tokens=50)
+    assert packed[0]["text"] == TEXT[:200]
+
+
+def test_duplicates_and_loose_chunks():
+    loose = {"text": "no position here"}
+    chunks = [_chunk(0, 0, 300), _chunk(0, 0, 300), loose]
+    packed = pack_contexts(chunks, budget_tokens=0)
+    assert packed == [{"paper_id": "p", "chunk_index": 0, "text": TEXT[0:300]}, loose]
+
+
+def test_page_ranges_span_merged_chunks():
+    chunks = [
+        _chunk(0, 0, 400, page_start=1, page_end=1),
+        _chunk(1, 300, 700, page_start=1, page_end=2),
+    ]
+    packed = pack_contexts(chunks, budget_tokens=0)
+    assert (packed[0]["page_start"], packed[0]["page_end"]) == (1, 2)
+
+
+def test_stats_report_tokens_saved(monkeypatch):
+    monkeypatch.setattr(context_packer, "_totals", dict.fromkeys(context_packer._totals, 0))
+    pack_contexts([_chunk(0, 0, 400), _chunk(1, 200, 600)], budget_tokens=0)
+    stats = context_packer.stats()
+    assert stats["queries"] == 1 and stats["chunks"] == 2 and stats["passages"] == 1
+    assert stats["tokens_packed"] < stats["tokens_retrieved"]
+    assert stats["avg_tokens_packed"] == stats["tokens_packed"]
@@ -0,0 +1,68 @@
+import random
+import string
+
+import config
+from ingestion import pipeline
+from ingestion.dedup import DedupIndex, MinHasher, PaperDeduper, similarity
+
+FOOTER = "This work is licensed under a Creative Commons Attribution 4.0 International License."
+
+
+def _paper(n):
+    # Five chunks of made-up words that share no shingles with other chunks.
+    rng = random.Random(n)
+    return [
+        " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(6)) for _ in range(15))
+        for _ in range(5)
+    ]
+
+
+def _kept(deduper, texts):
+    return [text for text in texts if deduper.keep(text)]
+
+
+def test_signatures_ignore_case_and_digits():
+    hasher = MinHasher()
+    a = hasher.signature("arXiv:2401.01234v2 [cs.CL] 3 Jan 2024 Attention is all you need")
+    b = hasher.signature("ARXIV:2502.04321V1 [CS.CL] 19 JAN 2025 attention is all you need")
+    assert similarity(a, b) == 1.0
+    assert hasher.signature("  ...  ") is None
+
+
+def test_repeats_within_a_paper_are_dropped():
+    deduper = PaperDeduper("p", threshold=0.85)
+    texts = _paper(1)
+    assert _kept(deduper, texts + [texts[2], FOOTER, FOOTER]) == texts + [FOOTER]
+    stats = deduper.finish()
+    assert stats["dropped_within_paper"] == 2
+    assert stats["kept"] == 6
+
+
+def test_other_papers_do_not_affect_the_chunks_kept():
+    for n in range(3):
+        deduper = PaperDeduper(f"other-{n}", threshold=0.85)
+        _kept(deduper, _paper(n) + [FOOTER])
+        deduper.finish()
+
+    texts = _paper(9) + [FOOTER]
+    assert _kept(PaperDeduper("p", threshold=0.85), texts) == texts
+
+
+def test_index_matches_by_similarity():
+    hasher = MinHasher()
+    index = DedupIndex()
+    for i, text in enumerate(_paper(1)):
+        index.add(i, hasher.signature(text))
+    assert len(index) == 5
+    assert index.match(hasher.signature(_paper(1)[3]), 0.85) == 3
+    assert index.match(hasher.signature(_paper(2)[3]), 0.85) is None
+
+
+def test_dedup_settings_are_part_of_the_chunker_version(monkeypatch):
+    monkeypatch.setattr(config, "DEDUP_ENABLED", True)
+    monkeypatch.setattr(config, "DEDUP_THRESHOLD", 0.85)
+    base = pipeline.chunker_version(False)
+    monkeypatch.setattr(config, "DEDUP_THRESHOLD", 0.9)
+    assert pipeline.chunker_version(False) != base
+    monkeypatch.setattr(config, "DEDUP_ENABLED", False)
+    assert "dedup" not in pipeline.chunker_version(False)
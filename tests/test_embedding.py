@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from services import embedding
+
+
+@pytest.fixture
+def api_calls(monkeypatch):
+    calls = []
+
+    def call_api(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(embedding, "_call_api", call_api)
+    return calls
+
+
+def _batcher(**overrides):
+    options = dict(max_batch_size=16, max_batch_tokens=10_000, flush_ms=50, max_inflight=1)
+    options.update(overrides)
+    return embedding.EmbeddingBatcher(**options)
+
+
+def test_identical_texts_are_embedded_once_per_batch(api_calls):
+    batcher = _batcher(flush_ms=200)  # both callers land in one batch
+    results = {}
+
+    def embed(name, texts):
+        results[name] = batcher.embed(texts)
+
+    threads = [
+        threading.Thread(target=embed, args=("a", ["x", "yy", "x"])),
+        threading.Thread(target=embed, args=("b", ["yy", "zzz"])),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results["a"] == [[1.0], [2.0], [1.0]]
+    assert results["b"] == [[2.0], [3.0]]
+    assert sorted(text for call in api_calls for text in call) == ["x", "yy", "zzz"]
+    assert batcher.stats()["deduplicated"] == 2
+
+
+def test_duplicates_do_not_take_batch_slots(api_calls):
+    batcher = _batcher(max_batch_size=2, flush_ms=0)
+    assert batcher.embed(["a", "a", "a", "bb"]) == [[1.0], [1.0], [1.0], [2.0]]
+    assert api_calls == [["a", "bb"]]
+
+
+def test_api_error_reaches_every_caller(monkeypatch):
+    def fail(texts):
+        raise RuntimeError("quota")
+
+    monkeypatch.setattr(embedding, "_call_api", fail)
+    with pytest.raises(RuntimeError, match="quota"):
+        _batcher(flush_ms=0).embed(["a", "a"])
+
+
+def test_short_api_response_fails_every_caller(monkeypatch):
+    monkeypatch.setattr(embedding, "_call_api", lambda texts: [[1.0]] * (len(texts) - 1))
+    with pytest.raises(RuntimeError, match="1 vectors for 2 texts"):
+        _batcher(flush_ms=0).embed(["a", "bb"])
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import config
+from services import embedding, embedding_cache
+from services.embedding_cache import EmbeddingCache, cache_key
+
+
+@pytest.fixture
+def api_calls(monkeypatch):
+    calls = []
+
+    def call_api(texts):
+        calls.append(list(texts))
+        return [[0.1 * len(text), 1.0 / 3] for text in texts]
+
+    monkeypatch.setattr(embedding, "_call_api", call_api)
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "EMBEDDING_BATCHING", False)
+    monkeypatch.setattr(embedding_cache, "_cache", EmbeddingCache(1 << 20))
+    return calls
+
+
+def test_cache_hits_skip_the_api(api_calls):
+    first = embedding.embed_texts(["alpha", "beta", "alpha"])
+    assert api_calls == [["alpha", "beta"]]
+    assert embedding.embed_texts(["beta", "alpha"]) == [first[1], first[0]]
+    assert api_calls == [["alpha", "beta"]]
+    assert embedding.embed_texts(["alpha", "gamma"])[0] == first[0]
+    assert api_calls[-1] == ["gamma"]
+    stats = embedding_cache.get_cache().stats()
+    assert stats["memory_hits"] == 3 and stats["misses"] == 4
+
+
+def test_key_is_model_plus_normalized_text(monkeypatch):
+    monkeypatch.setattr(config, "EMBEDDING_MODEL", "model-a")
+    # NFC normalization and surrounding whitespace do not change the key.
+    assert cache_key("  café\n") == cache_key("café")
+    assert cache_key("cafe") != cache_key("Cafe")
+    assert cache_key("text") != cache_key("text", model="model-b")
+    assert cache_key("text") == cache_key("text", model="model-a")
+
+
+def test_vectors_round_trip_through_sqlite_as_float32(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    vector = [0.1, 1.0 / 3, -2.5]
+    as_float32 = np.asarray(vector, dtype=np.float32).tolist()
+
+    stored = EmbeddingCache(1 << 20, path).put_many(["t"], [vector])
+    assert stored == [as_float32]
+
+    reopened = EmbeddingCache(1 << 20, path)
+    assert reopened.get_many(["t", "other"]) == [as_float32, None]
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_memory_evicts_by_bytes_while_disk_keeps_entries(tmp_path):
+    # Two-dimensional float32 vectors take 8 bytes; memory holds two of them.
+    cache = EmbeddingCache(16, str(tmp_path / "embeddings.sqlite"))
+    cache.put_many(["a", "b", "c"], [[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]])
+    assert cache.stats()["memory_bytes"] == 16
+
+    assert cache.get_many(["a"]) == [[1.0, 1.0]]
+    stats = cache.stats()
+    assert stats["disk_hits"] == 1 and stats["memory_hits"] == 0
+    # The disk hit was promoted back into memory.
+    assert cache.get_many(["a"]) == [[1.0, 1.0]]
+    assert cache.stats()["memory_hits"] == 1
@@ -0,0 +1,92 @@
+import numpy as np
+
+from services.ivf_index import IVFIndex
+
+
+def _unit_vectors(count, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _trained(vectors, papers=2, **options):
+    index = IVFIndex(**{"nlist": 8, "nprobe": 2, **options})
+    per_paper = len(vectors) // papers
+    for code in range(papers):
+        rows = np.arange(code * per_paper, (code + 1) * per_paper)
+        index.add(rows, vectors[rows], code)
+    index.train(vectors)
+    return index
+
+
+def test_untrained_index_only_tracks_rows():
+    index = IVFIndex(train_min=10)
+    vectors = _unit_vectors(5)
+    index.add(np.arange(5), vectors, 0)
+    assert not index.trained
+    assert index.live_rows() == 5
+    assert index.assign_missing(vectors) == 0
+
+
+def test_search_finds_the_query_row_and_ranks_by_score():
+    vectors = _unit_vectors(400)
+    index = _trained(vectors)
+    rows, scores = index.search(vectors, vectors[123], 5)
+    assert rows[0] == 123
+    assert abs(scores[0] - 1.0) < 1e-5
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_paper_restricts_are_applied_while_scanning():
+    vectors = _unit_vectors(400)
+    index = _trained(vectors)
+    # Row 10 belongs to paper 0; restricted to paper 1 it must not come back.
+    rows, _ = index.search(vectors, vectors[10], 20, paper_codes=np.asarray([1]))
+    assert len(rows) == 20
+    assert (rows >= 200).all()
+
+
+def test_probing_continues_until_top_k_restricted_rows_are_found():
+    vectors = _unit_vectors(400)
+    index = _trained(vectors, nprobe=1)
+    rows, _ = index.search(vectors, vectors[0], 150, paper_codes=np.asarray([1]))
+    assert len(rows) == 150
+
+
+def test_removed_rows_are_not_returned():
+    vectors = _unit_vectors(400)
+    index = _trained(vectors)
+    index.remove(np.asarray([123]))
+    rows, _ = index.search(vectors, vectors[123], 5)
+    assert 123 not in rows
+    assert index.live_rows() == 399
+
+
+def test_rows_added_after_training_are_assigned():
+    vectors = _unit_vectors(500)
+    index = _trained(vectors[:400])
+    index.add(np.arange(400, 500), vectors[400:], 2)
+    rows, _ = index.search(vectors, vectors[450], 1, paper_codes=np.asarray([2]))
+    assert rows.tolist() == [450]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    vectors = _unit_vectors(400)
+    index = _trained(vectors)
+    path = str(tmp_path / "ivf.npz")
+    index.save(path)
+
+    loaded = IVFIndex(nprobe=2)
+    assert loaded.load(path)
+    loaded.set_papers(np.arange(200), 0)
+    loaded.set_papers(np.arange(200, 400), 1)
+    # Rows added after the save are unassigned until assign_missing.
+    loaded.set_papers(np.arange(400, 410), 1)
+    extended = np.concatenate([vectors, _unit_vectors(10, seed=1)])
+    assert loaded.assign_missing(extended) == 10
+    assert loaded.search(extended, extended[405], 1)[0].tolist() == [405]
+    codes = np.asarray([0])
+    for query in (5, 250):
+        expected = index.search(vectors, vectors[query], 3, codes)[0].tolist()
+        assert loaded.search(extended, vectors[query], 3, codes)[0].tolist() == expected
+
+    assert not IVFIndex().load(str(tmp_path / "missing.npz"))
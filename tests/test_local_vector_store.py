@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+
+from services.ivf_index import IVFIndex
+from services.local_vector_store import LocalVectorStore
+
+
+def _unit_vectors(count, dim=8, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _ids(results):
+    return [r["id"] for r in results]
+
+
+def test_query_is_restricted_to_requested_papers(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    a, b = _unit_vectors(3, seed=1), _unit_vectors(3, seed=2)
+    store.upsert("a", a.tolist())
+    store.upsert("b", b.tolist())
+
+    assert _ids(store.query(b[1].tolist(), ["b"], 1)) == ["b-1"]
+    assert set(_ids(store.query(b[1].tolist(), ["a"], 3))) == {"a-0", "a-1", "a-2"}
+    assert _ids(store.query(b[1].tolist(), [], 1)) == ["b-1"]
+    assert store.query(b[1].tolist(), ["missing"], 3) == []
+
+
+def test_upsert_of_existing_chunk_overwrites_its_row(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    vectors = _unit_vectors(2)
+    store.upsert("a", vectors.tolist())
+    store.upsert("a", [vectors[0].tolist()], start_index=1)
+    result = store.query(vectors[0].tolist(), ["a"], 2)
+    assert [r["score"] for r in result] == pytest.approx([1.0, 1.0])
+
+
+def test_partial_delete_keeps_leading_chunks_and_survives_reload(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    vectors = _unit_vectors(5)
+    store.upsert("a", vectors.tolist())
+    store.delete("a", 5, start_index=2)
+    assert sorted(_ids(store.query(vectors[0].tolist(), ["a"], 10))) == ["a-0", "a-1"]
+
+    reopened = LocalVectorStore(str(tmp_path))
+    assert sorted(_ids(reopened.query(vectors[0].tolist(), ["a"], 10))) == ["a-0", "a-1"]
+    reopened.delete("a")
+    assert reopened.query(vectors[0].tolist(), ["a"], 10) == []
+
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.upsert("a", _unit_vectors(1, dim=8).tolist())
+    with pytest.raises(ValueError):
+        store.upsert("b", _unit_vectors(1, dim=4).tolist())
+
+
+def _ann():
+    return IVFIndex(nlist=4, nprobe=4, train_min=50)
+
+
+def test_ivf_index_is_saved_and_reloaded(tmp_path):
+    store = LocalVectorStore(str(tmp_path), ann=_ann(), exact_max_rows=0)
+    vectors = _unit_vectors(80)
+    store.upsert("a", vectors[:60].tolist())
+    assert store.ann.trained
+    assert os.path.exists(tmp_path / "ivf.npz")
+    # Added after the save: assigned again, and saved, when the store is reopened.
+    store.upsert("b", vectors[60:].tolist())
+
+    reopened = LocalVectorStore(str(tmp_path), ann=_ann(), exact_max_rows=0)
+    assert reopened.ann.trained
+    np.testing.assert_array_equal(reopened.ann.centroids, store.ann.centroids)
+    assert _ids(reopened.query(vectors[70].tolist(), ["b"], 1)) == ["b-10"]
+
+    again = IVFIndex()
+    assert again.load(str(tmp_path / "ivf.npz"))
+    assert (again._assign[:80] >= 0).all()
+
+
+def test_untrained_index_is_trained_on_open(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    vectors = _unit_vectors(60)
+    store.upsert("a", vectors.tolist())
+
+    reopened = LocalVectorStore(str(tmp_path), ann=_ann(), exact_max_rows=0)
+    assert reopened.ann.trained
+    assert os.path.exists(tmp_path / "ivf.npz")
+    assert _ids(reopened.query(vectors[7].tolist(), ["a"], 1)) == ["a-7"]
+
+
+def test_close_saves_the_index(tmp_path):
+    store = LocalVectorStore(str(tmp_path), ann=_ann(), exact_max_rows=0)
+    store.upsert("a", _unit_vectors(60).tolist())
+    os.remove(tmp_path / "ivf.npz")
+    store.close()
+    assert os.path.exists(tmp_path / "ivf.npz")
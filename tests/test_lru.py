@@ -0,0 +1,61 @@
+import pytest
+
+from services import lru
+from services.lru import BytesLRU
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(lru.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_evicts_least_recently_used_past_the_byte_budget():
+    cache = BytesLRU(10, len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    assert cache.get("a") == "xxxx"  # "b" is now least recent
+    cache.put("c", "xxxx")
+    assert cache.get("b") is None
+    assert cache.get("a") == "xxxx" and cache.get("c") == "xxxx"
+    assert cache.stats() == {"entries": 2, "bytes": 8, "max_bytes": 10}
+
+
+def test_oversized_values_are_not_cached_and_replace_drops_old_value():
+    cache = BytesLRU(10, len)
+    cache.put("a", "xx")
+    cache.put("a", "x" * 11)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_replacing_a_key_updates_its_size():
+    cache = BytesLRU(10, len)
+    cache.put("a", "xxxxxx")
+    cache.put("a", "xx")
+    assert cache.stats()["bytes"] == 2
+    assert len(cache) == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = BytesLRU(100, len, ttl_seconds=5)
+    cache.put("a", "x")
+    clock[0] += 4.9
+    assert cache.get("a") == "x"
+    clock[0] += 0.1
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_pop_discard_where_and_clear():
+    cache = BytesLRU(100, len)
+    for key in [("p1", 0), ("p1", 1), ("p2", 0)]:
+        cache.put(key, "xx")
+    assert cache.pop(("p2", 0)) == "xx"
+    assert cache.pop(("p2", 0)) is None
+    assert cache.discard_where(lambda key: key[0] == "p1") == 2
+    assert len(cache) == 0
+    cache.put("a", "x")
+    cache.clear()
+    assert cache.stats()["bytes"] == 0 and cache.get("a") is None
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import config
+from ingestion import pipeline
+from ingestion.chunking import Chunk
+from services import embedding, storage, vector_search
+from services.local_vector_store import LocalVectorStore
+
+
+def _vectors(texts):
+    rng = np.random.default_rng(len(texts))
+    vectors = rng.normal(size=(len(texts), 8))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
+
+
+def _write_chunk_documents(paper_id, chunks, start_index, pages):
+    # BulkWriter needs a real client; write the same documents through a batch.
+    collection = storage.get_client().collection(config.CHUNKS_COLLECTION)
+    batch = storage.get_client().batch()
+    for idx, text in enumerate(chunks, start=start_index):
+        batch.set(collection.document(f"{paper_id}-{idx}"), {"paper_id": paper_id, "text": text})
+    batch.commit()
+
+
+@pytest.fixture
+def ingest_env(firestore_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "VECTOR_BACKEND", "local")
+    monkeypatch.setattr(vector_search, "_store", LocalVectorStore(str(tmp_path)))
+    monkeypatch.setattr(embedding, "embed_texts", _vectors)
+    monkeypatch.setattr(storage, "_persist_chunk_documents", _write_chunk_documents)
+    monkeypatch.setattr(pipeline, "_summarize", lambda chunks: "summary")
+    return firestore_db
+
+
+def _ingest(paper_id, count):
+    chunks = [Chunk(f"chunk {i} of {count}", 1, 1) for i in range(count)]
+    pipeline.index_chunks(paper_id, chunks)
+    pipeline.persist_paper(paper_id, chunks, f"hash-{count}")
+
+
+def test_shrinking_reingest_drops_leftover_chunks_and_vectors(ingest_env, tmp_path):
+    _ingest("paper", 5)
+    _ingest("other", 2)
+    _ingest("paper", 3)
+
+    chunk_docs = ingest_env.data[config.CHUNKS_COLLECTION]
+    assert sorted(doc for doc in chunk_docs if doc.startswith("paper-")) == [
+        "paper-0", "paper-1", "paper-2"
+    ]
+    assert storage.fetch_manifest("paper")["chunk_count"] == 3
+
+    for store in (vector_search.get_store(), LocalVectorStore(str(tmp_path))):
+        hits = store.query([1.0] * 8, ["paper"], top_k=10)
+        assert sorted(hit["id"] for hit in hits) == ["paper-0", "paper-1", "paper-2"]
+        assert len(store.query([1.0] * 8, ["other"], top_k=10)) == 2
+
+
+def test_growing_reingest_deletes_nothing(ingest_env, monkeypatch):
+    _ingest("paper", 2)
+    deleted = []
+    monkeypatch.setattr(storage, "delete_chunks", lambda *args: deleted.append(args))
+    _ingest("paper", 4)
+    assert deleted == []
+    assert len(vector_search.get_store().query([1.0] * 8, ["paper"], top_k=10)) == 4
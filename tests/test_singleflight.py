@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+import config
+from ingestion import singleflight
+from ingestion.singleflight import LeaderCancelled, SingleFlight
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_callers_share_one_run():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def scenario():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.run("p", work) for _ in range(5)))
+        return results, flights.in_flight()
+
+    results, in_flight = run(scenario())
+    assert results == ["done"] * 5
+    assert calls == [1]
+    assert in_flight == 0
+
+
+def test_leader_error_reaches_followers():
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("bad pdf")
+
+    async def scenario():
+        flights = SingleFlight()
+        return await asyncio.gather(*(flights.run("p", work) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in run(scenario()))
+
+
+def test_cancelled_leader_hands_work_to_a_follower():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def scenario():
+        flights = SingleFlight()
+        leader = asyncio.create_task(flights.run("p", work))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flights.run("p", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        return leader, results
+
+    leader, results = run(scenario())
+    assert leader.cancelled()
+    # One follower re-ran the work and the others shared its result.
+    assert len(calls) == 2
+    assert results == [2, 2, 2]
+
+
+def test_resolve_with_cancellation_is_retryable_for_followers():
+    async def scenario():
+        flights = SingleFlight()
+        _, flight = flights.claim("p")
+        flights.resolve("p", error=asyncio.CancelledError())
+        with pytest.raises(LeaderCancelled):
+            await flight
+        flights.resolve("p")  # already resolved: no-op
+
+    run(scenario())
+
+
+@pytest.fixture
+def leases(monkeypatch):
+    """Lease table with the storage calls replaced; returns the calls made."""
+    calls = []
+    holders = {}
+
+    def acquire(paper_id, owner, ttl_seconds):
+        calls.append(("acquire", paper_id))
+        if holders.get(paper_id, owner) != owner:
+            return False
+        holders[paper_id] = owner
+        return True
+
+    def release(paper_id, owner):
+        calls.append(("release", paper_id))
+        if holders.get(paper_id) == owner:
+            del holders[paper_id]
+
+    monkeypatch.setattr(config, "INGEST_LEASE_ENABLED", True)
+    monkeypatch.setattr(config, "INGEST_LEASE_TTL_SECONDS", 0.03)
+    monkeypatch.setattr(config, "INGEST_LEASE_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(singleflight.storage, "acquire_ingest_lease", acquire)
+    monkeypatch.setattr(singleflight.storage, "release_ingest_lease", release)
+    return calls, holders
+
+
+def test_lease_is_renewed_until_released(leases):
+    calls, holders = leases
+
+    async def scenario():
+        await singleflight.acquire_lease("p")
+        await asyncio.sleep(0.1)
+        await singleflight.release_lease("p")
+        renewals = calls.count(("acquire", "p"))
+        await asyncio.sleep(0.05)
+        return renewals
+
+    renewals = run(scenario())
+    assert renewals >= 3  # first acquire plus heartbeats every ttl/3
+    assert calls.count(("acquire", "p")) == renewals  # heartbeat stopped on release
+    assert calls[-1] == ("release", "p")
+    assert holders == {}
+    assert singleflight._heartbeats == {}
+
+
+def test_acquire_waits_for_other_holder(leases):
+    _, holders = leases
+    holders["p"] = "other-instance"
+
+    async def scenario():
+        waiter = asyncio.create_task(singleflight.acquire_lease("p"))
+        await asyncio.sleep(0.03)
+        assert not waiter.done()
+        del holders["p"]
+        await asyncio.wait_for(waiter, 1)
+        await singleflight.release_lease("p")
+
+    run(scenario())
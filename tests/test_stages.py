@@ -0,0 +1,76 @@
+import asyncio
+
+from ingestion.stages import Stage, run_stages
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_items_flow_through_every_stage():
+    async def double(x):
+        return x * 2
+
+    async def inc(x):
+        return x + 1
+
+    results = run(run_stages(range(5), [Stage("double", double, 2), Stage("inc", inc, 3)]))
+    assert sorted(results) == [1, 3, 5, 7, 9]
+
+
+def test_no_stages_returns_items():
+    assert run(run_stages([1, 2], [])) == [1, 2]
+
+
+def test_stage_concurrency_is_bounded():
+    running = 0
+    peak = 0
+
+    async def slow(x):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return x
+
+    results = run(run_stages(range(10), [Stage("slow", slow, 3)], queue_size=10))
+    assert sorted(results) == list(range(10))
+    assert peak == 3
+
+
+def test_stages_overlap():
+    events = []
+
+    async def first(x):
+        events.append(("first", x))
+        await asyncio.sleep(0.01)
+        return x
+
+    async def second(x):
+        events.append(("second", x))
+        return x
+
+    run(run_stages(range(3), [Stage("first", first), Stage("second", second)]))
+    # The second stage handles item 0 before the first stage reaches item 2.
+    assert events.index(("second", 0)) < events.index(("first", 2))
+
+
+def test_failures_and_drops_are_isolated_and_reach_on_exit():
+    exited = []
+
+    async def check(x):
+        if x == 1:
+            raise ValueError("bad")
+        if x == 2:
+            return None
+        return x
+
+    async def on_exit(item):
+        exited.append(item)
+        if item == 3:
+            raise RuntimeError("hook failed")
+
+    results = run(run_stages(range(5), [Stage("check", check), Stage("pass", check)], on_exit=on_exit))
+    assert sorted(results) == [0, 3, 4]
+    assert sorted(exited) == [0, 1, 2, 3, 4]
@@ -0,0 +1,43 @@
+import pytest
+
+from services import storage
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(storage.time, "perf_counter", lambda: now[0])
+    monkeypatch.setattr(
+        storage, "_write_stats", {"chunk_docs_written": 0, "chunk_write_failures": 0, "chunk_write_seconds": 0.0}
+    )
+    monkeypatch.setattr(storage, "_active_chunk_writes", 0)
+    return now
+
+
+def test_write_throughput_uses_wall_clock_for_overlapping_papers(clock):
+    storage._begin_chunk_write()
+    clock[0] += 1
+    storage._begin_chunk_write()
+    clock[0] += 1
+    storage._end_chunk_write(100, 0)
+    clock[0] += 1
+    storage._end_chunk_write(200, 1)
+
+    stats = storage.write_stats()
+    # Three seconds of wall-clock, not 3 + 2 seconds of summed per-paper time.
+    assert stats["chunk_write_seconds"] == 3.0
+    assert stats["chunk_docs_written"] == 300
+    assert stats["chunk_write_failures"] == 1
+    assert stats["chunk_docs_per_second"] == 100.0
+
+
+def test_idle_time_between_writes_is_not_counted(clock):
+    storage._begin_chunk_write()
+    clock[0] += 2
+    storage._end_chunk_write(100, 0)
+    clock[0] += 60
+    storage._begin_chunk_write()
+    clock[0] += 2
+    assert storage.write_stats()["chunk_write_seconds"] == 4.0  # includes the running write
+    storage._end_chunk_write(100, 0)
+    assert storage.write_stats()["chunk_docs_per_second"] == 50.0